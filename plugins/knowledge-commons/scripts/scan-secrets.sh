@@ -86,6 +86,11 @@ readonly PLACEHOLDER_WORD='your|my|some|insert|placeholder|example|changeme|chan
 #
 # Ordered most-specific first, which is the order labels appear in a finding when one
 # line carries more than one shape (see report()).
+#
+# scan_secrets.py reads its patterns from this file: every top-level add_pattern line
+# and the readonly PLACEHOLDER_*, ASSIGN_* and AUTH_* lines below, parsed with shell
+# quoting. Keep each of those on one line, quoted literally (no expansions), and an
+# edit here reaches both scanners; test-scan-secrets.sh runs against either.
 
 LABELS=()
 REGEXES=()
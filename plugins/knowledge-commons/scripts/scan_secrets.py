@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+scan_secrets.py — scan-secrets.sh's pattern set as one streaming, in-process matcher.
+
+scan-secrets.sh makes a grep pass per credential shape over a file that has already
+been written. This module compiles the same shapes into one combined expression and
+scans text as it is produced: feed() takes chunks of any size, and a line is scanned
+once its newline arrives, so a credential split across two chunks is still one
+match. Every line goes through the combined expression once; only the (rare) lines
+it hits are checked pattern by pattern, for their labels and for placeholder values.
+export-session.py runs it inside the export stream (--scan-secrets), so rendered
+material is read once instead of 1 + N times.
+
+Run as a script it is a drop-in for scan-secrets.sh, with the same report and exit
+codes, and test-scan-secrets.sh runs against it with SCAN=<this file>. The one
+difference is the order of findings: by line here, by pattern there.
+
+Usage:
+  scan_secrets.py <file> [<file>...]
+
+Exit codes:
+  0  clean — no credential shapes found
+  1  hits  — at least one finding, listed on stdout
+  2  the scan could not run (bad usage, unreadable file, bad pattern)
+
+There is one pattern set, and it lives in scan-secrets.sh: the scanner reads that
+file's add_pattern calls and readonly pattern variables from beside this one when it
+starts, and a scan-secrets.sh it cannot find or read exits 2. The patterns are POSIX
+ERE and are translated here. The translation is strict on purpose: an expression
+grep would reject (an unterminated interval, an unmatched bracket or parenthesis)
+raises ScanError, and a scan that cannot run exits 2. It must never quietly become
+a pattern that matches something else; see "Failing closed" in scan-secrets.sh.
+
+Requires Python 3.7+ (scoped inline flags).
+"""
+
+import re
+import shlex
+import sys
+from pathlib import Path
+
+EXIT_CLEAN = 0
+EXIT_HITS = 1
+EXIT_ERROR = 2
+
+READ_BYTES = 1024 * 1024
+
+
+class ScanError(Exception):
+    """The scan cannot run: a pattern failed to compile or input could not be read."""
+
+
+# --- patterns, read from scan-secrets.sh --------------------------------------------
+
+PATTERN_SOURCE = Path(__file__).resolve().with_name('scan-secrets.sh')
+# The readonly variables the scanner needs, besides the add_pattern table
+PATTERN_VARIABLES = ('PLACEHOLDER_LEAD', 'PLACEHOLDER_WORD', 'ASSIGN_LABEL', 'ASSIGN_RE',
+                     'AUTH_LABEL', 'AUTH_RE')
+
+
+def load_patterns(path=PATTERN_SOURCE):
+    """Read scan-secrets.sh's pattern set; return {'fixed': [(label, regex)], NAME: value}.
+
+    Only top-level `add_pattern "label" 'regex'` calls and `readonly NAME='value'`
+    assignments are read, with the shell's own quoting rules (shlex), so a value
+    spliced together from several quoted pieces reads as bash reads it.
+    """
+    try:
+        source = Path(path).read_text(encoding='utf-8')
+    except (OSError, UnicodeDecodeError) as e:
+        raise ScanError(f"cannot read patterns from {path} ({e})") from None
+    patterns = {'fixed': []}
+    for number, line in enumerate(source.splitlines(), 1):
+        if not (line.startswith('add_pattern ') or line.startswith('readonly ')):
+            continue
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError as e:
+            raise ScanError(f"{path}:{number}: cannot parse ({e})") from None
+        if words[0] == 'add_pattern':
+            if len(words) != 3:
+                raise ScanError(f"{path}:{number}: add_pattern takes a label and a regex")
+            patterns['fixed'].append((words[1], words[2]))
+            continue
+        name, _, value = words[1].partition('=') if len(words) == 2 else ('', '', '')
+        if name in PATTERN_VARIABLES:
+            patterns[name] = value
+    missing = [name for name in PATTERN_VARIABLES if name not in patterns]
+    if missing or not patterns['fixed']:
+        raise ScanError(f"{path} defines no {', '.join(missing) or 'add_pattern'}")
+    return patterns
+
+
+# --- POSIX ERE -> Python --------------------------------------------------------------
+
+# ASCII, as grep's C-locale classes are, less the newline: grep matches one line
+# at a time, while the scanner searches a block of lines, so no class may let a
+# match run on into the next line
+CHAR_CLASSES = {
+    'alnum': 'A-Za-z0-9', 'alpha': 'A-Za-z', 'blank': r' \t',
+    'cntrl': r'\x00-\x09\x0b-\x1f\x7f', 'digit': '0-9', 'graph': r'\x21-\x7e',
+    'lower': 'a-z', 'print': r'\x20-\x7e', 'punct': r'!-/:-@\[-`{-~',
+    'space': r' \t\r\f\v', 'upper': 'A-Z', 'xdigit': 'A-Fa-f0-9'
+}
+INTERVAL_RE = re.compile(r'\{(\d+)(,(\d*))?\}')
+
+
+def _bracket(ere, i):
+    """Translate the bracket expression starting at ere[i]; return (python, next index)."""
+    j = i + 1
+    negate = j < len(ere) and ere[j] == '^'
+    if negate:
+        j += 1
+    items = []
+    first = True
+    while True:
+        if j >= len(ere):
+            raise ScanError(f"unmatched [ in pattern: {ere}")
+        c = ere[j]
+        if c == ']' and not first:
+            break
+        if ere.startswith('[:', j):
+            end = ere.find(':]', j + 2)
+            name = ere[j + 2:end] if end != -1 else None
+            if name not in CHAR_CLASSES:
+                raise ScanError(f"bad character class in pattern: {ere}")
+            items.append(CHAR_CLASSES[name])
+            j = end + 2
+        elif ere.startswith('[.', j) or ere.startswith('[=', j):
+            raise ScanError(f"unsupported bracket element in pattern: {ere}")
+        elif c == '-' and not first and ere[j + 1:j + 2] != ']':
+            items.append('-')  # a range between its neighbours
+            j += 1
+        else:
+            # Inside brackets a backslash is literal; everything else stands for itself
+            items.append(re.escape(c) if c != '-' else r'\-')
+            j += 1
+        first = False
+    body = ''.join(items)
+    # A line never contains its newline; keep negated classes from matching one
+    return (f'[^{body}\\n]' if negate else f'[{body}]'), j + 1
+
+
+def ere_to_python(ere):
+    """Translate a POSIX extended regular expression into Python re syntax.
+
+    Raises ScanError for anything grep would refuse to compile, rather than
+    guessing what was meant.
+    """
+    out = []
+    depth = 0
+    i = 0
+    while i < len(ere):
+        c = ere[i]
+        if c == '[':
+            translated, i = _bracket(ere, i)
+            out.append(translated)
+            continue
+        if c == '\\':
+            if i + 1 >= len(ere):
+                raise ScanError(f"trailing backslash in pattern: {ere}")
+            out.append(re.escape(ere[i + 1]))
+            i += 2
+            continue
+        if c == '{':
+            interval = INTERVAL_RE.match(ere, i)
+            if interval is None or not out or out[-1] in ('(', '|'):
+                raise ScanError(f"invalid interval in pattern: {ere}")
+            low, high = interval.group(1), interval.group(3)
+            if high and int(high) < int(low):
+                raise ScanError(f"invalid interval in pattern: {ere}")
+            out.append(interval.group(0))
+            i = interval.end()
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth < 0:
+                raise ScanError(f"unmatched ) in pattern: {ere}")
+        elif c in '*+?' and (not out or out[-1] in ('(', '|')):
+            raise ScanError(f"repetition with nothing to repeat in pattern: {ere}")
+        if c in '()|^$.*+?':
+            out.append(c)
+        else:
+            out.append(re.escape(c))
+        i += 1
+    if depth:
+        raise ScanError(f"unmatched ( in pattern: {ere}")
+    translated = ''.join(out)
+    try:
+        re.compile(translated)
+    except re.error as e:
+        raise ScanError(f"pattern failed to compile ({e}): {ere}") from None
+    return translated
+
+
+def _atom_end(ere):
+    """Index just past the bracket expression or group that starts ere."""
+    if ere[0] == '[':
+        i = 2 if ere[1:2] != '^' else 3  # a leading ] belongs to the set
+        while ere[i] != ']':
+            i = ere.index(':]', i) + 2 if ere.startswith('[:', i) else i + 1
+        return i + 1
+    depth = 0
+    for i, c in enumerate(ere):
+        depth += {'(': 1, ')': -1}.get(c, 0)
+        if depth == 0:
+            return i + 1
+
+
+def anchored_ere(ere):
+    """Drop the leading atoms that keep a pattern from starting at a literal.
+
+    What is left matches a suffix of every match of the whole pattern, so it
+    finds every line the pattern does, and the regex engine can reject most
+    positions on its first character. A leading [A-Za-z0-9_.-]* otherwise
+    rescans each word from every position in it. A bracket expression right
+    before a literal ([sr]k_) is kept; it is selective enough on its own.
+    """
+    while ere[:1] == '[' or ere[:2] in ('(^', '(['):
+        end = _atom_end(ere)
+        interval = INTERVAL_RE.match(ere, end)
+        if interval:
+            stop = interval.end()
+        elif ere[end:end + 1] in ('*', '+', '?'):
+            stop = end + 1
+        elif ere[0] == '[' and ere[end:end + 1] not in ('[', '('):
+            break
+        else:
+            stop = end
+        ere = ere[stop:]
+    return ere
+
+
+def split_final_group(ere):
+    """Split a pattern ending in a group into (what precedes it, the group's alternatives)."""
+    depth = 0
+    start = closed = None
+    bars = []
+    i = 0
+    while i < len(ere):
+        c = ere[i]
+        if c == '[':
+            i += _atom_end(ere[i:])
+            continue
+        if c == '\\':
+            i += 2
+            continue
+        if c == '(':
+            if depth == 0:
+                start, bars = i, []
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                closed = i
+        elif c == '|' and depth == 1:
+            bars.append(i)
+        i += 1
+    if start is None or closed != len(ere) - 1:
+        raise ScanError(f"pattern does not end in a group of value shapes: {ere}")
+    edges = [start] + bars + [closed]
+    return ere[:start], [ere[a + 1:b] for a, b in zip(edges, edges[1:])]
+
+
+# --- scan --------------------------------------------------------------------------
+
+def _value_of(assignment):
+    """extract_value: drop the name and separator, then leading space and one quote each side."""
+    value = re.split(r'[:=]', assignment, maxsplit=1)[1].lstrip(' \t\n\r\f\v')
+    if value[:1] in ('"', "'"):
+        value = value[1:]
+    if value[-1:] in ('"', "'"):
+        value = value[:-1]
+    return value
+
+
+class SecretScanner:
+    """Scan a text stream for scan-secrets.sh's credential shapes, one line at a time.
+
+    feed() any number of chunks, then finish(). Findings are kept one per
+    line, carrying every label found on it, as [line number, labels, text].
+    """
+
+    def __init__(self, patterns=None):
+        patterns = patterns or load_patterns()
+        self.fixed = [(label, re.compile(ere_to_python(regex))) for label, regex in patterns['fixed']]
+        assign_re, auth_re = patterns['ASSIGN_RE'], patterns['AUTH_RE']
+        self.assign_label, self.auth_label = patterns['ASSIGN_LABEL'], patterns['AUTH_LABEL']
+        self.assign = re.compile(ere_to_python(assign_re), re.IGNORECASE)
+        # grep takes the longest match where Python takes the first alternative
+        # that fits, so each value shape is tried on its own (see assignments)
+        name_re, value_res = split_final_group(assign_re)
+        self.assign_values = [re.compile(ere_to_python(f"{name_re}({value})"), re.IGNORECASE)
+                              for value in value_res]
+        self.auth = re.compile(ere_to_python(auth_re), re.IGNORECASE)
+        self.auth_value = re.compile(ere_to_python(r'(bearer|basic|token)[[:space:]]+(.*)'),
+                                     re.IGNORECASE)
+        self.placeholder_lead = re.compile(f"({ere_to_python(patterns['PLACEHOLDER_LEAD'])})",
+                                           re.IGNORECASE)
+        self.placeholder_word = re.compile(
+            f"({ere_to_python(patterns['PLACEHOLDER_WORD'])})([^A-Za-z0-9]|$)", re.IGNORECASE)
+        # One expression that matches every line some shape matches: each line is
+        # searched once, and only hit lines are checked shape by shape
+        anchored = [ere_to_python(anchored_ere(regex)) for _, regex in patterns['fixed']]
+        self.combined = re.compile(
+            '|'.join(f'(?:{regex})' for regex in anchored)
+            + f'|(?i:{ere_to_python(anchored_ere(assign_re))})'
+            + f'|(?i:{ere_to_python(anchored_ere(auth_re))})')
+        self.pending = b''
+        self.line = 0
+        self.findings = []
+
+    def feed(self, data):
+        """Scan the complete lines in data; hold back a trailing partial line."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        cut = data.rfind(b'\n')
+        if cut == -1:
+            self.pending += data
+            return
+        block = self.pending + data[:cut]
+        self.pending = data[cut + 1:]
+        self._scan_block(block.decode('utf-8', 'replace'))
+        self.line += 1  # the line the newline at `cut` ended
+
+    def finish(self):
+        """Scan the last line, if it had no newline."""
+        if self.pending:
+            self._scan_block(self.pending.decode('utf-8', 'replace'))
+            self.pending = b''
+
+    def _scan_block(self, text):
+        """Scan newline-separated lines; self.line is the number of the block's first line, less one."""
+        base = self.line
+        position = 0
+        counted = 0
+        last = None
+        for match in self.combined.finditer(text):
+            start = text.rfind('\n', 0, match.start()) + 1
+            if start == last:
+                continue
+            last = start
+            counted += text.count('\n', position, start)
+            position = start
+            end = text.find('\n', start)
+            line = text[start:] if end == -1 else text[start:end]
+            labels = self.labels(line)
+            if labels:
+                self.findings.append([base + counted + 1, labels, line])
+        self.line = base + text.count('\n')
+
+    def labels(self, line):
+        """Every shape on one line, in pattern order."""
+        labels = [label for label, regex in self.fixed if regex.search(line)]
+        # EVERY assignment on the line, not just the first (see scan-secrets.sh)
+        for assignment in self.assignments(line):
+            value = _value_of(assignment)
+            if value and not self.is_placeholder(value) and len(value) >= 8:
+                labels.append(self.assign_label)
+                break
+        for match in self.auth.finditer(line):
+            found = self.auth_value.search(match.group(0))
+            value = found.group(2) if found else ''
+            if value[:1] in ('"', "'"):
+                value = value[1:]
+            if value and not self.is_placeholder(value):
+                labels.append(self.auth_label)
+                break
+        return labels
+
+    def assignments(self, line):
+        """The credential assignments on a line, as `grep -o` finds them.
+
+        POSIX matching is leftmost-longest: at the leftmost place an
+        assignment starts, the longest value shape wins, so `"secret":` is
+        taken whole rather than as the quoted `"secret"`.
+        """
+        position = 0
+        while True:
+            match = self.assign.search(line, position)
+            if match is None:
+                return
+            start = match.start()
+            end = max(found.end() for found in
+                      (regex.match(line, start) for regex in self.assign_values) if found)
+            yield line[start:end]
+            position = end if end > start else end + 1
+
+    def is_placeholder(self, value):
+        return bool(self.placeholder_lead.match(value) or self.placeholder_word.match(value))
+
+
+def format_report(findings):
+    """scan-secrets.sh's report for (location, labels, text) findings; empty if clean."""
+    if not findings:
+        return ["", "scan-secrets: clean — no credential shapes found."]
+    lines = []
+    for number, (location, labels, text) in enumerate(findings, 1):
+        lines.extend(["", f"[{number}] {'; '.join(labels)}", f"    {location}", f"    > {text[:200]}"])
+    lines.extend(["", f"scan-secrets: {len(findings)} finding(s). Resolve each one individually "
+                      "— redact, withhold, or accept as a false positive — before anything is "
+                      "archived."])
+    return lines
+
+
+def scan_file(path, scanner=None):
+    """Scan one file in fixed-size reads; return its findings as (location, labels, text)."""
+    scanner = scanner or SecretScanner()
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(READ_BYTES)
+                if not data:
+                    break
+                scanner.feed(data)
+    except OSError as e:
+        raise ScanError(f"cannot read: {path} ({e})") from None
+    scanner.finish()
+    return [(f"{path}:{line}", labels, text) for line, labels, text in scanner.findings]
+
+
+def die(message):
+    print(f"scan-secrets: {message}", file=sys.stderr)
+    sys.exit(EXIT_ERROR)
+
+
+def main(paths):
+    if not paths:
+        print("usage: scan_secrets.py <file> [<file>...]", file=sys.stderr)
+        sys.exit(EXIT_ERROR)
+    for path in paths:
+        p = Path(path)
+        if not p.exists():
+            die(f"no such file: {path}")
+        if not p.is_file():
+            die(f"not a regular file: {path}")
+
+    try:
+        SecretScanner()  # compile once up front: a bad pattern fails before any output
+        print(f"scan-secrets: scanning {len(paths)} file(s)")
+        findings = []
+        for path in paths:
+            findings.extend(scan_file(path))
+    except ScanError as e:
+        die(str(e))
+
+    print('\n'.join(format_report(findings)))
+    sys.exit(EXIT_HITS if findings else EXIT_CLEAN)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
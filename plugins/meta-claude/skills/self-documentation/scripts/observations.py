@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
-"""Minimal script for atomic observation storage operations."""
+"""Minimal script for atomic observation storage operations.
+
+Storage is a JSON snapshot plus an append-only log of add/remove records;
+see read_store() and save_observations(). Every read-modify-write holds an
+exclusive lock on a lock file beside the store, so concurrent sessions
+serialize instead of overwriting each other.
+"""
 
 import argparse
+import contextlib
 import json
 import os
+import sqlite3
 import sys
 from datetime import date
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 
 def get_storage_path():
     """Resolve XDG-compliant storage path."""
@@ -15,85 +29,485 @@ def get_storage_path():
     return Path(xdg_data) / "claude-plugins" / "self-documentation" / "observations.json"
 
 
+FEATURE_AREAS = ["tools", "skills", "agents", "mcp", "config", "other"]
+
+
 STORAGE_PATH = get_storage_path()
 
+# Writes append one record to a log beside the snapshot; the log is folded
+# back into the snapshot (compacted) once it outgrows it or is mostly garbage.
+LOG_PATH = STORAGE_PATH.with_suffix(".log")
+LOCK_PATH = STORAGE_PATH.with_suffix(".lock")
+# Today's date and the next observation number, so add needn't scan the store
+COUNTER_PATH = STORAGE_PATH.with_name("observations.counter.json")
+# Query index over the store, brought up to date from the log before each lookup
+INDEX_PATH = STORAGE_PATH.with_name("observations.index.db")
+STORAGE_VERSION = 2
 
-def load_observations():
-    """Load observations, returning empty structure if file doesn't exist."""
+COMPACT_MIN_LOG_BYTES = 64 * 1024
+COMPACT_MIN_GARBAGE = 16
+
+
+@contextlib.contextmanager
+def store_lock(exclusive=True):
+    """Hold the store lock: exclusive for writers, shared for readers.
+
+    Readers lock too, since a compaction between reading the snapshot and
+    reading the log would otherwise hide the log's records from them.
+    """
+    STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # no shared locks; always exclusive
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def write_atomic(path, text):
+    """Atomic write via temp file + rename."""
+    # Create temp file with restricted permissions from the start (no race condition)
+    temp_path = path.parent / f".tmp_{os.getpid()}_{path.name}"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:  # fdopen takes ownership of fd, handles close
+            f.write(text)
+        os.rename(temp_path, path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def empty_store():
+    return {"version": STORAGE_VERSION, "observations": [], "last_updated": None}
+
+
+def load_snapshot():
+    """Load the snapshot; version 1 files (no log) are read as-is."""
     if not STORAGE_PATH.exists():
-        return {"version": 1, "observations": [], "last_updated": None}
+        return empty_store()
     try:
         return json.loads(STORAGE_PATH.read_text())
     except json.JSONDecodeError:
         print("⚠ Warning: Corrupted storage file. Starting fresh.", file=sys.stderr)
-        return {"version": 1, "observations": [], "last_updated": None}
+        return empty_store()
+
+
+def read_store():
+    """Replay the log over the snapshot.
+
+    Returns (data, garbage), where garbage counts stored records that no
+    longer describe a live observation. Replay is idempotent (adds are keyed
+    by ID), so a log left behind by an interrupted compaction is harmless.
+    """
+    data = load_snapshot()
+    observations = {o["id"]: o for o in data["observations"]}
+    records = len(observations)
+
+    if LOG_PATH.exists():
+        with open(LOG_PATH) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted append
+                    print("⚠ Warning: Skipping unreadable log record.", file=sys.stderr)
+                    continue
+                records += 1
+                if record["op"] == "add":
+                    observations[record["observation"]["id"]] = record["observation"]
+                elif record["op"] == "remove":
+                    observations.pop(record["id"], None)
+                data["last_updated"] = record.get("at", data["last_updated"])
+
+    data["version"] = STORAGE_VERSION
+    data["observations"] = list(observations.values())
+    return data, records - len(observations)
+
+
+def load_observations():
+    """Load observations, returning empty structure if nothing is stored."""
+    return read_store()[0]
 
 
 def save_observations(data):
-    """Atomic save via temp file + rename."""
+    """Atomic snapshot save; the snapshot then supersedes the log.
+
+    Call with the store lock held.
+    """
     STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    data["version"] = STORAGE_VERSION
     data["last_updated"] = date.today().isoformat()
+    write_atomic(STORAGE_PATH, json.dumps(data, indent=2))
+    LOG_PATH.unlink(missing_ok=True)
 
-    # Create temp file with restricted permissions from the start (no race condition)
-    temp_path = STORAGE_PATH.parent / f".tmp_{os.getpid()}.json"
-    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+
+def append_records(records):
+    """Append records to the log: O(records) regardless of store size."""
+    STORAGE_PATH.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    today = date.today().isoformat()
+    lines = "".join(json.dumps({**record, "at": today}) + "\n" for record in records)
+    data = lines.encode("utf-8")
+    fd = os.open(LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
     try:
-        with os.fdopen(fd, 'w') as f:  # fdopen takes ownership of fd, handles close
-            json.dump(data, f, indent=2)
-        os.rename(temp_path, STORAGE_PATH)
-    except Exception:
-        temp_path.unlink(missing_ok=True)
-        raise
+        while data:  # one write in practice, so the records land whole
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def append_record(record):
+    append_records([record])
+
+
+def needs_compaction(live=None, garbage=0):
+    """Whether the log has outgrown the snapshot or garbage outweighs live records.
+
+    Without a live count (callers that never read the store) only sizes are checked.
+    """
+    try:
+        log_size = LOG_PATH.stat().st_size
+    except FileNotFoundError:
+        return False
+    snapshot_size = STORAGE_PATH.stat().st_size if STORAGE_PATH.exists() else 0
+    if log_size >= max(COMPACT_MIN_LOG_BYTES, snapshot_size):
+        return True
+    return live is not None and garbage >= COMPACT_MIN_GARBAGE and garbage > live
 
 
 def generate_id(observations):
-    """Generate next observation ID for today."""
+    """Generate next observation ID for today by scanning the store."""
     today = date.today().strftime("%Y%m%d")
-    existing = [o["id"] for o in observations if o["id"].startswith(f"obs-{today}")]
-    next_num = len(existing) + 1
+    # Highest number, not a count: a count reuses IDs once one has been removed,
+    # and replay keys observations by ID
+    existing = [int(o["id"].rsplit("-", 1)[1]) for o in observations
+                if o["id"].startswith(f"obs-{today}-")]
+    next_num = max(existing, default=0) + 1
     return f"obs-{today}-{next_num:03d}"
 
 
+def allocate_ids(count=1):
+    """Take the next IDs from the persisted per-day counter.
+
+    The store is scanned only to seed the counter when it is missing or from
+    another day. Call with the store lock held.
+    """
+    today = date.today().strftime("%Y%m%d")
+    try:
+        counter = json.loads(COUNTER_PATH.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        counter = None
+    if counter is None or counter.get("day") != today:
+        obs_id = generate_id(load_observations()["observations"])
+        next_num = int(obs_id.rsplit("-", 1)[1])
+    else:
+        next_num = counter["next"]
+    write_atomic(COUNTER_PATH, json.dumps({"day": today, "next": next_num + count}))
+    return [f"obs-{today}-{num:03d}" for num in range(next_num, next_num + count)]
+
+
+def connect_index():
+    """Open (creating if needed) the query index.
+
+    The full-text table needs FTS5; without it the index still serves get,
+    remove and query, and --match falls back to substring tests.
+    """
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if not INDEX_PATH.exists():
+        # Create with restricted permissions from the start, like the store
+        os.close(os.open(INDEX_PATH, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(INDEX_PATH, isolation_level=None)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS observations (
+            seq INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            feature_area TEXT,
+            status TEXT,
+            discovered TEXT,
+            description TEXT,
+            context TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS observations_feature_area ON observations(feature_area);
+        CREATE INDEX IF NOT EXISTS observations_status ON observations(status);
+        CREATE INDEX IF NOT EXISTS observations_discovered ON observations(discovered);
+        """)
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS observations_text "
+                     "USING fts5(description, context)")
+    except sqlite3.OperationalError:
+        pass  # no FTS5 in this sqlite3 build
+    return conn
+
+
+def has_text_index(conn):
+    """Whether the full-text table exists and this sqlite3 build can use it."""
+    try:
+        conn.execute("SELECT 1 FROM observations_text LIMIT 0")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def _file_signature(path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _index_upsert(conn, obs, text=True):
+    row = conn.execute("SELECT seq FROM observations WHERE id = ?", (obs["id"],)).fetchone()
+    values = (obs.get("feature_area"), obs.get("status"), obs.get("discovered"),
+              obs.get("description", ""), obs.get("context", ""), json.dumps(obs))
+    if row is None:
+        seq = conn.execute("""
+            INSERT INTO observations (id, feature_area, status, discovered, description,
+                context, data) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (obs["id"],) + values).lastrowid
+    else:
+        # Same position as before, as replay keeps it
+        seq = row[0]
+        conn.execute("""
+            UPDATE observations SET feature_area = ?, status = ?, discovered = ?,
+                description = ?, context = ?, data = ? WHERE seq = ?
+        """, values + (seq,))
+        if text:
+            conn.execute("DELETE FROM observations_text WHERE rowid = ?", (seq,))
+    if text:
+        conn.execute("INSERT INTO observations_text (rowid, description, context) VALUES (?, ?, ?)",
+                     (seq, values[3], values[4]))
+
+
+def _index_remove(conn, obs_id, text=True):
+    row = conn.execute("SELECT seq FROM observations WHERE id = ?", (obs_id,)).fetchone()
+    if row is not None:
+        conn.execute("DELETE FROM observations WHERE seq = ?", row)
+        if text:
+            conn.execute("DELETE FROM observations_text WHERE rowid = ?", row)
+
+
+def sync_index(conn):
+    """Apply log records appended since the last sync; rebuild after a compaction.
+
+    Call with the store lock held (shared is enough), so the log cannot be
+    compacted away mid-read.
+    """
+    conn.execute("BEGIN IMMEDIATE")  # concurrent readers sync one at a time
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        snapshot = _file_signature(STORAGE_PATH)
+        log_inode = str(LOG_PATH.stat().st_ino) if LOG_PATH.exists() else None
+        offset = int(meta.get("log_offset", 0))
+        # Stored records, live or not, as read_store() counts them for compaction
+        records = int(meta.get("records", 0))
+        # A full-text table last synced by a build without FTS5 is stale
+        text = has_text_index(conn)
+
+        if (meta.get("snapshot") != str(snapshot) or meta.get("log_inode") != str(log_inode)
+                or meta.get("text") != str(text)
+                or "records" not in meta):  # indexes from before the count was kept
+            conn.execute("DELETE FROM observations")
+            if text:
+                conn.execute("DELETE FROM observations_text")
+            observations = load_snapshot()["observations"]
+            for obs in observations:
+                _index_upsert(conn, obs, text)
+            offset = 0
+            records = len(observations)
+
+        if log_inode is not None:
+            with open(LOG_PATH, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    records += 1
+                    if record["op"] == "add":
+                        _index_upsert(conn, record["observation"], text)
+                    elif record["op"] == "remove":
+                        _index_remove(conn, record["id"], text)
+
+        conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            ("snapshot", str(snapshot)), ("log_inode", str(log_inode)), ("log_offset", str(offset)),
+            ("records", str(records)), ("text", str(text))])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _like_pattern(text):
+    """A LIKE pattern matching text anywhere, with its wildcards escaped."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def query_observations(conn, feature_area=None, status=None, since=None, until=None,
+                       match=None, contains=None, limit=None, offset=0):
+    """Return observations matching every given filter, in store order.
+
+    match requires every whitespace-separated token to appear in the
+    description or context (full-text index, or a substring test on builds
+    without FTS5); contains is a case-insensitive substring test on either
+    field.
+    """
+    clauses = []
+    params = []
+    if feature_area:
+        clauses.append("feature_area = ?")
+        params.append(feature_area)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if since:
+        clauses.append("discovered >= ?")
+        params.append(since)
+    if until:
+        clauses.append("discovered <= ?")
+        params.append(until)
+    if match and has_text_index(conn):
+        tokens = ['"' + token.replace('"', '""') + '"' for token in match.split()]
+        clauses.append("seq IN (SELECT rowid FROM observations_text WHERE observations_text MATCH ?)")
+        params.append(" AND ".join(tokens))
+    elif match:
+        for token in match.split():
+            clauses.append("(description LIKE ? ESCAPE '\\' OR context LIKE ? ESCAPE '\\')")
+            params.extend([_like_pattern(token)] * 2)
+    if contains:
+        clauses.append("(description LIKE ? ESCAPE '\\' OR context LIKE ? ESCAPE '\\')")
+        params.extend([_like_pattern(contains)] * 2)
+
+    sql = "SELECT data FROM observations"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY seq LIMIT ? OFFSET ?"
+    params.extend([limit if limit is not None else -1, offset])
+    for (data,) in conn.execute(sql, params):
+        yield json.loads(data)
+
+
+def new_observation(obs_id, description, feature_area, context=None, issue_url=None,
+                    discovered=None):
+    return {
+        "id": obs_id,
+        "description": description,
+        "feature_area": feature_area,
+        "context": context or "",
+        "discovered": discovered or date.today().isoformat(),
+        "status": "submitted" if issue_url else "new",
+        "issue_url": issue_url or None
+    }
+
+
 def cmd_list(args):
-    data = load_observations()
+    with store_lock(exclusive=False):
+        data = load_observations()
     print(json.dumps(data["observations"], indent=2))
 
 
 def cmd_add(args):
-    data = load_observations()
-    obs = {
-        "id": generate_id(data["observations"]),
-        "description": args.description,
-        "feature_area": args.feature_area,
-        "context": args.context or "",
-        "discovered": date.today().isoformat(),
-        "status": "submitted" if args.issue_url else "new",
-        "issue_url": args.issue_url or None
-    }
-    data["observations"].append(obs)
-    save_observations(data)
+    with store_lock():
+        obs = new_observation(allocate_ids()[0], args.description, args.feature_area,
+                              args.context, args.issue_url)
+        append_record({"op": "add", "observation": obs})
+        if needs_compaction():
+            save_observations(load_observations())
     print(json.dumps(obs, indent=2))
 
 
 def cmd_remove(args):
-    data = load_observations()
-    original_len = len(data["observations"])
-    data["observations"] = [o for o in data["observations"] if o["id"] != args.id]
-    if len(data["observations"]) == original_len:
-        print(f"✗ Observation {args.id} not found", file=sys.stderr)
-        sys.exit(1)
-    save_observations(data)
+    conn = connect_index()
+    with store_lock():
+        # The index answers "does it exist" from the log appended since its last
+        # sync, so a remove costs the same however large the store is
+        sync_index(conn)
+        if conn.execute("SELECT 1 FROM observations WHERE id = ?", (args.id,)).fetchone() is None:
+            print(f"✗ Observation {args.id} not found", file=sys.stderr)
+            sys.exit(1)
+        append_record({"op": "remove", "id": args.id})
+        live = conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0] - 1
+        records = int(conn.execute("SELECT value FROM meta WHERE key = 'records'").fetchone()[0])
+        # The remove record is stored too, and garbage like the add it cancels
+        if needs_compaction(live, records + 1 - live):
+            save_observations(load_observations())
     print(f"✓ Removed {args.id}")
 
 
 def cmd_get(args):
-    data = load_observations()
-    for obs in data["observations"]:
-        if obs["id"] == args.id:
-            print(json.dumps(obs, indent=2))
-            return
-    print(f"✗ Observation {args.id} not found", file=sys.stderr)
-    sys.exit(1)
+    conn = connect_index()
+    with store_lock(exclusive=False):
+        sync_index(conn)
+    row = conn.execute("SELECT data FROM observations WHERE id = ?", (args.id,)).fetchone()
+    if row is None:
+        print(f"✗ Observation {args.id} not found", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(json.loads(row[0]), indent=2))
+
+
+def cmd_query(args):
+    conn = connect_index()
+    with store_lock(exclusive=False):
+        sync_index(conn)
+    for obs in query_observations(conn, args.feature_area, args.status, args.since, args.until,
+                                  args.match, args.contains, args.limit, args.offset):
+        print(json.dumps(obs))
+
+
+def cmd_import(args):
+    """Add many observations from JSON Lines on stdin, all or nothing."""
+    items = []
+    for line_number, line in enumerate(sys.stdin, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"✗ Error: Invalid JSON on line {line_number}: {e}", file=sys.stderr)
+            sys.exit(1)
+        if not isinstance(item, dict) or not item.get("description"):
+            print(f"✗ Error: Line {line_number} has no description", file=sys.stderr)
+            sys.exit(1)
+        if item.get("feature_area") not in FEATURE_AREAS:
+            print(f"✗ Error: Line {line_number} has feature_area {item.get('feature_area')!r}; "
+                  f"expected one of {', '.join(FEATURE_AREAS)}", file=sys.stderr)
+            sys.exit(1)
+        discovered = item.get("discovered")
+        if discovered is not None:
+            # add always stores today's ISO date; an import must store a date too,
+            # or --since/--until compare it as text and misorder it
+            try:
+                item["discovered"] = date.fromisoformat(discovered).isoformat()
+            except (TypeError, ValueError):
+                print(f"✗ Error: Line {line_number} has discovered {discovered!r}; "
+                      f"expected a YYYY-MM-DD date", file=sys.stderr)
+                sys.exit(1)
+        items.append(item)
+
+    if not items:
+        print("✓ Imported 0 observations")
+        return
+
+    # One lock, one counter update and one log append for the whole batch
+    with store_lock():
+        ids = allocate_ids(len(items))
+        observations = [
+            new_observation(obs_id, item["description"], item["feature_area"],
+                            item.get("context"), item.get("issue_url"), item.get("discovered"))
+            for obs_id, item in zip(ids, items)]
+        append_records([{"op": "add", "observation": obs} for obs in observations])
+        if needs_compaction():
+            save_observations(load_observations())
+    print(f"✓ Imported {len(observations)} observations ({ids[0]} to {ids[-1]})")
 
 
 if __name__ == "__main__":
@@ -107,8 +521,7 @@ if __name__ == "__main__":
     add_p = subparsers.add_parser("add", help="Add a new observation")
     add_p.add_argument("--description", required=True, help="Description of the observed behavior")
     add_p.add_argument("--feature-area", required=True,
-                       choices=["tools", "skills", "agents", "mcp", "config", "other"],
-                       help="Feature area category")
+                       choices=FEATURE_AREAS, help="Feature area category")
     add_p.add_argument("--context", help="Context of how it was discovered")
     add_p.add_argument("--issue-url", help="GitHub issue URL if submitted")
 
@@ -118,5 +531,20 @@ if __name__ == "__main__":
     get_p = subparsers.add_parser("get", help="Get a single observation by ID")
     get_p.add_argument("id", help="Observation ID to retrieve")
 
+    query_p = subparsers.add_parser("query", help="Find observations (JSON Lines, store order)")
+    query_p.add_argument("--feature-area", choices=FEATURE_AREAS, help="Feature area category")
+    query_p.add_argument("--status", choices=["new", "submitted"], help="Observation status")
+    query_p.add_argument("--since", help="Discovered on or after this date (YYYY-MM-DD)")
+    query_p.add_argument("--until", help="Discovered on or before this date (YYYY-MM-DD)")
+    query_p.add_argument("--match", help="Words that must all appear in description or context")
+    query_p.add_argument("--contains", help="Substring of description or context (case-insensitive)")
+    query_p.add_argument("--limit", type=int, help="Maximum results")
+    query_p.add_argument("--offset", type=int, default=0, help="Results to skip (default: 0)")
+
+    subparsers.add_parser("import", help="Add observations from JSON Lines on stdin "
+                                         "(description, feature_area, optional context, "
+                                         "issue_url, discovered)")
+
     args = parser.parse_args()
-    {"list": cmd_list, "add": cmd_add, "remove": cmd_remove, "get": cmd_get}[args.command](args)
+    {"list": cmd_list, "add": cmd_add, "remove": cmd_remove, "get": cmd_get,
+     "query": cmd_query, "import": cmd_import}[args.command](args)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Tests for the observation store (observations.py).
+
+Run from this directory:
+
+    python3 -m unittest test_observations
+
+Each test points XDG_DATA_HOME at a temp directory and reloads the module,
+whose storage paths are resolved at import time.
+"""
+
+import importlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import observations  # noqa: E402
+
+
+class StoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.env = {**os.environ, "XDG_DATA_HOME": temp.name}
+        patcher = mock.patch.dict(os.environ, {"XDG_DATA_HOME": temp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = importlib.reload(observations)
+
+    def run_cli(self, *args, stdin=""):
+        return subprocess.run([sys.executable, str(SCRIPTS_DIR / "observations.py"), *args],
+                              input=stdin, capture_output=True, text=True, env=self.env)
+
+    def add(self, description, feature_area="tools"):
+        result = self.run_cli("add", "--description", description, "--feature-area", feature_area)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout)["id"]
+
+    def ids(self):
+        return [o["id"] for o in self.store.load_observations()["observations"]]
+
+
+class LogTest(StoreTestCase):
+
+    def test_writes_append_to_the_log_and_reads_replay_it(self):
+        first, second = self.add("one"), self.add("two")
+        self.assertEqual(self.run_cli("remove", first).returncode, 0)
+        records = [json.loads(line) for line in self.store.LOG_PATH.read_text().splitlines()]
+        self.assertEqual([record["op"] for record in records], ["add", "add", "remove"])
+        self.assertFalse(self.store.STORAGE_PATH.exists())
+        self.assertEqual(self.ids(), [second])
+        listed = json.loads(self.run_cli("list").stdout)
+        self.assertEqual([obs["id"] for obs in listed], [second])
+
+    def test_version_1_snapshot_is_read_as_is(self):
+        old = {"id": "obs-20250101-001", "description": "old", "feature_area": "tools",
+               "context": "", "discovered": "2025-01-01", "status": "new", "issue_url": None}
+        self.store.STORAGE_PATH.parent.mkdir(parents=True)
+        self.store.STORAGE_PATH.write_text(json.dumps(
+            {"version": 1, "observations": [old], "last_updated": "2025-01-01"}))
+        new = self.add("new")
+        data = self.store.load_observations()
+        self.assertEqual(data["version"], 2)
+        self.assertEqual(self.ids(), [old["id"], new])
+
+    def test_log_left_by_an_interrupted_compaction_is_harmless(self):
+        first, second = self.add("one"), self.add("two")
+        log = self.store.LOG_PATH.read_text()
+        self.store.save_observations(self.store.load_observations())
+        # Compaction renamed the new snapshot into place but never removed the log
+        self.store.LOG_PATH.write_text(log)
+        self.assertEqual(self.ids(), [first, second])
+
+
+class ConcurrencyTest(StoreTestCase):
+
+    def test_parallel_adds_get_distinct_ids_and_all_land(self):
+        script = str(SCRIPTS_DIR / "observations.py")
+        processes = [subprocess.Popen([sys.executable, script, "add", "--description", f"note {n}",
+                                       "--feature-area", "tools"],
+                                      stdout=subprocess.PIPE, env=self.env)
+                     for n in range(8)]
+        ids = [json.loads(process.communicate()[0])["id"] for process in processes]
+        self.assertEqual(len(set(ids)), 8)
+        self.assertEqual(sorted(self.ids()), sorted(ids))
+
+    def test_ids_continue_after_a_removal(self):
+        first, second = self.add("one"), self.add("two")
+        self.assertEqual(self.run_cli("remove", second).returncode, 0)
+        third = self.add("three")
+        self.assertNotIn(third, (first, second))
+
+    def test_missing_counter_is_seeded_from_the_store(self):
+        first = self.add("one")
+        self.store.COUNTER_PATH.unlink()
+        second = self.add("two")
+        self.assertGreater(second, first)
+        self.assertEqual(self.ids(), [first, second])
+
+
+class RemoveTest(StoreTestCase):
+
+    def test_remove_appends_a_tombstone_without_reading_the_store(self):
+        first, second = self.add("one"), self.add("two")
+        with mock.patch.object(self.store, "read_store", side_effect=AssertionError("read_store")):
+            with mock.patch.object(sys, "stdout", io.StringIO()):
+                self.store.cmd_remove(SimpleNamespace(id=first))
+        last = self.store.LOG_PATH.read_text().splitlines()[-1]
+        self.assertEqual(json.loads(last)["op"], "remove")
+        self.assertEqual(self.ids(), [second])
+
+    def test_unknown_id_fails(self):
+        self.add("one")
+        result = self.run_cli("remove", "obs-19700101-001")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("not found", result.stderr)
+        self.assertEqual(self.run_cli("remove", self.ids()[0]).returncode, 0)
+        self.assertEqual(self.run_cli("remove", "obs-19700101-001").returncode, 1)
+
+    def test_mostly_removed_log_is_compacted(self):
+        ids = [self.add(f"note {n}") for n in range(self.store.COMPACT_MIN_GARBAGE + 2)]
+        for obs_id in ids[:-1]:
+            self.assertEqual(self.run_cli("remove", obs_id).returncode, 0)
+        # Adds alone never compact a log this small, so the snapshot is the removes' doing
+        snapshot = json.loads(self.store.STORAGE_PATH.read_text())
+        self.assertLess(len(snapshot["observations"]), len(ids))
+        self.assertEqual(self.ids(), ids[-1:])
+
+
+class QueryTest(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        lines = [
+            {"description": "Hooks run before permission checks", "feature_area": "config",
+             "discovered": "2026-01-05", "context": "while testing 100% coverage"},
+            {"description": "Task agents inherit the model", "feature_area": "agents",
+             "discovered": "2026-02-10", "issue_url": "https://example.com/1"},
+            {"description": "Grep ignores hidden files", "feature_area": "tools",
+             "discovered": "2026-03-15"}]
+        result = self.run_cli("import", stdin="".join(json.dumps(line) + "\n" for line in lines))
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def query(self, *args):
+        result = self.run_cli("query", *args)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return [json.loads(line)["description"].split()[0] for line in result.stdout.splitlines()]
+
+    def test_filters_and_paging(self):
+        self.assertEqual(self.query(), ["Hooks", "Task", "Grep"])
+        self.assertEqual(self.query("--status", "submitted"), ["Task"])
+        self.assertEqual(self.query("--since", "2026-02-01", "--until", "2026-02-28"), ["Task"])
+        self.assertEqual(self.query("--match", "hidden grep"), ["Grep"])
+        self.assertEqual(self.query("--contains", "100%"), ["Hooks"])
+        self.assertEqual(self.query("--contains", "10_"), [])
+        self.assertEqual(self.query("--limit", "1", "--offset", "1"), ["Task"])
+
+    def test_index_follows_removals(self):
+        self.assertEqual(self.query("--feature-area", "agents"), ["Task"])
+        obs_id = json.loads(self.run_cli("query", "--feature-area", "agents").stdout)["id"]
+        self.assertEqual(self.run_cli("remove", obs_id).returncode, 0)
+        self.assertEqual(self.query(), ["Hooks", "Grep"])
+        self.assertEqual(self.run_cli("get", obs_id).returncode, 1)
+
+
+class NoFTS5Connection(sqlite3.Connection):
+    """A connection behaving like an sqlite3 build without FTS5."""
+
+    def execute(self, sql, *args):
+        if "fts5" in sql or "observations_text" in sql:
+            raise sqlite3.OperationalError("no such module: fts5")
+        return super().execute(sql, *args)
+
+
+class NoFTS5Test(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        connect = sqlite3.connect
+        patcher = mock.patch.object(self.store.sqlite3, "connect",
+                                    lambda *args, **kwargs: connect(*args, factory=NoFTS5Connection,
+                                                                    **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_remove_and_match_work_without_fts5(self):
+        first, second = self.add("Grep ignores hidden files"), self.add("Hooks run first")
+        with mock.patch.object(sys, "stdout", io.StringIO()) as out:
+            self.store.cmd_get(SimpleNamespace(id=second))
+            self.store.cmd_remove(SimpleNamespace(id=second))
+        self.assertIn("Hooks run first", out.getvalue())
+        self.assertEqual(self.ids(), [first])
+        conn = self.store.connect_index()
+        self.store.sync_index(conn)
+        found = self.store.query_observations(conn, match="hidden grep")
+        self.assertEqual([obs["id"] for obs in found], [first])
+        self.assertEqual(list(self.store.query_observations(conn, match="hidden hooks")), [])
+
+
+class ImportTest(StoreTestCase):
+
+    def test_discovered_must_be_a_date(self):
+        lines = [{"description": "ok", "feature_area": "tools", "discovered": "2026-01-02"},
+                 {"description": "bad", "feature_area": "tools", "discovered": "last week"}]
+        result = self.run_cli("import", stdin="".join(json.dumps(line) + "\n" for line in lines))
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Line 2", result.stderr)
+        self.assertEqual(self.ids(), [])
+
+    def test_discovered_is_stored_as_an_iso_date(self):
+        line = {"description": "ok", "feature_area": "mcp", "discovered": "20260102"}
+        with mock.patch.object(sys, "stdin", io.StringIO(json.dumps(line) + "\n")):
+            with mock.patch.object(sys, "stdout", io.StringIO()):
+                self.store.cmd_import(None)
+        [obs] = self.store.load_observations()["observations"]
+        self.assertEqual(obs["discovered"], "2026-01-02")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Benchmark export-session.py against seeded synthetic transcripts.
+
+Generates realistic session JSONL (Claude Code's entry envelope, one entry
+per content block, tool results duplicated into toolUseResult) with knobs
+for session length, tool-call mix, tool_result size distribution,
+compaction boundaries and parallel tool_use blocks. Then times a full
+export_session at each requested size, and the individual formatters on
+inputs sampled from the smallest transcript.
+
+Every case runs in a fresh child process, so its peak RSS is its own.
+Results are written as JSON; pass --baseline to compare against an earlier
+results file and exit non-zero on a regression.
+
+Usage:
+    python3 bench_export.py --sizes 1MB,100MB,1GB --output bench.json
+    python3 bench_export.py --sizes 1MB,100MB --baseline bench.json
+
+Requires Python 3.8+ and a POSIX system (resource.getrusage).
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid as uuid_lib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import session_export as exporter
+
+DEFAULT_MIX = "Read=4,Bash=3,Edit=2,Grep=2,Write=1,Task=1"
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+FORMATTER_SAMPLES = 2000
+# Formatter cases loop over their samples until at least this much time has passed
+FORMATTER_MIN_SECONDS = 0.5
+
+
+def parse_size(text):
+    """Parse '1MB', '100MB', '1GB' (or a plain byte count) to bytes."""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def parse_mix(text):
+    """Parse 'Read=4,Bash=3' into (names, weights)."""
+    names, weights = [], []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        names.append(name.strip())
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+# --- synthetic transcripts ---------------------------------------------------
+
+CODE_LINES = [
+    'def handler(event, context):', 'return {"status": "ok"}', 'for item in items:',
+    '    total += item.price * item.quantity', '# TODO: handle the empty case', '',
+    'raise ValueError(f"bad input: {value!r}")', 'import json', 'if __name__ == "__main__":',
+    'print("done\\n")', 'const result = await fetch(url);', '}',
+]
+
+
+def _numbered_file(rng, lines):
+    return '\n'.join(f"{n:6d}→    {rng.choice(CODE_LINES)}" for n in range(1, lines + 1))
+
+
+class TranscriptGenerator:
+    """Seeded generator of session entries with realistic shape and size."""
+
+    def __init__(self, seed=0, mix=DEFAULT_MIX, result_median=1200, result_sigma=1.6,
+                 compaction_every=400, parallel=0.2, max_parallel=4):
+        self.rng = random.Random(seed)
+        self.tools, self.weights = parse_mix(mix)
+        self.result_median = result_median
+        self.result_sigma = result_sigma
+        self.compaction_every = compaction_every
+        self.parallel = parallel
+        self.max_parallel = max_parallel
+        self.session_id = str(uuid_lib.UUID(int=self.rng.getrandbits(128)))
+        self.clock = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        self.parent = None
+        self.turns = 0
+        self.tool_ids = 0
+
+    def _envelope(self, entry_type):
+        self.clock += timedelta(milliseconds=self.rng.randint(50, 20000))
+        entry_uuid = str(uuid_lib.UUID(int=self.rng.getrandbits(128)))
+        entry = {
+            'parentUuid': self.parent, 'isSidechain': False, 'userType': 'external',
+            'cwd': '/home/dev/project', 'sessionId': self.session_id, 'version': '2.0.14',
+            'gitBranch': 'main', 'type': entry_type, 'uuid': entry_uuid,
+            'timestamp': self.clock.strftime('%Y-%m-%dT%H:%M:%S.') + f"{self.clock.microsecond // 1000:03d}Z"
+        }
+        self.parent = entry_uuid
+        return entry
+
+    def _result_chars(self):
+        return max(1, int(self.rng.lognormvariate(0, self.result_sigma) * self.result_median))
+
+    def _tool_call(self, name):
+        rng = self.rng
+        path = f"/home/dev/project/src/module_{rng.randint(1, 300)}.py"
+        if name == 'Read':
+            tool_input = {'file_path': path}
+            result = _numbered_file(rng, max(1, self._result_chars() // 40))
+        elif name == 'Edit':
+            old = '\n'.join(rng.choice(CODE_LINES) for _ in range(rng.randint(1, 30)))
+            new = '\n'.join(rng.choice(CODE_LINES) for _ in range(rng.randint(1, 30)))
+            tool_input = {'file_path': path, 'old_string': old, 'new_string': new}
+            result = f"The file {path} has been updated."
+        elif name == 'Write':
+            content = '\n'.join(rng.choice(CODE_LINES) for _ in range(max(1, self._result_chars() // 30)))
+            tool_input = {'file_path': path, 'content': content}
+            result = f"File created successfully at: {path}"
+        elif name == 'Bash':
+            tool_input = {'command': rng.choice(['pytest -q', 'git status', 'ls -la src', 'npm run build']),
+                          'description': 'Run a command'}
+            chars = self._result_chars()
+            result = '\n'.join(f"output line {n}: {'x' * rng.randint(0, 60)}"
+                               for n in range(max(1, chars // 45)))
+        elif name == 'Task':
+            tool_input = {'description': 'Explore the codebase', 'subagent_type': 'Explore',
+                          'prompt': 'Find where requests are handled.\nReport file paths.'}
+            result = [{'type': 'text', 'text': 'Requests are handled in src/handler.py.\n\nSee line 42.'},
+                      {'type': 'text', 'text': f"agentId: {rng.getrandbits(32):08x}"}]
+        else:
+            tool_input = {'pattern': rng.choice(['handler', 'TODO', 'def main']), 'path': 'src'}
+            result = '\n'.join(f"src/module_{rng.randint(1, 300)}.py" for _ in range(rng.randint(1, 40)))
+        return tool_input, result
+
+    def turn(self):
+        """Yield the entries of one user turn."""
+        rng = self.rng
+        self.turns += 1
+        if self.compaction_every and self.turns % self.compaction_every == 0:
+            entry = self._envelope('system')
+            entry.update({'subtype': 'compact_boundary', 'content': 'Conversation compacted',
+                          'level': 'info'})
+            yield entry
+
+        entry = self._envelope('user')
+        entry['message'] = {'role': 'user', 'content': rng.choice([
+            'Fix the failing test in the handler module.',
+            'Can you explain how the retry logic works?\nKeep it short.',
+            'Add logging to the request path and run the suite.'])}
+        yield entry
+
+        model = 'claude-sonnet-4-5-20250929' if rng.random() < 0.8 else 'claude-opus-4-5-20251101'
+        for _ in range(rng.randint(1, 6)):
+            entry = self._envelope('assistant')
+            entry['message'] = {'model': model, 'role': 'assistant', 'content': [
+                {'type': 'text', 'text': 'Let me look at that.'}],
+                'usage': {'input_tokens': rng.randint(1, 50), 'output_tokens': rng.randint(5, 900),
+                          'cache_read_input_tokens': rng.randint(0, 80000),
+                          'cache_creation_input_tokens': rng.randint(0, 4000)}}
+            yield entry
+
+            calls = 1
+            if rng.random() < self.parallel:
+                calls = rng.randint(2, self.max_parallel)
+            pending = []
+            for _ in range(calls):
+                name = rng.choices(self.tools, self.weights)[0]
+                tool_input, result = self._tool_call(name)
+                self.tool_ids += 1
+                tool_id = f"toolu_{self.tool_ids:08d}"
+                entry = self._envelope('assistant')
+                entry['message'] = {'model': model, 'role': 'assistant', 'content': [
+                    {'type': 'tool_use', 'id': tool_id, 'name': name, 'input': tool_input}]}
+                yield entry
+                pending.append((tool_id, result))
+
+            # Parallel calls are answered out of order, as they are in real sessions
+            if len(pending) > 1:
+                rng.shuffle(pending)
+            for tool_id, result in pending:
+                entry = self._envelope('user')
+                entry['message'] = {'role': 'user', 'content': [
+                    {'tool_use_id': tool_id, 'type': 'tool_result', 'content': result}]}
+                entry['toolUseResult'] = {'stdout': result} if isinstance(result, str) else {'content': result}
+                yield entry
+
+
+def generate_transcript(path, target_bytes, **knobs):
+    """Write a synthetic transcript of at least target_bytes; return its entry count."""
+    generator = TranscriptGenerator(**knobs)
+    entries = 0
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        summary = {'type': 'summary', 'summary': 'Synthetic benchmark session', 'leafUuid': 'x'}
+        written += f.write(json.dumps(summary) + '\n')
+        entries += 1
+        while written < target_bytes:
+            for entry in generator.turn():
+                written += f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+                entries += 1
+    return entries
+
+
+# --- cases -------------------------------------------------------------------
+
+def _sample_inputs(path):
+    """Pull formatter inputs out of a transcript."""
+    edits, results, params, assistant = [], [], [], []
+    with open(path, 'rb') as f:
+        for line in f:
+            entry = exporter.decode_entry(line)
+            content = entry.get('message', {}).get('content')
+            if not isinstance(content, list):
+                continue
+            if entry.get('type') == 'assistant':
+                assistant.append(entry)
+            for block in content:
+                if block.get('type') == 'tool_use':
+                    params.append((block['input'], block['name']))
+                    if block['name'] == 'Edit':
+                        edits.append((block['input']['old_string'], block['input']['new_string']))
+                elif block.get('type') == 'tool_result' and isinstance(block.get('content'), str):
+                    results.append(block['content'])
+    return {'generate_edit_diff': edits, 'format_tool_result': results,
+            'format_tool_params': params, 'format_assistant_message': assistant}
+
+
+def run_case(case, path):
+    """Run one case in this process and return its measurements."""
+    if case == 'export_session':
+        rusage_start = resource.getrusage(resource.RUSAGE_SELF)
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            exporter.export_session(path, Path(tmp) / 'out.txt')
+            wall = time.perf_counter() - start
+        with open(path, 'rb') as f:
+            items = sum(1 for _ in f)
+    else:
+        samples = _sample_inputs(path)[case][:FORMATTER_SAMPLES]
+        func = getattr(exporter, case)
+        items = 0
+        rusage_start = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        while samples and time.perf_counter() - start < FORMATTER_MIN_SECONDS:
+            for sample in samples:
+                if isinstance(sample, tuple):
+                    func(*sample)
+                else:
+                    func(sample)
+            items += len(samples)
+        wall = time.perf_counter() - start
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    peak_kb = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    cpu = (rusage.ru_utime - rusage_start.ru_utime) + (rusage.ru_stime - rusage_start.ru_stime)
+    return {
+        'case': case,
+        'input_bytes': os.path.getsize(path),
+        'items': items,
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'peak_rss_kb': peak_kb,
+        'items_per_s': round(items / wall, 1) if wall else None
+    }
+
+
+def run_isolated(case, path):
+    """Run a case in a fresh interpreter so peak RSS belongs to that case alone."""
+    proc = subprocess.run([sys.executable, __file__, '_run', case, str(path)],
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout)
+
+
+def compare(results, baseline, threshold):
+    """Return regression messages for cases worse than baseline by more than threshold.
+
+    Throughput is compared rather than wall time, since formatter cases run
+    for a fixed minimum time; peak RSS is compared directly.
+    """
+    previous = {(r['case'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result['case'], result['size']))
+        if not old:
+            continue
+        label = f"{result['case']} @ {result['size']}"
+        if old['items_per_s'] and result['items_per_s'] < old['items_per_s'] * (1 - threshold):
+            change = (1 - result['items_per_s'] / old['items_per_s']) * 100
+            regressions.append(f"{label}: items/s {old['items_per_s']} → "
+                               f"{result['items_per_s']} (-{change:.0f}%)")
+        if old['peak_rss_kb'] and result['peak_rss_kb'] > old['peak_rss_kb'] * (1 + threshold):
+            change = (result['peak_rss_kb'] / old['peak_rss_kb'] - 1) * 100
+            regressions.append(f"{label}: peak_rss_kb {old['peak_rss_kb']} → "
+                               f"{result['peak_rss_kb']} (+{change:.0f}%)")
+    return regressions
+
+
+def main(args):
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    work_dir = Path(args.work_dir or tempfile.gettempdir()) / 'export-session-bench'
+    work_dir.mkdir(parents=True, exist_ok=True)
+    knobs = dict(seed=args.seed, mix=args.mix, result_median=args.result_median,
+                 result_sigma=args.result_sigma, compaction_every=args.compaction_every,
+                 parallel=args.parallel, max_parallel=args.max_parallel)
+    knob_key = '-'.join(str(v) for v in knobs.values()).replace('=', '').replace(',', '')
+
+    results = []
+    for index, size in enumerate(sizes):
+        path = work_dir / f"synthetic-{size}-{knob_key}.jsonl"
+        if not path.exists():
+            print(f"  generating {size} transcript…", file=sys.stderr)
+            partial = path.with_suffix('.partial')
+            generate_transcript(partial, parse_size(size), **knobs)
+            partial.rename(path)
+
+        cases = ['export_session']
+        if index == 0:
+            cases += ['generate_edit_diff', 'format_tool_result', 'format_tool_params',
+                      'format_assistant_message']
+        for case in cases:
+            result = run_isolated(case, path)
+            result['size'] = size
+            results.append(result)
+            print(f"{case:26} {size:>6}  {result['wall_s']:9.3f}s wall  {result['cpu_s']:9.3f}s cpu  "
+                  f"{result['peak_rss_kb'] / 1024:8.1f} MB peak  {result['items_per_s']:>12} items/s")
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'orjson': exporter.orjson is not None,
+        'knobs': knobs,
+        'results': results
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"✓ Results written to: {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for message in regressions:
+            print(f"✗ Regression: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '_run':
+        print(json.dumps(run_case(sys.argv[2], sys.argv[3])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark export-session.py on synthetic transcripts")
+    parser.add_argument("--sizes", default="1MB,100MB,1GB", help="Transcript sizes (default: 1MB,100MB,1GB)")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Tool-call weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--result-median", type=int, default=1200,
+                        help="Median tool_result size in chars (default: 1200)")
+    parser.add_argument("--result-sigma", type=float, default=1.6,
+                        help="Log-normal spread of tool_result sizes (default: 1.6)")
+    parser.add_argument("--compaction-every", type=int, default=400,
+                        help="Turns between compaction boundaries, 0 for none (default: 400)")
+    parser.add_argument("--parallel", type=float, default=0.2,
+                        help="Probability a step issues parallel tool_use blocks (default: 0.2)")
+    parser.add_argument("--max-parallel", type=int, default=4,
+                        help="Most tool_use blocks in one parallel step, at least 2 (default: 4)")
+    parser.add_argument("--work-dir", help="Where generated transcripts are cached (default: temp dir)")
+    parser.add_argument("--output", help="Write machine-readable results here")
+    parser.add_argument("--baseline", help="Compare against an earlier results file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown before flagging a regression (default: 0.10)")
+    args = parser.parse_args()
+    if args.max_parallel < 2:
+        parser.error("--max-parallel must be at least 2")
+    main(args)
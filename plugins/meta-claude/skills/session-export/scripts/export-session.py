@@ -3,462 +3,367 @@
 Export Claude Code session JSONL to UI-style readable text format.
 Mimics the output of the /export command.
 
-Requires Python 3.6+ (for f-strings and pathlib).
+The exporter itself is session_export.py beside this script; this is its
+command line. With --serve it runs as a long-lived worker instead: one JSON
+request per stdin line, one JSON response per stdout line, so a pipeline
+exporting many sessions pays interpreter startup and imports once.
+
+Requires Python 3.8+ (for f-strings, pathlib and unlink(missing_ok=True)).
 """
 
+import argparse
+import contextlib
 import json
-import os
-import re
+import signal
 import sys
 from pathlib import Path
 
-# Get home directory dynamically
-HOME_DIR = os.path.expanduser("~")
-
-
-def generate_edit_diff(old_string, new_string, max_lines=15):
-    """Generate a simple diff showing added/removed lines.
-
-    Args:
-        old_string: The original text being replaced
-        new_string: The new text replacing it
-        max_lines: Maximum lines to show in diff (truncate if larger, minimum 2)
-
-    Returns:
-        Tuple of (diff_lines, added_count, removed_count)
-    """
-    # Ensure max_lines is at least 2 to prevent division issues
-    max_lines = max(max_lines, 2)
-
-    old_lines = old_string.split('\n') if old_string else []
-    new_lines = new_string.split('\n') if new_string else []
-
-    added = len(new_lines)
-    removed = len(old_lines)
-
-    diff_lines = []
-
-    # Show removed lines (limited)
-    for line in old_lines[:max_lines // 2]:
-        diff_lines.append(f"-{line}")
-
-    if len(old_lines) > max_lines // 2:
-        diff_lines.append(f"  ... ({len(old_lines) - max_lines // 2} more removed)")
-
-    # Show added lines (limited)
-    for line in new_lines[:max_lines // 2]:
-        diff_lines.append(f"+{line}")
-
-    if len(new_lines) > max_lines // 2:
-        diff_lines.append(f"  ... ({len(new_lines) - max_lines // 2} more added)")
-
-    return diff_lines, added, removed
-
-
-def format_tool_params(params, tool_name=''):
-    """Format tool parameters for display - match native format."""
-    if not params:
-        return ""
-
-    # For Read operations - just show filename
-    if tool_name == 'Read' and 'file_path' in params:
-        file_path = params['file_path']
-        # Extract just the filename for display (cross-platform)
-        return Path(file_path).name
-
-    # For simple single params, show just the value (no key)
-    if len(params) == 1 and isinstance(list(params.values())[0], str):
-        key, val = list(params.items())[0]
-        if len(val) < 50:
-            # For description params, show the value directly
-            if key in ['description', 'file_path', 'pattern']:
-                return val
-            return f"{key}: {val}"
-
-    # For complex params, format nicely
-    formatted = []
-    for key, val in params.items():
-        if isinstance(val, str) and '\n' in val:
-            formatted.append(f"{key}: |\n  " + val.replace('\n', '\n  '))
-        elif isinstance(val, (dict, list)):
-            formatted.append(f"{key}: {json.dumps(val, indent=2)}")
-        else:
-            formatted.append(f"{key}: {val}")
-    return '\n      '.join(formatted)
-
-
-def format_tool_result(content):
-    """Format tool result content - keep it concise, match native format."""
-    if isinstance(content, str):
-        # Very long file contents - just show summary (no extra indent)
-        if len(content) > 2000:
-            lines = content.split('\n')
-            # Count numbered lines (file content)
-            numbered_lines = [l for l in lines if l.strip() and '→' in l[:10]]
-            if numbered_lines:
-                return f"  Read {len(numbered_lines)} lines"
-            return f"  ({len(lines)} lines)"
-
-        # Medium-length results - truncate
-        if len(content) > 500:
-            lines = content.split('\n')
-            if len(lines) > 10:
-                # Show first few lines with indent
-                formatted_lines = ['  ' + line for line in lines[:5]]
-                formatted_lines.append(f"    ... ({len(lines) - 5} more lines)")
-                return '\n'.join(formatted_lines)
-            return '  ' + content[:500] + "..."
-
-        # Short results - indent them
-        if '\n' in content:
-            return '\n'.join('  ' + line for line in content.split('\n'))
-        return '  ' + content
-    elif isinstance(content, list):
-        return '\n'.join(format_tool_result(c) for c in content)
-    return str(content)
-
-
-def extract_session_info(entries):
-    """Extract session metadata from entries."""
-    info = {
-        'version': 'unknown',
-        'model': None,
-        'cwd': '~',
-        'summary': None
-    }
-
-    # Count model occurrences to find the most common one
-    model_counts = {}
-
-    for entry in entries:
-        if entry.get('type') == 'summary' and 'summary' in entry:
-            info['summary'] = entry['summary']
-        if 'version' in entry:
-            info['version'] = entry['version']
-        if 'cwd' in entry:
-            # Show relative to home directory, matching native format
-            cwd = entry['cwd']
-            if cwd.startswith(HOME_DIR):
-                info['cwd'] = '~' + cwd[len(HOME_DIR):]
-            else:
-                info['cwd'] = cwd
-        if 'message' in entry and 'model' in entry['message']:
-            model = entry['message']['model']
-            # Only count actual Claude models, not internal references
-            if model and model.startswith('claude-') and 'code' not in model:
-                model_counts[model] = model_counts.get(model, 0) + 1
-
-    # Pick the most common model
-    if model_counts:
-        info['model'] = max(model_counts, key=model_counts.get)
-
-    return info
-
-
-def parse_model_display_name(model_id):
-    """Parse model ID to friendly display name.
-
-    Examples:
-        claude-opus-4-5-20251101 -> Opus 4.5
-        claude-sonnet-4-5-20250929 -> Sonnet 4.5
-        claude-3-5-sonnet-20241022 -> Sonnet 3.5
-    """
-    if not model_id:
-        return "Claude"
-
-    model_id = model_id.lower()
-
-    # Extract model family and version
-    if 'opus' in model_id:
-        family = 'Opus'
-    elif 'sonnet' in model_id:
-        family = 'Sonnet'
-    elif 'haiku' in model_id:
-        family = 'Haiku'
+from session_export import (FOLLOW_POLL_SECONDS, OUTPUT_SINKS, SESSION_UUID_RE, ExportError,
+                            ExportStats, SecretsFound, export_batch, export_session,
+                            follow_session, zstd)
+
+
+def fail(error, file=None):
+    """Print an ExportError the way the exporter always has, and exit with its status."""
+    for line in getattr(error, 'report', []):
+        print(line, file=file)
+    print(f"✗ Error: {error}", file=file)
+    sys.exit(error.exit_code)
+
+
+def print_result(result):
+    """Report one export_session result."""
+    for note in result.notes:
+        print(f"  Note: {note}")
+    if result.up_to_date:
+        print(f"✓ Already up to date: {result.outputs['text']}")
+        return
+    if result.chunks is not None:
+        chunks = len(result.chunks)
+        print(f"✓ Exported session in {chunks} chunk{'' if chunks == 1 else 's'} to: "
+              f"{result.outputs['text']}")
+        if result.summary:
+            print(f"  Summary: {result.summary}")
+        if result.unanswered:
+            print(f"  Tool uses without a result: {result.unanswered}")
+        print(f"  File size: {result.sizes['text'] / 1024:.1f} KB, "
+              f"~{sum(chunk['tokens'] for chunk in result.chunks):,} tokens "
+              f"(largest chunk ~{max(chunk['tokens'] for chunk in result.chunks):,})")
+        print(f"  Chunk index: {result.outputs['index']}")
+    elif list(result.outputs) == ['text']:
+        print(f"✓ Exported session to: {result.outputs['text']}")
+        if result.summary:
+            print(f"  Summary: {result.summary}")
+        if result.unanswered:
+            print(f"  Tool uses without a result: {result.unanswered}")
+        print(f"  File size: {result.size / 1024:.1f} KB")
     else:
-        return "Claude"
-
-    # Extract version number (e.g., "4-5" -> "4.5", "3-5" -> "3.5")
-    version_match = re.search(r'(\d+)-(\d+)', model_id)
-    if version_match:
-        version = f"{version_match.group(1)}.{version_match.group(2)}"
-        return f"{family} {version}"
-
-    return family
-
-
-def format_header(info):
-    """Format session header - match native format exactly."""
-    model_display = parse_model_display_name(info.get('model', ''))
-
-    lines = []
-    lines.append("")  # Leading blank line
-    lines.append(" * ▐▛███▜▌ *   Claude Code v" + info['version'])  # Leading space
-    lines.append(f"* ▝▜█████▛▘ *  {model_display} · Claude API")
-    lines.append(" *  ▘▘ ▝▝  *   " + info['cwd'])
-    lines.append("")
-    return '\n'.join(lines)
-
-
-def format_user_message(entry):
-    """Format a user message."""
-    msg = entry.get('message', {})
-    content = msg.get('content', '')
-
-    # Skip meta messages (like context dumps, command outputs)
-    if entry.get('isMeta'):
-        return None
-
-    # Skip command tags whether meta or not
-    if isinstance(content, str):
-        if any(tag in content for tag in ['<command-name>', '<local-command-stdout>', '<command-args>', '<command-message>']):
-            return None
-
-    # Skip tool results - they're handled separately
-    if isinstance(content, list):
-        for block in content:
-            if isinstance(block, dict) and block.get('type') == 'tool_result':
-                return None
-
-    # Skip content that's just raw tool result JSON
-    if isinstance(content, str) and content.startswith("[{'tool_use_id'"):
-        return None
-
-    # Format regular user message (no ⎿ marker per native format)
-    return f"> {content}"
-
-
-def format_assistant_message(entry):
-    """Format an assistant message with tool uses."""
-    msg = entry.get('message', {})
-    content = msg.get('content', [])
-
-    if isinstance(content, str):
-        content = [{'type': 'text', 'text': content}]
-
-    lines = []
-
-    for block in content:
-        if not isinstance(block, dict):
-            continue
-
-        block_type = block.get('type', '')
-
-        if block_type == 'text':
-            text = block.get('text', '').strip()
-            if text:
-                lines.append(f"⏺ {text}")
-                lines.append("")
-
-        elif block_type == 'thinking':
-            # Skip thinking blocks in the UI-style output
-            continue
-
-        elif block_type == 'tool_use':
-            tool_name = block.get('name', 'Unknown')
-            tool_input = block.get('input', {})
-
-            # Format tool name (capitalize, handle special cases)
-            display_name = tool_name.replace('_', ' ').title()
-            if tool_name == 'Read':
-                display_name = 'Read'
-            elif tool_name == 'Write':
-                display_name = 'Write'
-            elif tool_name == 'Edit':
-                display_name = 'Edit'
-            elif tool_name == 'Bash':
-                display_name = 'Bash'
-            elif tool_name == 'Task':
-                display_name = block.get('input', {}).get('description', 'Task')
-
-            # Format parameters - keep concise for verbose tools
-            if tool_name == 'Edit':
-                # For edits, show file and diff summary
-                file_path = tool_input.get('file_path', '')
-                filename = Path(file_path).name if file_path else 'file'
-                old_string = tool_input.get('old_string', '')
-                new_string = tool_input.get('new_string', '')
-
-                diff_lines, added, removed = generate_edit_diff(old_string, new_string)
-
-                lines.append(f"⏺ Update({filename})")
-                lines.append(f"  ⎿  Added {added} lines, removed {removed} lines")
-
-                # Show diff preview (indented)
-                for diff_line in diff_lines[:10]:  # Limit to 10 lines
-                    lines.append(f"     {diff_line}")
-                if len(diff_lines) > 10:
-                    lines.append(f"     ... ({len(diff_lines) - 10} more diff lines)")
-            elif tool_name == 'Write':
-                # For writes, just show the file
-                file_path = tool_input.get('file_path', '')
-                content_lines = tool_input.get('content', '').count('\n') + 1
-                filename = Path(file_path).name if file_path else 'file'
-                lines.append(f"⏺ Write({filename} - {content_lines} lines)")
-                lines.append("  ⎿  ")
-            elif tool_name == 'Bash':
-                # For Bash, show raw command (no description label)
-                command = tool_input.get('command', '')
-                if command:
-                    # Show command directly without labels
-                    lines.append(f"⏺ Bash({command})")
-                else:
-                    lines.append(f"⏺ Bash")
-                lines.append("  ⎿  ")
-            else:
-                # For other tools, format normally
-                params = format_tool_params(tool_input, tool_name)
-                if params and '\n' in params:
-                    lines.append(f"⏺ {display_name}({params})")
-                elif params:
-                    lines.append(f"⏺ {display_name}({params})")
-                else:
-                    lines.append(f"⏺ {display_name}")
-                lines.append("  ⎿  ")
-
-    return '\n'.join(lines) if lines else None
-
-
-def format_tool_result_entry(entry):
-    """Format tool result from a user entry - match native format (no blank line after ⎿)."""
-    msg = entry.get('message', {})
-    content = msg.get('content', [])
-
-    if isinstance(content, str):
-        # Try to parse if it looks like a list
-        if content.startswith("[{"):
-            return None
-        content = [{'type': 'text', 'text': content}]
-
-    lines = []
-
-    for block in content:
-        if not isinstance(block, dict):
-            continue
-
-        if block.get('type') == 'tool_result':
-            # Skip interrupted requests (noise in export)
-            if block.get('is_error'):
-                content_str = str(block.get('content', ''))
-                if 'Request interrupted' in content_str:
-                    continue
-
-            result_content = block.get('content', '')
-
-            # Handle agent results specially
-            if isinstance(result_content, list):
-                for item in result_content:
-                    if isinstance(item, dict) and item.get('type') == 'text':
-                        text = item.get('text', '')
-                        if text and not text.startswith('agentId:'):
-                            # Clean formatting for agent results
-                            for line in text.split('\n'):
-                                if line.strip():
-                                    lines.append(line)
-            # Handle string results
-            elif isinstance(result_content, str):
-                formatted = format_tool_result(result_content)
-                if formatted:
-                    # Add result lines directly (no extra indent per native format)
-                    lines.append(formatted)
-
-    return '\n'.join(lines) if lines else None
-
-
-def export_session(jsonl_path, output_path):
-    """Export JSONL session to UI-style readable text format."""
-
-    # Read and parse JSONL file with error handling
-    try:
-        with open(jsonl_path, 'r') as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"✗ Error: Session file not found: {jsonl_path}")
-        sys.exit(1)
-    except PermissionError:
-        print(f"✗ Error: Permission denied reading: {jsonl_path}")
-        sys.exit(1)
+        print(f"✓ Exported session ({', '.join(result.outputs)}) to:")
+        for name, size in result.sizes.items():
+            print(f"  {result.outputs[name]} ({size / 1024:.1f} KB)")
+        if result.summary:
+            print(f"  Summary: {result.summary}")
+        if result.unanswered:
+            print(f"  Tool uses without a result: {result.unanswered}")
+    if result.secret_scan:
+        print("  Secret scan: clean")
+
+
+def print_batch(sessions, results, out_dir):
+    """Report an export_batch run; return True if every export succeeded."""
+    failures = {uuid: result for uuid, result in results.items()
+                if isinstance(result, ExportError)}
+    total_size = sum(result.size for result in results.values()
+                     if not isinstance(result, ExportError))
+    print(f"✓ Exported {len(results) - len(failures)} of {len(sessions)} sessions to: {out_dir}")
+    print(f"  Total size: {total_size / 1024:.1f} KB")
+    for uuid in sorted(failures):
+        print(f"✗ {uuid} ({sessions[uuid]}): {failures[uuid]}")
+    return not failures
+
+
+class Worker:
+    """Serve export, catalog and search requests from one process (--serve).
+
+    The session catalog and search index are opened on first use and kept
+    open, so a request can name a session by UUID and later requests reuse
+    the same connections. Requests are JSON objects:
+
+      {"op": "export", "session": PATH_OR_UUID, "output": PATH, "formats": [...],
+       "incremental": BOOL, "subagents": BOOL, "jobs": N, "scan_secrets": PATH,
+       "chunk_tokens": N}
+      {"op": "update", "sources": [...]}           refresh the catalog and index
+      {"op": "find", "model": ..., "cwd": ..., "summary": ..., "since": ...,
+       "until": ..., "limit": N}                    query the catalog
+      {"op": "search", "query": TEXT, "kind": ..., "tool": ..., "session": ...,
+       "limit": N, "raw": BOOL}                     query the search index
+
+    Each response echoes the request's "id" with "ok": true and a "result",
+    or "ok": false with the "error" message and the CLI's "exit_code".
+    """
 
-    # Parse JSON lines with error handling
-    entries = []
-    for i, line in enumerate(lines):
+    def __init__(self):
+        self._catalog = None
+        self._index = None
+
+    # The catalog and index modules (and sqlite3) load on first use, so a
+    # worker that only exports never imports them
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            import session_catalog
+            self._catalog = session_catalog.connect()
+        return self._catalog
+
+    @property
+    def index(self):
+        if self._index is None:
+            import session_search
+            try:
+                self._index = session_search.connect()
+            except session_search.SearchError as e:
+                raise ExportError(str(e)) from None
+        return self._index
+
+    def resolve(self, session):
+        """A transcript path for a request's session: a path as given, or a UUID via the catalog."""
+        if SESSION_UUID_RE.match(session) and not Path(session).exists():
+            row = self.catalog.execute("SELECT path FROM sessions WHERE uuid = ?",
+                                       (session,)).fetchone()
+            if row is None:
+                raise ExportError(f"Session {session} not in catalog")
+            return row['path']
+        return session
+
+    def export(self, request):
+        result = export_session(self.resolve(request['session']), request['output'],
+                                request.get('incremental', False), jobs=request.get('jobs'),
+                                formats=request.get('formats'),
+                                subagents=request.get('subagents', False),
+                                scan_secrets=request.get('scan_secrets'),
+                                chunk_tokens=request.get('chunk_tokens'))
+        return result.to_dict()
+
+    def update(self, request):
+        import session_catalog
+        import session_search
+        sources = request.get('sources') or [session_catalog.DEFAULT_SOURCE]
+        scanned, moved, unchanged, removed = session_catalog.update_catalog(self.catalog, sources)
+        indexed, blocks, _, _ = session_search.update_index(self.index, sources)
+        return {'scanned': scanned, 'moved': moved, 'unchanged': unchanged, 'removed': removed,
+                'indexed': indexed, 'blocks': blocks}
+
+    def find(self, request):
+        import session_catalog
+        rows = session_catalog.query_sessions(
+            self.catalog, request.get('model'), request.get('cwd'), request.get('summary'),
+            request.get('since'), request.get('until'), request.get('limit'))
+        return [session_catalog.row_to_dict(row) for row in rows]
+
+    def search(self, request):
+        import session_search
+        hits = session_search.search(self.index, request['query'], request.get('kind'),
+                                     request.get('tool'), request.get('session'),
+                                     request.get('limit', 20), request.get('raw', False))
+        return [dict(hit) for hit in hits]
+
+    def handle(self, line):
+        """Answer one request line with a response object."""
         try:
-            entries.append(json.loads(line))
-        except json.JSONDecodeError as e:
-            print(f"✗ Error: Invalid JSON on line {i + 1}: {e}")
-            sys.exit(1)
-
-    # Extract session info
-    info = extract_session_info(entries)
-
-    # Start output with header
-    output_lines = []
-    output_lines.append(format_header(info))
-
-    # Process entries in order
-    for i, entry in enumerate(entries):
-        entry_type = entry.get('type', '')
-
-        # Handle compaction boundary - add visual separator
-        if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
-            output_lines.append("═" * 80)
-            output_lines.append(" Conversation compacted · ctrl+o for history ")
-            output_lines.append("═" * 80)
-            output_lines.append("")
-            continue
-
-        if entry_type == 'user':
-            formatted = format_user_message(entry)
-            if formatted:
-                output_lines.append(formatted)
-                # Add blank line after user message (matches native format)
-                output_lines.append("")
-
-        elif entry_type == 'assistant':
-            formatted = format_assistant_message(entry)
-            if formatted:
-                output_lines.append(formatted)
-
-        # Check next entry for tool results
-        if i + 1 < len(entries) and entries[i + 1].get('type') == 'user':
-            next_msg = entries[i + 1].get('message', {})
-            if isinstance(next_msg.get('content'), list):
-                for block in next_msg['content']:
-                    if isinstance(block, dict) and block.get('type') == 'tool_result':
-                        formatted = format_tool_result_entry(entries[i + 1])
-                        if formatted:
-                            output_lines.append(formatted)
-                            # Add blank line after tool result block (matches native format)
-                            output_lines.append("")
-                        break
-
-    # Write to file with error handling
-    output_path = Path(output_path)
-    try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w') as f:
-            f.write('\n'.join(output_lines))
-    except PermissionError:
-        print(f"✗ Error: Permission denied writing to: {output_path}")
-        sys.exit(1)
-    except OSError as e:
-        print(f"✗ Error: Failed to write file: {e}")
-        sys.exit(1)
-
-    print(f"✓ Exported session to: {output_path}")
-    if info['summary']:
-        print(f"  Summary: {info['summary']}")
-    print(f"  File size: {output_path.stat().st_size / 1024:.1f} KB")
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            return {'id': None, 'ok': False, 'error': f"Invalid request: {e}", 'exit_code': 1}
+
+        response = {'id': request.get('id')}
+        op = request.get('op', 'export')
+        handler = {'export': self.export, 'update': self.update, 'find': self.find,
+                   'search': self.search}.get(op)
+        try:
+            if handler is None:
+                raise ExportError(f"Unknown op: {op}")
+            response.update(ok=True, result=handler(request))
+        except ExportError as e:
+            response.update(ok=False, error=str(e), exit_code=e.exit_code)
+            if isinstance(e, SecretsFound):
+                response['findings'] = [{'location': location, 'labels': labels, 'text': text}
+                                        for location, labels, text in e.findings]
+        except KeyError as e:
+            response.update(ok=False, error=f"Missing request field: {e}", exit_code=1)
+        except Exception as e:  # keep serving; the caller sees what went wrong
+            response.update(ok=False, error=f"{type(e).__name__}: {e}", exit_code=1)
+        return response
+
+    def serve(self, requests, out):
+        for line in requests:
+            if not line.strip():
+                continue
+            # stdout carries only responses; anything else printed goes to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                response = self.handle(line)
+            out.write(json.dumps(response, ensure_ascii=False) + '\n')
+            out.flush()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python export-session.py <session-file.jsonl> [output.txt]")
-        print("\nExample:")
-        print("  python export-session.py ~/.claude/projects/.../session-id.jsonl output.txt")
+    parser = argparse.ArgumentParser(
+        description="Export Claude Code session JSONL to UI-style readable text",
+        epilog="Examples:\n"
+               "  python export-session.py ~/.claude/projects/.../session-id.jsonl output.txt\n"
+               "  python export-session.py --batch '~/.claude/projects/*my-project*/' --out-dir exports/",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("session", nargs="?", help="Session JSONL file to export")
+    parser.add_argument("output", nargs="?", default="session-transcript.txt",
+                        help="Output path (default: session-transcript.txt)")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="Export every top-level session transcript in a directory or glob")
+    parser.add_argument("--out-dir", default=".",
+                        help="Batch output directory; files are named <uuid>.txt (default: .)")
+    parser.add_argument("--compress", choices=["gz", "zst"],
+                        help="Batch: write compressed <uuid>.txt.gz or <uuid>.txt.zst outputs "
+                             "(single exports compress when the output ends in .gz or .zst)")
+    parser.add_argument("--format", dest="formats", type=lambda value: value.split(","),
+                        metavar="FORMAT[,FORMAT...]",
+                        help="Output formats, rendered from one pass over the transcript: "
+                             f"{', '.join(OUTPUT_SINKS)} (default: text). Text goes to the "
+                             "output path; the others swap its extension (.md, .html, "
+                             ".events.jsonl)")
+    parser.add_argument("--subagents", action="store_true",
+                        help="Splice each subagent transcript (from the <uuid>/ directory beside "
+                             "the session) inline under the Task call that spawned it")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes for --batch, or for reading subagent transcripts "
+                             "with --subagents (default: CPU count)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep a <output>.checkpoint.json sidecar and, on re-export, "
+                             "render only entries appended since the last run")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep the transcript open and render entries as they are appended "
+                             "(output '-' writes to stdout); stop with Ctrl-C")
+    parser.add_argument("--poll", type=float, default=FOLLOW_POLL_SECONDS, metavar="SECONDS",
+                        help=f"With --follow, how often to check for appends "
+                             f"(default: {FOLLOW_POLL_SECONDS})")
+    parser.add_argument("--scan-secrets", metavar="SCANNER",
+                        help="Scan the rendered export with knowledge-commons' scan_secrets.py "
+                             "(or the scan-secrets.sh beside it) as it is written; the output "
+                             "is only written if the scan is clean (exit 1 on findings, 2 if "
+                             "the scan cannot run)")
+    parser.add_argument("--chunk-tokens", type=int, metavar="N",
+                        help="Split the text export into self-contained chunks of about N "
+                             "estimated tokens, cut on turn and compaction edges, each with "
+                             "its own header; <output>.chunks.json indexes them by byte "
+                             "offset, line and token count")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a worker: read JSON requests (export, update, find, "
+                             "search) one per line from stdin and answer each with one JSON "
+                             "line on stdout, until stdin closes")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Render one large transcript across N worker processes "
+                             "(default: 1; files under 16 MB are always rendered serially)")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report per-phase wall/CPU time, peak memory, bytes in/out and "
+                             "render time per entry type and tool")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Write cProfile stats for the export to PATH (read with pstats)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="With --stats, also trace allocations and list the top sites")
+    args = parser.parse_args()
+
+    if args.serve and (args.session or args.batch or args.follow or args.stats or args.profile):
+        parser.error("--serve takes its exports as requests on stdin, not as arguments")
+    if args.batch and (args.stats or args.profile or args.tracemalloc):
+        parser.error("--stats, --profile and --tracemalloc apply to single-session exports")
+    if args.tracemalloc and not args.stats:
+        parser.error("--tracemalloc requires --stats")
+    if args.jobs > 1 and (args.batch or args.stats or args.profile):
+        parser.error("--jobs applies to single-session exports without --stats or --profile")
+
+    unknown = [name for name in args.formats or [] if name not in OUTPUT_SINKS]
+    if unknown:
+        parser.error(f"unknown --format {', '.join(unknown)} (choose from {', '.join(OUTPUT_SINKS)})")
+    if args.formats and args.formats != ["text"] and (args.stats or args.profile or args.jobs > 1):
+        parser.error("--stats, --profile and --jobs apply to text-only exports")
+    if args.subagents and args.formats and args.formats != ["text"]:
+        parser.error("--subagents applies to text exports")
+    if args.follow and (args.batch or args.incremental or args.jobs > 1 or args.stats
+                        or args.profile or args.subagents
+                        or (args.formats and args.formats != ["text"])):
+        parser.error("--follow applies to a single text export, without --incremental, "
+                     "--jobs, --stats, --profile or --subagents")
+    if args.scan_secrets and (args.batch or args.follow
+                              or (args.formats and args.formats != ["text"])):
+        parser.error("--scan-secrets applies to a single text export, without --batch or --follow")
+    if args.chunk_tokens is not None and (
+            args.chunk_tokens <= 0 or args.batch or args.follow or args.scan_secrets
+            or args.jobs > 1 or args.stats or args.profile
+            or (args.formats and args.formats != ["text"])):
+        parser.error("--chunk-tokens takes a positive budget and applies to a single text "
+                     "export, without --batch, --follow, --scan-secrets, --jobs, --stats "
+                     "or --profile")
+    if args.poll <= 0:
+        parser.error("--poll must be positive")
+    if args.compress and not args.batch:
+        parser.error("--compress applies to --batch; name a single output *.gz or *.zst instead")
+    if args.compress == "zst" and zstd is None:
+        parser.error("--compress zst needs Python 3.14+ or the zstandard package")
+
+    if args.serve:
+        Worker().serve(sys.stdin, sys.stdout)
+        sys.exit(0)
+
+    if args.batch:
+        try:
+            sessions, results = export_batch(args.batch, args.out_dir, args.workers,
+                                             args.incremental, args.compress, args.formats,
+                                             args.subagents)
+        except ExportError as e:
+            fail(e)
+        sys.exit(0 if print_batch(sessions, results, Path(args.out_dir)) else 1)
+
+    if not args.session:
+        parser.print_usage()
         sys.exit(1)
 
-    jsonl_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else 'session-transcript.txt'
+    if args.follow:
+        def stop(signum, frame):
+            raise KeyboardInterrupt
 
-    export_session(jsonl_path, output_path)
+        # Stop cleanly on SIGTERM too, writing what is still queued
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            follow_session(args.session, args.output, args.poll)
+        except ExportError as e:
+            fail(e, file=sys.stderr)
+        sys.exit(0)
+
+    stats = ExportStats() if args.stats else None
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        result = export_session(args.session, args.output, args.incremental, stats, args.jobs,
+                                args.formats, args.subagents, args.workers, args.scan_secrets,
+                                args.chunk_tokens)
+    except ExportError as e:
+        fail(e)
+    print_result(result)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"  Profile: {args.profile}")
+    if args.tracemalloc:
+        stats.tracemalloc_peak = tracemalloc.get_traced_memory()[1]
+        stats.tracemalloc_top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        tracemalloc.stop()
+    if stats is not None:
+        print(stats.report())
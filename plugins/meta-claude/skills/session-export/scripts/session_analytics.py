@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+Token-usage, model and tool-call analytics across Claude Code sessions.
+
+Extracts token usage (assistant API messages and their input, output and
+cache token counts, summed per session, model and day) and one row per
+tool call (tool, day, latency to its result, outcome) from every
+transcript into a columnar store: each column
+is a flat binary array on disk, with the model and tool names, the session
+list and each session's row ranges in a JSON manifest. Aggregate queries
+(tokens by model per day, tool-call latency percentiles, cache-hit ratios)
+then load only the columns they need and reduce them in one pass, with
+NumPy when it is installed and the stdlib array module otherwise.
+
+Building is incremental, as the session catalog's update is: rows of
+unchanged transcripts are carried over without reading them, and only new
+or changed transcripts are extracted. Extraction decodes assistant entries,
+which carry usage and tool calls, but takes a tool result's ID, outcome and
+timestamp straight from the raw line, so tool output is never decoded.
+
+Requires Python 3.8+. NumPy is optional.
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import re
+import sys
+from array import array
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import session_catalog
+import session_export as exporter
+
+try:
+    import numpy
+except ImportError:  # optional; queries then reduce array columns in Python
+    numpy = None
+
+SCHEMA_VERSION = 1
+
+# Column name and array typecode, per table. Arrays are stored in native byte order.
+TABLES = {
+    'usage': (('session', 'I'), ('day', 'i'), ('model', 'H'), ('messages', 'I'),
+              ('input', 'Q'), ('output', 'Q'), ('cache_creation', 'Q'), ('cache_read', 'Q')),
+    'tools': (('session', 'I'), ('day', 'i'), ('tool', 'H'), ('latency_ms', 'q'),
+              ('status', 'B')),
+}
+TOKEN_COLUMNS = ('input', 'output', 'cache_creation', 'cache_read')
+
+# Tool call outcomes in the status column
+UNANSWERED, OK, ERROR = 0, 1, 2
+
+# Tool results are located without decoding their line. Quotes inside JSON
+# strings are escaped, so these can only match the entry's own structure.
+TYPE_RE = re.compile(rb'"type"\s*:\s*"([^"\\]*)"')
+TOOL_RESULT_RE = re.compile(rb'"type"\s*:\s*"tool_result"')
+RESULT_FIELDS_RE = re.compile(rb'"(tool_use_id|timestamp)"\s*:\s*"([^"\\]*)"|"is_error"\s*:\s*(true)')
+ASSISTANT_RE = re.compile(rb'"type"\s*:\s*"assistant"')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+PERCENTILES = (50, 90, 99)
+
+
+def get_store_path():
+    """The analytics store lives beside the session catalog."""
+    return session_catalog.get_catalog_path().parent / "analytics"
+
+
+def parse_timestamp(value):
+    """Parse a transcript timestamp to an aware datetime, or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        # fromisoformat only accepts a trailing Z from Python 3.11
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def day_number(moment):
+    """Days since 1970-01-01 of a datetime's UTC date; -1 when unknown."""
+    if moment is None:
+        return -1
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.toordinal() - EPOCH_ORDINAL
+
+
+def _tool_results(line):
+    """(tool_use_id, is_error, timestamp) for each tool result in a raw user line.
+
+    The IDs, outcome and entry timestamp are read from the raw bytes. Only
+    when that would be ambiguous (several timestamps, or an error flag on a
+    line with several results) is the line decoded.
+    """
+    ids, stamps, is_error = [], set(), False
+    for key, value, error in RESULT_FIELDS_RE.findall(line):
+        if error:
+            is_error = True
+        elif key == b'tool_use_id':
+            ids.append(value)
+        else:
+            stamps.add(value)
+    if len(stamps) == 1 and not (is_error and len(set(ids)) > 1):
+        timestamp = parse_timestamp(stamps.pop().decode('utf-8', 'replace'))
+        return [(tool_use_id.decode('utf-8', 'replace'), is_error, timestamp)
+                for tool_use_id in dict.fromkeys(ids)]
+
+    entry = exporter.decode_entry(line)
+    if not isinstance(entry, dict):
+        return []
+    timestamp = parse_timestamp(entry.get('timestamp'))
+    content = entry.get('message', {}).get('content', [])
+    return [(block.get('tool_use_id'), bool(block.get('is_error')), timestamp)
+            for block in content if isinstance(content, list) and isinstance(block, dict)
+            and block.get('type') == 'tool_result']
+
+
+def extract_session(path):
+    """Read one transcript's message and tool-call rows.
+
+    Returns (usage, tools): usage as (model, day, messages, input, output,
+    cache_creation, cache_read) per model and day, and tools as (tool, day,
+    latency_ms, status) per call. Claude Code writes one entry per content
+    block, each repeating its API message's usage, so usage is counted once
+    per message ID, from the message's last entry.
+    """
+    messages = {}  # message ID -> row
+    tools = {}  # tool_use_id -> [tool, day, started, latency_ms, status]
+    with exporter.open_transcript(path) as f:
+        for line in f:
+            # An entry's own type comes before its message, so the first type is the entry's
+            first = TYPE_RE.search(line)
+            kind = first.group(1) if first else None
+            if kind != b'assistant' and TOOL_RESULT_RE.search(line):
+                try:
+                    results = _tool_results(line)
+                except ValueError:
+                    continue
+                for tool_use_id, is_error, finished in results:
+                    call = tools.get(tool_use_id)
+                    if call is None or call[4] != UNANSWERED:
+                        continue
+                    if call[2] is not None and finished is not None:
+                        call[3] = round((finished - call[2]).total_seconds() * 1000)
+                    call[4] = ERROR if is_error else OK
+                continue
+            if kind != b'assistant' and not ASSISTANT_RE.search(line):
+                continue
+            try:
+                entry = exporter.decode_entry(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict) or entry.get('type') != 'assistant':
+                continue
+
+            message = entry.get('message', {})
+            started = parse_timestamp(entry.get('timestamp'))
+            day = day_number(started)
+            usage = message.get('usage')
+            if isinstance(usage, dict):
+                key = message.get('id') or entry.get('requestId') or entry.get('uuid')
+                previous = messages.get(key)
+                messages[key] = (message.get('model') or 'unknown',
+                                 previous[1] if previous is not None else day,
+                                 *(int(usage.get(f"{name}_tokens") or 0) for name in
+                                   ('input', 'output', 'cache_creation_input',
+                                    'cache_read_input')))
+            content = message.get('content', [])
+            if isinstance(content, list):
+                for block in content:
+                    if isinstance(block, dict) and block.get('type') == 'tool_use':
+                        tools.setdefault(block.get('id'),
+                                         [block.get('name', 'Unknown'), day, started, 0,
+                                          UNANSWERED])
+    usage = {}
+    for model, day, *tokens in messages.values():
+        sums = usage.setdefault((model, day), [0] * (1 + len(tokens)))
+        sums[0] += 1
+        for i, value in enumerate(tokens, 1):
+            sums[i] += value
+    return ([(model, day, *sums) for (model, day), sums in usage.items()],
+            [(tool, day, latency, status) for tool, day, _, latency, status in tools.values()])
+
+
+class Store:
+    """The columnar store: one array per column, and a manifest describing them.
+
+    Each build writes its column files under a new generation number and
+    then replaces the manifest, so a reader never sees columns from two
+    builds; files of older generations are removed afterwards.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else get_store_path()
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.path / "manifest.json") as f:
+                manifest = json.load(f)
+            if manifest.get('schema') == SCHEMA_VERSION and manifest.get('byteorder') == sys.byteorder:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'schema': SCHEMA_VERSION, 'byteorder': sys.byteorder, 'generation': 0,
+                'models': [], 'tools': [], 'sessions': {}, 'rows': {'usage': 0, 'tools': 0}}
+
+    def _column_path(self, generation, table, column):
+        return self.path / f"{generation}.{table}.{column}"
+
+    def column(self, table, name, as_array=False):
+        """Load one column: a NumPy array when NumPy is installed, else (or with
+        as_array) an array.array."""
+        typecode = dict(TABLES[table])[name]
+        path = self._column_path(self.manifest['generation'], table, name)
+        if numpy is not None and not as_array:
+            return numpy.fromfile(path, dtype=typecode) if path.exists() \
+                else numpy.zeros(0, dtype=typecode)
+        values = array(typecode)
+        if path.exists():
+            values.frombytes(path.read_bytes())
+        return values
+
+    def session_names(self):
+        """Session UUIDs by their index in the session column."""
+        return list(self.manifest['sessions'])
+
+    def update(self, sources, verbose=False):
+        """Bring the store up to date; return (extracted, carried, removed) session counts.
+
+        Sessions stored by an earlier build from other sources are kept while
+        their transcript still exists.
+        """
+        old = self.manifest
+        sessions = {uuid: Path(entry['path']) for uuid, entry in old['sessions'].items()
+                    if Path(entry['path']).exists()}
+        sessions.update(session_catalog.collect_sessions(sources))
+        models = {name: i for i, name in enumerate(old['models'])}
+        tools = {name: i for i, name in enumerate(old['tools'])}
+        old_columns = {table: {name: self.column(table, name, as_array=True)
+                               for name, _ in columns}
+                       for table, columns in TABLES.items()} if old['generation'] else None
+        columns = {table: {name: array(typecode) for name, typecode in spec}
+                   for table, spec in TABLES.items()}
+
+        extracted = carried = 0
+        manifest_sessions = {}
+        for uuid, path in sorted(sessions.items()):
+            index = len(manifest_sessions)
+            stat = path.stat()
+            previous = old['sessions'].get(uuid)
+            ranges = {}
+            if old_columns is not None and previous is not None \
+                    and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+                for table, spec in TABLES.items():
+                    start, end = previous[table]
+                    ranges[table] = [len(columns[table]['session']),
+                                     len(columns[table]['session']) + end - start]
+                    for name, typecode in spec:
+                        if name == 'session':
+                            columns[table][name].extend([index] * (end - start))
+                        else:
+                            columns[table][name].extend(old_columns[table][name][start:end])
+                carried += 1
+            else:
+                try:
+                    usage_rows, tool_rows = extract_session(path)
+                except (OSError, EOFError) as e:
+                    print(f"✗ {uuid} ({path}): {e}", file=sys.stderr)
+                    continue
+                table = columns['usage']
+                ranges['usage'] = [len(table['session']), len(table['session']) + len(usage_rows)]
+                for model, day, messages, *tokens in usage_rows:
+                    table['session'].append(index)
+                    table['day'].append(day)
+                    table['model'].append(models.setdefault(model, len(models)))
+                    table['messages'].append(messages)
+                    for name, value in zip(TOKEN_COLUMNS, tokens):
+                        table[name].append(value)
+                table = columns['tools']
+                ranges['tools'] = [len(table['session']), len(table['session']) + len(tool_rows)]
+                for tool, day, latency, status in tool_rows:
+                    table['session'].append(index)
+                    table['day'].append(day)
+                    table['tool'].append(tools.setdefault(tool, len(tools)))
+                    table['latency_ms'].append(latency)
+                    table['status'].append(status)
+                extracted += 1
+                if verbose:
+                    print(f"  extracted {uuid}: {sum(row[2] for row in usage_rows)} messages, "
+                          f"{len(tool_rows)} tool calls")
+            manifest_sessions[uuid] = {'path': str(path), 'size': stat.st_size,
+                                       'mtime': stat.st_mtime, **ranges}
+
+        removed = len(set(old['sessions']) - set(manifest_sessions))
+        self._write(columns, {
+            'schema': SCHEMA_VERSION,
+            'byteorder': sys.byteorder,
+            'generation': old['generation'] + 1,
+            'models': list(models),
+            'tools': list(tools),
+            'sessions': manifest_sessions,
+            'rows': {table: len(columns[table]['session']) for table in TABLES}
+        })
+        return extracted, carried, removed
+
+    def _write(self, columns, manifest):
+        self.path.mkdir(parents=True, exist_ok=True, mode=0o700)
+        generation = manifest['generation']
+        for table, spec in TABLES.items():
+            for name, _ in spec:
+                fd = os.open(self._column_path(generation, table, name),
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    columns[table][name].tofile(f)
+
+        temp_path = self.path / f".manifest_{os.getpid()}.json"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.path / "manifest.json")
+        self.manifest = manifest
+
+        for path in self.path.iterdir():
+            prefix = path.name.split('.', 1)[0]
+            if prefix.isdigit() and int(prefix) != generation:
+                path.unlink(missing_ok=True)
+
+
+def _mask(store, table, since=None, until=None, session=None, name=None, name_column=None):
+    """Row indices of a table passing the filters, or None for all rows.
+
+    name restricts name_column (model or tool) to IDs whose name contains
+    that substring.
+    """
+    conditions = []
+    if since or until:
+        days = store.column(table, 'day')
+        low = date.fromisoformat(since[:10]).toordinal() - EPOCH_ORDINAL if since else None
+        high = date.fromisoformat(until[:10]).toordinal() - EPOCH_ORDINAL if until else None
+        conditions.append((days, low, high))
+    if session:
+        sessions = store.session_names()
+        index = sessions.index(session) if session in sessions else -1
+        conditions.append((store.column(table, 'session'), index, index + 1))
+    wanted = None
+    if name:
+        wanted = {i for i, known in enumerate(store.manifest[name_column + 's']) if name in known}
+    if not conditions and wanted is None:
+        return None
+
+    if numpy is not None:
+        keep = numpy.ones(store.manifest['rows'][table], dtype=bool)
+        for values, low, high in conditions:
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values < high
+        if wanted is not None:
+            keep &= numpy.isin(store.column(table, name_column), list(wanted))
+        return numpy.flatnonzero(keep)
+
+    keep = range(store.manifest['rows'][table])
+    for values, low, high in conditions:
+        keep = [i for i in keep if (low is None or values[i] >= low)
+                and (high is None or values[i] < high)]
+    if wanted is not None:
+        ids = store.column(table, name_column)
+        keep = [i for i in keep if ids[i] in wanted]
+    return keep
+
+
+def _take(values, rows):
+    """The column restricted to rows (None keeps every row)."""
+    if rows is None:
+        return values
+    if numpy is not None:
+        return values[rows]
+    return [values[i] for i in rows]
+
+
+def group_sums(keys, values):
+    """Sum each value column per distinct key tuple; return {key tuple: [sums]}."""
+    if not len(keys[0]):
+        return {}
+    if numpy is not None:
+        stacked = numpy.stack([numpy.asarray(k, dtype=numpy.int64) for k in keys], axis=1)
+        unique, inverse = numpy.unique(stacked, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sums = [numpy.bincount(inverse, weights=numpy.asarray(v, dtype=numpy.float64),
+                               minlength=len(unique)) for v in values]
+        return {tuple(int(k) for k in key): [int(round(s[i])) for s in sums]
+                for i, key in enumerate(unique)}
+    groups = {}
+    for key, row in zip(zip(*keys), zip(*values)):
+        sums = groups.get(key)
+        if sums is None:
+            groups[key] = list(row)
+        else:
+            for i, value in enumerate(row):
+                sums[i] += value
+    return groups
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending sequence."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def format_day(day):
+    return '-' if day < 0 else date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+def query_tokens(store, by=('model', 'day'), since=None, until=None, model=None, session=None):
+    """Token totals per group: a list of dicts with the group keys, messages and token sums."""
+    rows = _mask(store, 'usage', since, until, session, model, 'model')
+    sessions = store.session_names()
+    keys = [_take(store.column('usage', name), rows) for name in by]
+    sums = [_take(store.column('usage', name), rows) for name in ('messages',) + TOKEN_COLUMNS]
+    results = []
+    for key, sums in group_sums(keys, sums).items():
+        row = {}
+        for name, value in zip(by, key):
+            row[name] = (store.manifest['models'][value] if name == 'model'
+                         else format_day(value) if name == 'day' else sessions[value])
+        row['messages'] = sums[0]
+        row.update(zip(TOKEN_COLUMNS, sums[1:]))
+        row['total'] = sum(sums[1:])
+        results.append(row)
+    return sorted(results, key=lambda row: tuple(row[name] for name in by))
+
+
+def query_cache(store, by=('model',), since=None, until=None, model=None, session=None):
+    """Cache-hit ratio per group: cache reads over all input tokens."""
+    results = query_tokens(store, by, since, until, model, session)
+    for row in results:
+        prompt = row['input'] + row['cache_creation'] + row['cache_read']
+        row['cache_hit_ratio'] = round(row['cache_read'] / prompt, 4) if prompt else None
+    return results
+
+
+def query_tools(store, since=None, until=None, tool=None, session=None):
+    """Per tool: calls, errors, unanswered calls and latency percentiles (ms)."""
+    rows = _mask(store, 'tools', since, until, session, tool, 'tool')
+    ids = _take(store.column('tools', 'tool'), rows)
+    latency = _take(store.column('tools', 'latency_ms'), rows)
+    status = _take(store.column('tools', 'status'), rows)
+
+    per_tool = {}
+    if numpy is not None:
+        for tool_id in numpy.unique(ids):
+            selected = ids == tool_id
+            answered = selected & (status != UNANSWERED)
+            per_tool[int(tool_id)] = (int(selected.sum()),
+                                      int((selected & (status == ERROR)).sum()),
+                                      numpy.sort(latency[answered]))
+    else:
+        calls = collections.Counter(ids)
+        errors = collections.Counter(tool_id for tool_id, outcome in zip(ids, status)
+                                     if outcome == ERROR)
+        times = collections.defaultdict(list)
+        for tool_id, ms, outcome in zip(ids, latency, status):
+            if outcome != UNANSWERED:
+                times[tool_id].append(ms)
+        per_tool = {tool_id: (count, errors[tool_id], sorted(times[tool_id]))
+                    for tool_id, count in calls.items()}
+
+    results = []
+    for tool_id, (calls, errors, times) in per_tool.items():
+        row = {'tool': store.manifest['tools'][tool_id], 'calls': calls, 'errors': errors,
+               'unanswered': calls - len(times)}
+        for p in PERCENTILES:
+            row[f"p{p}_ms"] = int(percentile(times, p)) if len(times) else None
+        row['max_ms'] = int(times[-1]) if len(times) else None
+        results.append(row)
+    return sorted(results, key=lambda row: -row['calls'])
+
+
+def print_table(rows, columns):
+    """Print rows as aligned columns."""
+    if not rows:
+        print("  (no rows)")
+        return
+    cells = [[str(row[name]) if row[name] is not None else '-' for name in columns]
+             for row in rows]
+    widths = [max(len(name), *(len(line[i]) for line in cells)) for i, name in enumerate(columns)]
+    print('  '.join(name.ljust(width) for name, width in zip(columns, widths)))
+    for line in cells:
+        print('  '.join(cell.rjust(width) if cell.lstrip('-')[:1].isdigit() else cell.ljust(width)
+                        for cell, width in zip(line, widths)))
+
+
+def cmd_build(args):
+    store = Store(args.store)
+    extracted, carried, removed = store.update(args.sources or [session_catalog.DEFAULT_SOURCE],
+                                               args.verbose)
+    rows = store.manifest['rows']
+    print(f"✓ Analytics updated: {extracted} extracted, {carried} unchanged, {removed} removed "
+          f"({len(store.manifest['sessions'])} sessions, {rows['usage']} usage rows, "
+          f"{rows['tools']} tool calls)")
+
+
+def _emit(args, rows, columns):
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print_table(rows, columns)
+
+
+def cmd_tokens(args):
+    by = args.by.split(',')
+    rows = query_tokens(Store(args.store), by, args.since, args.until, args.model, args.session)
+    _emit(args, rows, by + ['messages', *TOKEN_COLUMNS, 'total'])
+
+
+def cmd_cache(args):
+    by = args.by.split(',')
+    rows = query_cache(Store(args.store), by, args.since, args.until, args.model, args.session)
+    _emit(args, rows, by + ['messages', 'input', 'cache_creation', 'cache_read',
+                            'cache_hit_ratio'])
+
+
+def cmd_tools(args):
+    rows = query_tools(Store(args.store), args.since, args.until, args.tool, args.session)
+    _emit(args, rows, ['tool', 'calls', 'errors', 'unanswered',
+                       *(f"p{p}_ms" for p in PERCENTILES), 'max_ms'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token, model and tool analytics for sessions")
+    parser.add_argument("--store", help="Analytics store directory (default: beside the catalog)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_p = subparsers.add_parser("build", help="Extract new and changed transcripts")
+    build_p.add_argument("sources", nargs="*",
+                         help=f"Directories or globs (default: {session_catalog.DEFAULT_SOURCE})")
+    build_p.add_argument("-v", "--verbose", action="store_true", help="Name each extracted session")
+
+    def add_filters(sub):
+        sub.add_argument("--since", help="On or after this ISO date")
+        sub.add_argument("--until", help="Before this ISO date")
+        sub.add_argument("--session", help="Restrict to one session UUID")
+        sub.add_argument("--json", action="store_true", help="Emit JSON Lines")
+
+    def grouping(value):
+        keys = value.split(',')
+        if not keys or any(key not in ('model', 'day', 'session') for key in keys):
+            raise argparse.ArgumentTypeError("group by model, day and/or session")
+        return value
+
+    tokens_p = subparsers.add_parser("tokens", help="Token totals, by model per day by default")
+    tokens_p.add_argument("--by", type=grouping, default="model,day",
+                          help="Comma list of model, day, session (default: model,day)")
+    tokens_p.add_argument("--model", help="Model ID substring (e.g. opus)")
+    add_filters(tokens_p)
+
+    cache_p = subparsers.add_parser("cache", help="Prompt-cache hit ratio, by model by default")
+    cache_p.add_argument("--by", type=grouping, default="model",
+                         help="Comma list of model, day, session (default: model)")
+    cache_p.add_argument("--model", help="Model ID substring (e.g. opus)")
+    add_filters(cache_p)
+
+    tools_p = subparsers.add_parser("tools", help="Tool-call counts, errors and latency percentiles")
+    tools_p.add_argument("--tool", help="Tool name substring")
+    add_filters(tools_p)
+
+    args = parser.parse_args()
+    {"build": cmd_build, "tokens": cmd_tokens, "cache": cmd_cache,
+     "tools": cmd_tools}[args.command](args)
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Deduplicating archive of rendered session transcripts.
+
+Sessions repeat a great deal of identical material: the same files are read
+again and again, the same context is re-injected after every compaction, and
+the same tool output recurs across sessions. An archived session is stored
+as a thin refs file instead of a full /export-style text: every rendered
+block of at least CHUNK_MIN_BYTES (tool results, long prompts and replies)
+is written once to a shared content-addressed chunk store, keyed by its
+SHA-256, and the refs file lists those keys with the small text between
+them inline. `restore` reassembles the exact text export-session.py writes.
+
+Layout, for an archive directory such as knowledge/sources/raw/:
+
+    <name>.txt.refs          one per session
+    chunks/ab/ab12…          one file per distinct block
+    chunks/archives          the directories whose refs files use the store
+    chunks/.lock             held shared while archiving, exclusively by gc
+
+A refs file starts with a `session-archive` line recording the format
+version, the chunk directory (relative to the refs file, percent-encoded so
+it holds no spaces) and the SHA-256 and size of the transcript it was
+rendered from. Records follow: `L <n>` then n
+bytes of inline text, or `C <sha256> <n>` for a chunk. Re-archiving a
+transcript whose digest matches the existing refs file is skipped, and
+chunks already in the store are never rewritten.
+
+Requires Python 3.8+.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import urllib.parse
+from pathlib import Path
+
+import session_export as exporter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ARCHIVE_VERSION = 1
+REFS_SUFFIX = '.refs'
+CHUNKS_DIR = 'chunks'
+# In the chunk store: each archive directory that uses it, relative to the store
+ARCHIVES_FILE = 'archives'
+TEMP_PREFIX = '.tmp_'
+LOCK_FILE = '.lock'
+# Rendered blocks at least this large go to the chunk store; smaller ones stay inline
+CHUNK_MIN_BYTES = 1024
+READ_BYTES = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """A refs file or chunk that cannot be read back."""
+
+
+class ChunkStore:
+    """Content-addressed blocks, each stored once at <path>/<2 hex>/<sha256 hex>."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.added = 0
+        self.added_bytes = 0
+
+    def chunk_path(self, digest):
+        return self.path / digest[:2] / digest
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        """Hold the store lock: shared while archiving, exclusive while collecting garbage.
+
+        A chunk an archive has stored, or is about to reuse, is unreferenced
+        until its refs file is in place, so gc must not run in between.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # no shared locks; always exclusive
+            yield
+        finally:
+            os.close(fd)  # releases the lock
+
+    def register(self, archive_dir):
+        """Record that refs files in archive_dir use this store, so gc can check for them."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry = os.path.relpath(Path(archive_dir).resolve(), self.path.resolve())
+        if entry not in (self.archive_dirs(resolve=False) or []):
+            with open(self.path / ARCHIVES_FILE, 'a', encoding='utf-8') as f:
+                f.write(entry + '\n')
+
+    def archive_dirs(self, resolve=True):
+        """The registered archive directories, or None for a store that predates the list."""
+        try:
+            entries = (self.path / ARCHIVES_FILE).read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return None
+        if not resolve:
+            return entries
+        return [(self.path / entry).resolve() for entry in entries if entry]
+
+    def put(self, data):
+        """Store a block unless it is already present; return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(f"{TEMP_PREFIX}{os.getpid()}_{digest}")
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self.added += 1
+            self.added_bytes += len(data)
+        return digest
+
+    def get(self, digest, size=None, verify=False):
+        """Read a block back, checking its size (and with verify, its digest)."""
+        try:
+            data = self.chunk_path(digest).read_bytes()
+        except OSError as e:
+            raise ArchiveError(f"Missing chunk {digest}: {e}") from None
+        if size is not None and len(data) != size:
+            raise ArchiveError(f"Chunk {digest} is {len(data)} bytes, expected {size}")
+        if verify and hashlib.sha256(data).hexdigest() != digest:
+            raise ArchiveError(f"Chunk {digest} does not match its digest")
+        return data
+
+
+class RefsWriter:
+    """Binary file stand-in for write_rendered that writes refs records.
+
+    write_rendered writes each rendered line (a whole tool result, prompt or
+    reply block) in one call, so every write of at least min_bytes becomes a
+    chunk; smaller writes are buffered and written as one inline record.
+    """
+
+    def __init__(self, f, store, min_bytes=CHUNK_MIN_BYTES):
+        self.f = f
+        self.store = store
+        self.min_bytes = min_bytes
+        self.literal = bytearray()
+        self.written = 0
+        self.chunks = 0
+        self.chunk_bytes = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if len(data) < self.min_bytes:
+            self.literal += data
+            return len(data)
+        self.flush()
+        digest = self.store.put(data)
+        self.f.write(f"C {digest} {len(data)}\n".encode('ascii'))
+        self.chunks += 1
+        self.chunk_bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        if self.literal:
+            self.f.write(f"L {len(self.literal)}\n".encode('ascii'))
+            self.f.write(self.literal)
+            self.literal.clear()
+
+
+def source_digest(path):
+    """SHA-256 and size of a transcript's bytes as stored."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(READ_BYTES)
+            if not data:
+                break
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+
+def refs_path_for(output_path):
+    """The refs file for an export path (session.txt -> session.txt.refs)."""
+    output_path = Path(output_path)
+    return output_path if output_path.name.endswith(REFS_SUFFIX) else \
+        output_path.with_name(output_path.name + REFS_SUFFIX)
+
+
+def read_refs_header(refs_path):
+    """Parse a refs file's first line into a dict of its fields."""
+    with open(refs_path, 'rb') as f:
+        return _parse_header(f.readline(), refs_path)
+
+
+def _parse_header(line, refs_path):
+    fields = line.decode('utf-8', 'replace').rstrip('\n').split(' ', 2)
+    if len(fields) < 2 or fields[0] != 'session-archive':
+        raise ArchiveError(f"Not a session archive: {refs_path}")
+    if fields[1] != str(ARCHIVE_VERSION):
+        raise ArchiveError(f"Unsupported archive version {fields[1]}: {refs_path}")
+    header = {}
+    # key=value fields; values are percent-encoded, so none contains a space
+    for field in fields[2].split(' ') if len(fields) == 3 else []:
+        key, sep, value = field.partition('=')
+        if sep:
+            header[key] = urllib.parse.unquote(value)
+    header['size'] = int(header.get('size', -1))
+    return header
+
+
+def archive_session(jsonl_path, output_path, chunks_dir=None, min_bytes=CHUNK_MIN_BYTES):
+    """Render a session into a refs file and the shared chunk store.
+
+    output_path names the export (its refs file is output_path + .refs);
+    chunks_dir defaults to chunks/ beside it. Returns a stats dict; its
+    'up_to_date' is True when the refs file already describes this exact
+    transcript and every chunk it names is present, in which case nothing
+    is rendered or written. Holds the store lock shared throughout, so a
+    concurrent gc cannot remove chunks the new refs file will name.
+    """
+    refs_path = refs_path_for(output_path)
+    refs_path.parent.mkdir(parents=True, exist_ok=True)
+    store = ChunkStore(chunks_dir or refs_path.parent / CHUNKS_DIR)
+    with store.lock():
+        store.register(refs_path.parent)
+        return _archive_locked(jsonl_path, refs_path, store, min_bytes)
+
+
+def _archive_locked(jsonl_path, refs_path, store, min_bytes):
+    """archive_session with the store lock held."""
+    digest, size = source_digest(jsonl_path)
+
+    stats = {'refs': refs_path, 'up_to_date': False, 'rendered_bytes': 0, 'chunks': 0,
+             'chunk_bytes': 0, 'new_chunks': 0, 'new_chunk_bytes': 0}
+    if refs_path.exists():
+        try:
+            header = read_refs_header(refs_path)
+            if header.get('source') == digest and header['size'] == size and \
+                    all(store.chunk_path(d).exists() for d, _ in iter_chunk_refs(refs_path)):
+                stats['up_to_date'] = True
+                return stats
+        except (ArchiveError, ValueError, OSError):
+            pass  # unreadable: archive it afresh
+
+    counters = exporter.new_session_counters()
+    chunk_dir = os.path.relpath(store.path, refs_path.parent)
+    temp_path = refs_path.parent / f".tmp_{os.getpid()}_{refs_path.name}"
+    try:
+        with exporter.open_transcript(jsonl_path) as src, tempfile.TemporaryFile() as body:
+            body_writer = RefsWriter(body, store, min_bytes)
+            exporter.write_rendered(body_writer, exporter.iter_records(src), counters)
+            body_writer.flush()
+
+            header = exporter.format_header(exporter.session_info_from_counters(counters))
+            with open(temp_path, 'wb') as f:
+                f.write(f"session-archive {ARCHIVE_VERSION} "
+                        f"chunks={urllib.parse.quote(chunk_dir)} "
+                        f"source={digest} size={size}\n".encode('utf-8'))
+                header_writer = RefsWriter(f, store, min_bytes)
+                header_writer.write(header.encode('utf-8'))
+                header_writer.flush()
+                body.seek(0)
+                shutil.copyfileobj(body, f)
+        os.replace(temp_path, refs_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    stats.update(rendered_bytes=header_writer.written + body_writer.written,
+                 chunks=header_writer.chunks + body_writer.chunks,
+                 chunk_bytes=header_writer.chunk_bytes + body_writer.chunk_bytes,
+                 new_chunks=store.added, new_chunk_bytes=store.added_bytes)
+    return stats
+
+
+def iter_chunk_refs(refs_path):
+    """Yield (digest, size) for each chunk a refs file names, in order."""
+    with open(refs_path, 'rb') as f:
+        _parse_header(f.readline(), refs_path)
+        for kind, value, size in _records(f, refs_path):
+            if kind == 'C':
+                yield value, size
+
+
+def _records(f, refs_path):
+    """Yield ('L', None, n) and ('C', digest, n) records, leaving f after each
+    inline record's tag so the caller can read (or skip) its bytes."""
+    while True:
+        tag = f.readline()
+        if not tag:
+            return
+        fields = tag.split()
+        try:
+            if fields[0] == b'L' and len(fields) == 2:
+                size = int(fields[1])
+                position = f.tell()
+                yield 'L', None, size
+                if f.tell() == position:
+                    f.seek(size, os.SEEK_CUR)
+            elif fields[0] == b'C' and len(fields) == 3:
+                yield 'C', fields[1].decode('ascii'), int(fields[2])
+            else:
+                raise ValueError
+        except (ValueError, IndexError, UnicodeDecodeError):
+            raise ArchiveError(f"Corrupt refs file {refs_path}: bad record {tag[:80]!r}") from None
+
+
+def restore(refs_path, out, verify=False):
+    """Write the exact export text a refs file describes to a binary file; return its size."""
+    refs_path = Path(refs_path)
+    written = 0
+    with open(refs_path, 'rb') as f:
+        header = _parse_header(f.readline(), refs_path)
+        store = ChunkStore(refs_path.parent / header.get('chunks', CHUNKS_DIR))
+        for kind, digest, size in _records(f, refs_path):
+            data = f.read(size) if kind == 'L' else store.get(digest, size, verify)
+            if len(data) != size:
+                raise ArchiveError(f"Corrupt refs file {refs_path}: truncated inline text")
+            out.write(data)
+            written += size
+    return written
+
+
+def collect_garbage(archive_dirs, chunks_dir=None):
+    """Remove chunks no refs file under archive_dirs names; return (removed, freed bytes).
+
+    archive_dirs is one directory or a list; the store defaults to chunks/ in
+    the first. Every directory the store has registered (and that still
+    exists) must be given or lie under one that is, since its refs files may
+    name chunks the others do not; a custom store that predates registration
+    is refused outright. Runs under the store lock, so it waits for archives
+    in progress; temp files of chunks are left alone.
+    """
+    if isinstance(archive_dirs, (str, os.PathLike)):
+        archive_dirs = [archive_dirs]
+    archive_dirs = [Path(d).resolve() for d in archive_dirs]
+    store = ChunkStore(chunks_dir or archive_dirs[0] / CHUNKS_DIR)
+    with store.lock(exclusive=True):
+        return _collect_locked(archive_dirs, store, chunks_dir is not None)
+
+
+def _collect_locked(archive_dirs, store, custom_store):
+    """collect_garbage with the store lock held exclusively."""
+    registered = store.archive_dirs()
+    if registered is None and custom_store:
+        raise ArchiveError(f"{store.path} does not record which archive directories use it; "
+                           f"archive into each of them again before collecting garbage")
+    missing = [str(d) for d in registered or []
+               if d.is_dir() and not any(d == a or a in d.parents for a in archive_dirs)]
+    if missing:
+        raise ArchiveError(f"{store.path} is also used by {', '.join(missing)}; "
+                           f"name every archive directory that uses it")
+
+    referenced = set()
+    for archive_dir in archive_dirs:
+        for refs_path in archive_dir.rglob(f"*{REFS_SUFFIX}"):
+            referenced.update(digest for digest, _ in iter_chunk_refs(refs_path))
+    removed = freed = 0
+    for path in store.path.glob('??/*'):
+        if path.name.startswith(TEMP_PREFIX):
+            continue  # a chunk being written; os.replace gives it its digest name
+        if path.name not in referenced:
+            freed += path.stat().st_size
+            path.unlink()
+            removed += 1
+    return removed, freed
+
+
+def print_stats(stats):
+    if stats['up_to_date']:
+        print(f"✓ Already archived: {stats['refs']}")
+        return
+    stored = stats['refs'].stat().st_size + stats['new_chunk_bytes']
+    print(f"✓ Archived session to: {stats['refs']}")
+    print(f"  Rendered: {stats['rendered_bytes'] / 1024:.1f} KB, "
+          f"{stats['chunks']} blocks in chunks ({stats['chunk_bytes'] / 1024:.1f} KB)")
+    print(f"  Written: {stored / 1024:.1f} KB ({stats['new_chunks']} new chunks)")
+
+
+def cmd_archive(args):
+    if args.batch:
+        sessions = exporter.find_session_files(args.batch)
+        if not sessions:
+            print(f"✗ Error: No session transcripts match: {args.batch}")
+            sys.exit(1)
+        targets = [(path, Path(args.out_dir) / f"{uuid}.txt")
+                   for uuid, path in sorted(sessions.items())]
+    elif args.session and args.output:
+        targets = [(args.session, Path(args.output))]
+    else:
+        print("✗ Error: Name a session and output, or --batch with --out-dir")
+        sys.exit(1)
+
+    totals = {'rendered_bytes': 0, 'written': 0, 'up_to_date': 0}
+    failed = False
+    for session, output in targets:
+        try:
+            stats = archive_session(session, output, args.chunks, args.min_bytes)
+        except (exporter.ExportError, OSError) as e:
+            print(f"✗ {session}: {e}")
+            failed = True
+            continue
+        if not args.batch:
+            print_stats(stats)
+        elif stats['up_to_date']:
+            totals['up_to_date'] += 1
+        else:
+            totals['rendered_bytes'] += stats['rendered_bytes']
+            totals['written'] += stats['refs'].stat().st_size + stats['new_chunk_bytes']
+    if args.batch:
+        print(f"✓ Archived {len(targets)} sessions to: {args.out_dir} "
+              f"({totals['up_to_date']} already archived)")
+        print(f"  Rendered: {totals['rendered_bytes'] / 1024:.1f} KB, "
+              f"written: {totals['written'] / 1024:.1f} KB")
+    if failed:
+        sys.exit(1)
+
+
+def cmd_restore(args):
+    try:
+        if args.output == '-':
+            restore(args.refs, sys.stdout.buffer, args.verify)
+            return
+        output = Path(args.output or str(args.refs)[:-len(REFS_SUFFIX)])
+        temp_path = output.parent / f".tmp_{os.getpid()}_{output.name}"
+        try:
+            with open(temp_path, 'wb') as out:
+                size = restore(args.refs, out, args.verify)
+            os.replace(temp_path, output)
+        finally:
+            temp_path.unlink(missing_ok=True)
+    except (ArchiveError, OSError) as e:
+        print(f"✗ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✓ Restored {output} ({size / 1024:.1f} KB)")
+
+
+def cmd_gc(args):
+    try:
+        removed, freed = collect_garbage(args.archive_dirs, args.chunks)
+    except (ArchiveError, OSError) as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
+    print(f"✓ Removed {removed} unreferenced chunks ({freed / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicating archive of rendered sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_p = subparsers.add_parser("archive", help="Render sessions into refs files and chunks")
+    archive_p.add_argument("session", nargs="?", help="Session JSONL file")
+    archive_p.add_argument("output", nargs="?",
+                           help="Export path; the refs file is written beside it as <output>.refs")
+    archive_p.add_argument("--batch", metavar="DIR_OR_GLOB",
+                           help="Archive every top-level session transcript in a directory or glob")
+    archive_p.add_argument("--out-dir", default=".",
+                           help="Batch archive directory; refs are named <uuid>.txt.refs (default: .)")
+    archive_p.add_argument("--chunks", help="Chunk store (default: chunks/ beside the refs files)")
+    archive_p.add_argument("--min-bytes", type=int, default=CHUNK_MIN_BYTES,
+                           help=f"Smallest block stored as a chunk (default: {CHUNK_MIN_BYTES})")
+
+    restore_p = subparsers.add_parser("restore", help="Reassemble the exact export text")
+    restore_p.add_argument("refs", help="Refs file")
+    restore_p.add_argument("output", nargs="?",
+                           help="Output path, or - for stdout (default: the refs path without .refs)")
+    restore_p.add_argument("--verify", action="store_true", help="Check every chunk's digest")
+
+    gc_p = subparsers.add_parser("gc", help="Remove chunks no refs file in the archive names")
+    gc_p.add_argument("archive_dirs", nargs="+", metavar="archive_dir",
+                      help="Archive directories (all refs files under them count); "
+                           "name every directory that shares the chunk store")
+    gc_p.add_argument("--chunks", help="Chunk store (default: chunks/ in the first archive_dir)")
+
+    args = parser.parse_args()
+    {"archive": cmd_archive, "restore": cmd_restore, "gc": cmd_gc}[args.command](args)
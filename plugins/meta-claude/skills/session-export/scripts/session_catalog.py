@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Persistent SQLite catalog of Claude Code session transcripts.
+
+Records per-session metadata (the header fields session_export.py derives,
+plus timestamps and entry counts) so that finding a session is one indexed
+query instead of an export per file. Rows are keyed on the session UUID, the
+same `session:{uuid}` identity .commons.yml declares, so a transcript that
+moves between worktree project directories keeps one row.
+
+Updates are incremental: an unchanged file (same size and mtime) is skipped,
+a file that only grew is scanned from where the last scan stopped, and the
+row of a transcript that no longer exists is dropped.
+
+Requires Python 3.8+.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import session_export as exporter
+
+# All top-level transcripts in every project directory
+DEFAULT_SOURCE = "~/.claude/projects/*/"
+
+SCHEMA_VERSION = 1
+
+
+def get_catalog_path():
+    """Resolve XDG-compliant catalog path."""
+    xdg_data = os.environ.get("XDG_DATA_HOME", str(Path.home() / ".local" / "share"))
+    return Path(xdg_data) / "claude-plugins" / "session-export" / "catalog.db"
+
+
+def connect(path=None):
+    """Open (creating if needed) the catalog database."""
+    path = Path(path) if path else get_catalog_path()
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if not path.exists():
+        # Create with restricted permissions from the start: summaries and paths are private
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            uuid TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            version TEXT,
+            model TEXT,
+            cwd TEXT,
+            summary TEXT,
+            first_timestamp TEXT,
+            last_timestamp TEXT,
+            entries INTEGER NOT NULL DEFAULT 0,
+            entry_counts TEXT NOT NULL DEFAULT '{}',
+            compactions INTEGER NOT NULL DEFAULT 0,
+            scan_state TEXT NOT NULL DEFAULT '{}',
+            indexed_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_last_timestamp ON sessions(last_timestamp);
+        -- model and cwd are matched by substring, which no index serves
+        DROP INDEX IF EXISTS sessions_model;
+        DROP INDEX IF EXISTS sessions_cwd;
+    """)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def new_scan_state():
+    """Return empty running state for a transcript scan."""
+    return {
+        'offset': 0,
+        'fingerprint': None,
+        'counters': exporter.new_session_counters(),
+        'entry_counts': {},
+        'compactions': 0,
+        'first_timestamp': None,
+        'last_timestamp': None
+    }
+
+
+def update_scan_state(state, entry):
+    """Fold one entry into a scan state."""
+    exporter.update_session_counters(state['counters'], entry)
+    entry_type = entry.get('type', 'unknown')
+    state['entry_counts'][entry_type] = state['entry_counts'].get(entry_type, 0) + 1
+    if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+        state['compactions'] += 1
+    timestamp = entry.get('timestamp')
+    if isinstance(timestamp, str):
+        if state['first_timestamp'] is None or timestamp < state['first_timestamp']:
+            state['first_timestamp'] = timestamp
+        if state['last_timestamp'] is None or timestamp > state['last_timestamp']:
+            state['last_timestamp'] = timestamp
+
+
+def scan_transcript(path, state=None):
+    """Scan a transcript into a scan state, resuming from `state` if it still applies.
+
+    Only newline-terminated lines are consumed, so a line still being written
+    is picked up by the next scan. Lines that fail to decode are skipped: the
+    catalog describes sessions, it does not validate them. A compressed
+    transcript is rewritten rather than appended to, so it is always scanned
+    from the start.
+    """
+    if exporter.transcript_compression(path) is not None:
+        state = None
+    with exporter.open_transcript(path) as f:
+        if state is not None and (
+                os.fstat(f.fileno()).st_size < state['offset']
+                or exporter.source_fingerprint(f, state['offset']) != state['fingerprint']):
+            state = None  # rewritten or truncated, not appended to
+        if state is None:
+            state = new_scan_state()
+
+        f.seek(state['offset'])
+        offset = state['offset']
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                entry = exporter.decode_entry(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                update_scan_state(state, entry)
+
+        state['offset'] = offset
+        state['fingerprint'] = exporter.source_fingerprint(f, offset)
+    return state
+
+
+def collect_sessions(sources):
+    """Resolve several directories or globs to one absolute transcript path per UUID."""
+    sessions = {}
+    for source in sources:
+        for uuid, path in exporter.find_session_files(source).items():
+            current = sessions.get(uuid)
+            if current is None or path.stat().st_mtime > current.stat().st_mtime:
+                sessions[uuid] = path.resolve()
+    return sessions
+
+
+def update_catalog(conn, sources, verbose=False):
+    """Bring the catalog up to date with every transcript matching the sources.
+
+    Rows for sessions the sources did not turn up are dropped once their
+    recorded transcript is gone; a row outside the sources whose file still
+    exists is kept, so updating one project leaves the others alone.
+    Returns (scanned, moved, unchanged, removed) counts.
+    """
+    sessions = collect_sessions(sources)
+
+    scanned = moved = unchanged = removed = 0
+    for uuid, path in sorted(sessions.items()):
+        stat = path.stat()
+        row = conn.execute("SELECT path, size, mtime, scan_state FROM sessions WHERE uuid = ?",
+                           (uuid,)).fetchone()
+        if row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+            if row['path'] != str(path):
+                # Moved between project directories (worktree created or removed)
+                conn.execute("UPDATE sessions SET path = ? WHERE uuid = ?", (str(path), uuid))
+                moved += 1
+            else:
+                unchanged += 1
+            continue
+
+        previous = json.loads(row['scan_state']) if row is not None else None
+        try:
+            state = scan_transcript(path, previous or None)
+        except (OSError, EOFError) as e:
+            print(f"✗ {uuid} ({path}): {e}", file=sys.stderr)
+            continue
+        info = exporter.session_info_from_counters(state['counters'])
+        conn.execute("""
+            INSERT OR REPLACE INTO sessions (uuid, path, size, mtime, version, model, cwd,
+                summary, first_timestamp, last_timestamp, entries, entry_counts,
+                compactions, scan_state, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (uuid, str(path), stat.st_size, stat.st_mtime, info['version'], info['model'],
+              info['cwd'], info['summary'], state['first_timestamp'], state['last_timestamp'],
+              sum(state['entry_counts'].values()), json.dumps(state['entry_counts']),
+              state['compactions'], json.dumps(state),
+              datetime.now(timezone.utc).isoformat(timespec='seconds')))
+        scanned += 1
+        if verbose:
+            print(f"  indexed {uuid}")
+
+    for row in conn.execute("SELECT uuid, path FROM sessions").fetchall():
+        if row['uuid'] not in sessions and not os.path.exists(row['path']):
+            conn.execute("DELETE FROM sessions WHERE uuid = ?", (row['uuid'],))
+            removed += 1
+            if verbose:
+                print(f"  removed {row['uuid']}")
+    conn.commit()
+    return scanned, moved, unchanged, removed
+
+
+def query_sessions(conn, model=None, cwd=None, summary=None, since=None, until=None,
+                   limit=None):
+    """Return catalog rows matching every given filter, most recent first.
+
+    model, cwd and summary are substring matches, so they scan the table (one
+    row per session); since and until use the last_timestamp index.
+    """
+    clauses = []
+    params = []
+    if model:
+        clauses.append("model LIKE ?")
+        params.append(f"%{model}%")
+    if cwd:
+        clauses.append("cwd LIKE ?")
+        params.append(f"%{cwd}%")
+    if summary:
+        clauses.append("summary LIKE ?")
+        params.append(f"%{summary}%")
+    if since:
+        clauses.append("last_timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("first_timestamp < ?")
+        params.append(until)
+
+    sql = "SELECT * FROM sessions"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY last_timestamp DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def row_to_dict(row):
+    """Catalog row as a plain dict, without the internal scan state."""
+    data = dict(row)
+    data.pop('scan_state', None)
+    data['entry_counts'] = json.loads(data['entry_counts'])
+    return data
+
+
+def cmd_update(args):
+    conn = connect(args.db)
+    scanned, moved, unchanged, removed = update_catalog(
+        conn, args.sources or [DEFAULT_SOURCE], args.verbose)
+    total = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    print(f"✓ Catalog updated: {scanned} scanned, {moved} moved, {unchanged} unchanged, "
+          f"{removed} removed ({total} sessions)")
+
+
+def cmd_list(args):
+    conn = connect(args.db)
+    rows = query_sessions(conn, args.model, args.cwd, args.summary, args.since, args.until,
+                          args.limit)
+    for row in rows:
+        if args.json:
+            print(json.dumps(row_to_dict(row)))
+        else:
+            model = exporter.parse_model_display_name(row['model'])
+            print(f"{row['uuid']}  {row['last_timestamp'] or '-':24}  {model:10}  "
+                  f"{row['size'] / 1024:9.1f} KB  {row['summary'] or ''}")
+
+
+def cmd_get(args):
+    conn = connect(args.db)
+    row = conn.execute("SELECT * FROM sessions WHERE uuid = ?", (args.uuid,)).fetchone()
+    if row is None:
+        print(f"✗ Session {args.uuid} not in catalog", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(row_to_dict(row), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog Claude Code session transcripts")
+    parser.add_argument("--db", help="Catalog database (default: XDG data dir)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_p = subparsers.add_parser("update", help="Scan new and changed transcripts")
+    update_p.add_argument("sources", nargs="*",
+                          help=f"Directories or globs of transcripts (default: {DEFAULT_SOURCE})")
+    update_p.add_argument("-v", "--verbose", action="store_true", help="Name each scanned session")
+
+    list_p = subparsers.add_parser("list", help="List sessions, most recent first")
+    list_p.add_argument("--model", help="Model ID substring (e.g. opus)")
+    list_p.add_argument("--cwd", help="Working directory substring")
+    list_p.add_argument("--summary", help="Summary substring")
+    list_p.add_argument("--since", help="Active on or after this ISO date")
+    list_p.add_argument("--until", help="Started before this ISO date")
+    list_p.add_argument("--limit", type=int, help="Maximum rows")
+    list_p.add_argument("--json", action="store_true", help="Emit JSON Lines")
+
+    get_p = subparsers.add_parser("get", help="Show one session's catalog row")
+    get_p.add_argument("uuid", help="Session UUID")
+
+    args = parser.parse_args()
+    {"update": cmd_update, "list": cmd_list, "get": cmd_get}[args.command](args)
@@ -0,0 +1,2591 @@
+"""
+Export Claude Code session JSONL to UI-style readable text format.
+Mimics the output of the /export command.
+
+This is the importable exporter; export-session.py is its command line.
+export_session() returns an ExportResult and iter_events() yields a
+session's normalized events; failures raise ExportError rather than
+exiting, so one process can serve many exports.
+
+Requires Python 3.8+ (for f-strings, pathlib and unlink(missing_ok=True)).
+"""
+
+import abc
+import collections
+import concurrent.futures
+import contextlib
+import glob
+import gzip
+import hashlib
+import html
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib json module is the fallback
+    orjson = None
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:  # optional; zstd transcripts and outputs are then unsupported
+        zstd = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is then not reported
+    resource = None
+
+# Get home directory dynamically
+HOME_DIR = os.path.expanduser("~")
+
+# Compressed transcripts are recognised by magic bytes, compressed outputs by extension
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+OUTPUT_COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd'}
+TRANSCRIPT_SUFFIXES = ('.jsonl', '.jsonl.gz', '.jsonl.zst')
+
+
+class ExportError(Exception):
+    """An export that could not be completed.
+
+    str() is the message the command line prints after '✗ Error: ', and
+    exit_code the status it exits with.
+    """
+
+    def __init__(self, message, exit_code=1):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+class ExportResult:
+    """What an export wrote: output paths by format, session info and notes."""
+
+    def __init__(self, source, outputs, info, unanswered=0, notes=(), up_to_date=False,
+                 secret_scan=False, chunks=None):
+        self.source = Path(source)
+        self.outputs = outputs
+        self.info = info
+        self.unanswered = unanswered
+        self.notes = list(notes)
+        self.up_to_date = up_to_date
+        self.secret_scan = secret_scan
+        # A chunked export's index entries (see _export_chunked)
+        self.chunks = chunks
+
+    @property
+    def summary(self):
+        return self.info.get('summary')
+
+    @property
+    def sizes(self):
+        """Size in bytes of each output, by format."""
+        return {name: path.stat().st_size for name, path in self.outputs.items()}
+
+    @property
+    def size(self):
+        return sum(self.sizes.values())
+
+    def to_dict(self):
+        """JSON-ready form, as the --serve worker reports it."""
+        return {
+            'source': str(self.source),
+            'outputs': {name: str(path) for name, path in self.outputs.items()},
+            'sizes': self.sizes,
+            'info': self.info,
+            'unanswered': self.unanswered,
+            'notes': self.notes,
+            'up_to_date': self.up_to_date,
+            'secret_scan': self.secret_scan,
+            'chunks': self.chunks
+        }
+
+
+def transcript_compression(path):
+    """Return 'gzip', 'zstd' or None for a transcript, from its first bytes."""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def output_compression(path):
+    """Return 'gzip', 'zstd' or None for an output path, from its extension."""
+    return OUTPUT_COMPRESSION.get(Path(path).suffix)
+
+
+def _zstd_open(path, mode):
+    if zstd is None:
+        raise OSError(f"zstd needs Python 3.14+ or the zstandard package: {path}")
+    stream = zstd.open(path, mode)
+    if mode == 'rb' and zstd.__name__ == 'zstandard':
+        # zstandard's reader has no readline; buffer it so it iterates by line
+        stream = io.BufferedReader(stream)
+    return stream
+
+
+def open_transcript(path):
+    """Open a transcript for binary reading, decompressing gzip or zstd as a stream."""
+    compression = transcript_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        return _zstd_open(path, 'rb')
+    return open(path, 'rb')
+
+
+def open_output(path):
+    """Open an output for binary writing, compressing if its extension asks for it."""
+    compression = output_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        return _zstd_open(path, 'wb')
+    return open(path, 'wb')
+
+
+# Collapsed tool results: a line counts as numbered file content when its first
+# 10 characters contain the Read tool's arrow. The match is a zero-width
+# lookahead, so counting with findall allocates no substrings.
+NUMBERED_LINE_RE = re.compile(r'^(?=[^\n→]{0,9}→)', re.MULTILINE)
+
+# Parallel export of one transcript: smaller files are not worth a process
+# pool, and each worker gets several chunks so uneven ones balance out
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+PARALLEL_CHUNKS_PER_JOB = 4
+
+# Incremental export sidecar format, and how much of the source's head is
+# hashed to tell an appended transcript from a replaced one
+CHECKPOINT_VERSION = 2
+CHECKPOINT_FINGERPRINT_BYTES = 4096
+# Read back from the end of a transcript this many bytes at a time to find its last newline
+TAIL_SCAN_BYTES = 64 * 1024
+
+# orjson decodes an integer outside the 64-bit range as a float, where json keeps
+# it exact. Such an integer has at least 19 digits, so a line with a digit run
+# that long (found by mapping every digit to '0') is left to json.
+DIGITS_TO_ZERO = bytes.maketrans(b'123456789', b'000000000')
+LONG_DIGIT_RUN = b'0' * 19
+
+
+def decode_entry(line):
+    """Decode one JSONL line, with orjson when it is installed.
+
+    Decoding is most of the cost of an export, and orjson does it several
+    times faster than the stdlib. It is optional: json is the fallback, and
+    also the arbiter when orjson rejects a line json accepts (lone surrogate
+    escapes) or might round one of its integers, so both backends accept
+    exactly the same transcripts and decode them to the same values.
+    """
+    if orjson is not None and LONG_DIGIT_RUN not in line.translate(DIGITS_TO_ZERO):
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(line)
+
+
+def count_lines(text):
+    """len(text.split('\n')), counted without splitting."""
+    return text.count('\n') + 1
+
+
+def head_lines(text, n):
+    """text.split('\n')[:n], without touching anything past the nth line."""
+    lines = []
+    start = 0
+    while len(lines) < n:
+        end = text.find('\n', start)
+        if end < 0:
+            lines.append(text[start:])
+            break
+        lines.append(text[start:end])
+        start = end + 1
+    return lines
+
+
+def generate_edit_diff(old_string, new_string, max_lines=15):
+    """Generate a simple diff showing added/removed lines.
+
+    Args:
+        old_string: The original text being replaced
+        new_string: The new text replacing it
+        max_lines: Maximum lines to show in diff (truncate if larger, minimum 2)
+
+    Returns:
+        Tuple of (diff_lines, added_count, removed_count)
+    """
+    # Ensure max_lines is at least 2 to prevent division issues
+    max_lines = max(max_lines, 2)
+
+    # Only the shown lines are split out; the rest are just counted
+    shown = max_lines // 2
+    added = count_lines(new_string) if new_string else 0
+    removed = count_lines(old_string) if old_string else 0
+
+    diff_lines = []
+
+    # Show removed lines (limited)
+    if old_string:
+        for line in head_lines(old_string, shown):
+            diff_lines.append(f"-{line}")
+
+    if removed > shown:
+        diff_lines.append(f"  ... ({removed - shown} more removed)")
+
+    # Show added lines (limited)
+    if new_string:
+        for line in head_lines(new_string, shown):
+            diff_lines.append(f"+{line}")
+
+    if added > shown:
+        diff_lines.append(f"  ... ({added - shown} more added)")
+
+    return diff_lines, added, removed
+
+
+def format_tool_params(params, tool_name=''):
+    """Format tool parameters for display - match native format."""
+    if not params:
+        return ""
+
+    # For Read operations - just show filename
+    if tool_name == 'Read' and 'file_path' in params:
+        file_path = params['file_path']
+        # Extract just the filename for display (cross-platform)
+        return Path(file_path).name
+
+    # For simple single params, show just the value (no key)
+    if len(params) == 1 and isinstance(list(params.values())[0], str):
+        key, val = list(params.items())[0]
+        if len(val) < 50:
+            # For description params, show the value directly
+            if key in ['description', 'file_path', 'pattern']:
+                return val
+            return f"{key}: {val}"
+
+    # For complex params, format nicely
+    formatted = []
+    for key, val in params.items():
+        if isinstance(val, str) and '\n' in val:
+            formatted.append(f"{key}: |\n  " + val.replace('\n', '\n  '))
+        elif isinstance(val, (dict, list)):
+            formatted.append(f"{key}: {json.dumps(val, indent=2)}")
+        else:
+            formatted.append(f"{key}: {val}")
+    return '\n      '.join(formatted)
+
+
+def format_tool_result(content):
+    """Format tool result content - keep it concise, match native format."""
+    if isinstance(content, str):
+        # Very long file contents - just show summary (no extra indent)
+        if len(content) > 2000:
+            # Count numbered lines (file content) without splitting the payload
+            if '→' in content and NUMBERED_LINE_RE.search(content):
+                return f"  Read {len(NUMBERED_LINE_RE.findall(content))} lines"
+            return f"  ({count_lines(content)} lines)"
+
+        # Medium-length results - truncate
+        if len(content) > 500:
+            line_count = count_lines(content)
+            if line_count > 10:
+                # Show first few lines with indent
+                formatted_lines = ['  ' + line for line in head_lines(content, 5)]
+                formatted_lines.append(f"    ... ({line_count - 5} more lines)")
+                return '\n'.join(formatted_lines)
+            return '  ' + content[:500] + "..."
+
+        # Short results - indent them
+        if '\n' in content:
+            return '\n'.join('  ' + line for line in content.split('\n'))
+        return '  ' + content
+    elif isinstance(content, list):
+        return '\n'.join(format_tool_result(c) for c in content)
+    return str(content)
+
+
+def new_session_counters():
+    """Return empty running counters for the session header metadata."""
+    return {
+        'version': 'unknown',
+        'cwd': '~',
+        'summary': None,
+        # Insertion order is first appearance, which is what max() breaks ties on
+        'model_counts': {}
+    }
+
+
+def update_session_counters(counters, entry):
+    """Fold one entry into the running session counters."""
+    if entry.get('type') == 'summary' and 'summary' in entry:
+        counters['summary'] = entry['summary']
+    if 'version' in entry:
+        counters['version'] = entry['version']
+    if 'cwd' in entry:
+        # Show relative to home directory, matching native format
+        cwd = entry['cwd']
+        if cwd.startswith(HOME_DIR):
+            counters['cwd'] = '~' + cwd[len(HOME_DIR):]
+        else:
+            counters['cwd'] = cwd
+    if 'message' in entry and 'model' in entry['message']:
+        model = entry['message']['model']
+        # Only count actual Claude models, not internal references
+        if model and model.startswith('claude-') and 'code' not in model:
+            model_counts = counters['model_counts']
+            model_counts[model] = model_counts.get(model, 0) + 1
+
+
+def merge_session_counters(counters, partial):
+    """Fold a later stretch's partial counters into counters (associative).
+
+    A partial starts as {'model_counts': {}}, so it holds only the fields its
+    entries actually set; those override, and model counts add up with the
+    earlier stretch's models first, keeping max()'s first-appearance ties.
+    """
+    for key, value in partial.items():
+        if key != 'model_counts':
+            counters[key] = value
+    model_counts = counters['model_counts']
+    for model, count in partial['model_counts'].items():
+        model_counts[model] = model_counts.get(model, 0) + count
+    return counters
+
+
+def session_info_from_counters(counters):
+    """Turn running counters into the info dict format_header expects."""
+    info = {
+        'version': counters['version'],
+        'model': None,
+        'cwd': counters['cwd'],
+        'summary': counters['summary']
+    }
+
+    # Pick the most common model
+    model_counts = counters['model_counts']
+    if model_counts:
+        info['model'] = max(model_counts, key=model_counts.get)
+
+    return info
+
+
+def extract_session_info(entries):
+    """Extract session metadata from entries."""
+    counters = new_session_counters()
+    for entry in entries:
+        update_session_counters(counters, entry)
+    return session_info_from_counters(counters)
+
+
+def parse_model_display_name(model_id):
+    """Parse model ID to friendly display name.
+
+    Examples:
+        claude-opus-4-5-20251101 -> Opus 4.5
+        claude-sonnet-4-5-20250929 -> Sonnet 4.5
+        claude-3-5-sonnet-20241022 -> Sonnet 3.5
+    """
+    if not model_id:
+        return "Claude"
+
+    model_id = model_id.lower()
+
+    # Extract model family and version
+    if 'opus' in model_id:
+        family = 'Opus'
+    elif 'sonnet' in model_id:
+        family = 'Sonnet'
+    elif 'haiku' in model_id:
+        family = 'Haiku'
+    else:
+        return "Claude"
+
+    # Extract version number (e.g., "4-5" -> "4.5", "3-5" -> "3.5")
+    version_match = re.search(r'(\d+)-(\d+)', model_id)
+    if version_match:
+        version = f"{version_match.group(1)}.{version_match.group(2)}"
+        return f"{family} {version}"
+
+    return family
+
+
+def format_header(info):
+    """Format session header - match native format exactly."""
+    model_display = parse_model_display_name(info.get('model', ''))
+
+    lines = []
+    lines.append("")  # Leading blank line
+    lines.append(" * ▐▛███▜▌ *   Claude Code v" + info['version'])  # Leading space
+    lines.append(f"* ▝▜█████▛▘ *  {model_display} · Claude API")
+    lines.append(" *  ▘▘ ▝▝  *   " + info['cwd'])
+    lines.append("")
+    return '\n'.join(lines)
+
+
+def format_user_message(entry):
+    """Format a user message."""
+    msg = entry.get('message', {})
+    content = msg.get('content', '')
+
+    # Skip meta messages (like context dumps, command outputs)
+    if entry.get('isMeta'):
+        return None
+
+    # Skip command tags whether meta or not
+    if isinstance(content, str):
+        if any(tag in content for tag in ['<command-name>', '<local-command-stdout>', '<command-args>', '<command-message>']):
+            return None
+
+    # Skip tool results - they're handled separately
+    if isinstance(content, list):
+        for block in content:
+            if isinstance(block, dict) and block.get('type') == 'tool_result':
+                return None
+
+    # Skip content that's just raw tool result JSON
+    if isinstance(content, str) and content.startswith("[{'tool_use_id'"):
+        return None
+
+    # Format regular user message (no ⎿ marker per native format)
+    return f"> {content}"
+
+
+def format_assistant_block(block):
+    """Format one assistant content block; returns its output lines."""
+    if not isinstance(block, dict):
+        return []
+
+    block_type = block.get('type', '')
+    lines = []
+
+    if block_type == 'text':
+        text = block.get('text', '').strip()
+        if text:
+            lines.append(f"⏺ {text}")
+            lines.append("")
+
+    elif block_type == 'tool_use':
+        tool_name = block.get('name', 'Unknown')
+        tool_input = block.get('input', {})
+
+        # Format tool name (capitalize, handle special cases)
+        display_name = tool_name.replace('_', ' ').title()
+        if tool_name == 'Read':
+            display_name = 'Read'
+        elif tool_name == 'Write':
+            display_name = 'Write'
+        elif tool_name == 'Edit':
+            display_name = 'Edit'
+        elif tool_name == 'Bash':
+            display_name = 'Bash'
+        elif tool_name == 'Task':
+            display_name = block.get('input', {}).get('description', 'Task')
+
+        # Format parameters - keep concise for verbose tools
+        if tool_name == 'Edit':
+            # For edits, show file and diff summary
+            file_path = tool_input.get('file_path', '')
+            filename = Path(file_path).name if file_path else 'file'
+            old_string = tool_input.get('old_string', '')
+            new_string = tool_input.get('new_string', '')
+
+            diff_lines, added, removed = generate_edit_diff(old_string, new_string)
+
+            lines.append(f"⏺ Update({filename})")
+            lines.append(f"  ⎿  Added {added} lines, removed {removed} lines")
+
+            # Show diff preview (indented)
+            for diff_line in diff_lines[:10]:  # Limit to 10 lines
+                lines.append(f"     {diff_line}")
+            if len(diff_lines) > 10:
+                lines.append(f"     ... ({len(diff_lines) - 10} more diff lines)")
+        elif tool_name == 'Write':
+            # For writes, just show the file
+            file_path = tool_input.get('file_path', '')
+            content_lines = count_lines(tool_input.get('content', ''))
+            filename = Path(file_path).name if file_path else 'file'
+            lines.append(f"⏺ Write({filename} - {content_lines} lines)")
+            lines.append("  ⎿  ")
+        elif tool_name == 'Bash':
+            # For Bash, show raw command (no description label)
+            command = tool_input.get('command', '')
+            if command:
+                # Show command directly without labels
+                lines.append(f"⏺ Bash({command})")
+            else:
+                lines.append(f"⏺ Bash")
+            lines.append("  ⎿  ")
+        else:
+            # For other tools, format normally
+            params = format_tool_params(tool_input, tool_name)
+            if params and '\n' in params:
+                lines.append(f"⏺ {display_name}({params})")
+            elif params:
+                lines.append(f"⏺ {display_name}({params})")
+            else:
+                lines.append(f"⏺ {display_name}")
+            lines.append("  ⎿  ")
+
+    # Thinking blocks are skipped in the UI-style output
+    return lines
+
+
+def _assistant_blocks(entry):
+    content = entry.get('message', {}).get('content', [])
+    if isinstance(content, str):
+        content = [{'type': 'text', 'text': content}]
+    return content
+
+
+def format_assistant_message(entry):
+    """Format an assistant message with tool uses."""
+    lines = []
+    for block in _assistant_blocks(entry):
+        lines.extend(format_assistant_block(block))
+    return '\n'.join(lines) if lines else None
+
+
+def format_tool_result_block(block):
+    """Format one tool_result block - match native format (no blank line after ⎿)."""
+    # Skip interrupted requests (noise in export)
+    if block.get('is_error'):
+        content_str = str(block.get('content', ''))
+        if 'Request interrupted' in content_str:
+            return None
+
+    result_content = block.get('content', '')
+    lines = []
+
+    # Handle agent results specially
+    if isinstance(result_content, list):
+        for item in result_content:
+            if isinstance(item, dict) and item.get('type') == 'text':
+                text = item.get('text', '')
+                if text and not text.startswith('agentId:'):
+                    # Clean formatting for agent results
+                    for line in text.split('\n'):
+                        if line.strip():
+                            lines.append(line)
+    # Handle string results
+    elif isinstance(result_content, str):
+        formatted = format_tool_result(result_content)
+        if formatted:
+            # Add result lines directly (no extra indent per native format)
+            lines.append(formatted)
+
+    return '\n'.join(lines) if lines else None
+
+
+def _tool_result_blocks(entry):
+    content = entry.get('message', {}).get('content', [])
+    if not isinstance(content, list):
+        return []
+    return [block for block in content
+            if isinstance(block, dict) and block.get('type') == 'tool_result']
+
+
+def format_tool_result_entry(entry):
+    """Format every tool result in a user entry as one block."""
+    results = [format_tool_result_block(block) for block in _tool_result_blocks(entry)]
+    return '\n'.join(r for r in results if r) or None
+
+
+def iter_records(f, offset=0, line_number=1, stats=None, limit=None):
+    """Decode JSONL lines from a binary file one at a time.
+
+    Yields (line_number, start, end, entry), where start and end are byte
+    offsets of the line, so a later run can seek straight back to any line.
+    Lines starting at or after byte offset `limit` are not read (see
+    complete_size). Raises ExportError on the first invalid line.
+    """
+    decode = decode_entry
+    if stats is not None:
+        f = stats.timed_lines(f)
+        decode = stats.timed('decode', decode_entry)
+    for line in f:
+        if limit is not None and offset >= limit:
+            return
+        end = offset + len(line)
+        try:
+            entry = decode(line)
+        except json.JSONDecodeError as e:
+            raise ExportError(f"Invalid JSON on line {line_number}: {e}") from None
+        yield line_number, offset, end, entry
+        offset = end
+        line_number += 1
+
+
+def complete_size(f):
+    """Byte length of a seekable file's complete lines, up to its last newline.
+
+    A live transcript may end in a line that is still being written; an
+    incremental export stops before it and picks it up on the next run.
+    """
+    position = f.tell()
+    end = os.fstat(f.fileno()).st_size
+    try:
+        while end > 0:
+            start = max(0, end - TAIL_SCAN_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            end = start
+        return 0
+    finally:
+        f.seek(position)
+
+
+def render_entry(entry):
+    """Render one entry into output pieces.
+
+    Yields (kind, tool_use_id, lines) tuples: 'lines' for plain output,
+    'tool_use' marking where that tool use's result belongs, and
+    'tool_result' for each result the entry carries. ToolResultPairing puts
+    the pieces in order; the caller joins the lines with newlines.
+    """
+    entry_type = entry.get('type', '')
+
+    # Handle compaction boundary - add visual separator
+    if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+        yield 'lines', None, ["═" * 80, " Conversation compacted · ctrl+o for history ", "═" * 80, ""]
+        return
+
+    if entry_type == 'user':
+        formatted = format_user_message(entry)
+        if formatted:
+            # Add blank line after user message (matches native format)
+            yield 'lines', None, [formatted, ""]
+        for block in _tool_result_blocks(entry):
+            formatted = format_tool_result_block(block)
+            # Add blank line after tool result block (matches native format)
+            yield 'tool_result', block.get('tool_use_id'), [formatted, ""] if formatted else []
+
+    elif entry_type == 'assistant':
+        for block in _assistant_blocks(entry):
+            lines = format_assistant_block(block)
+            if lines:
+                yield 'lines', None, lines
+            if isinstance(block, dict) and block.get('type') == 'tool_use' and block.get('id'):
+                yield 'tool_use', block['id'], []
+
+
+# A tool use waits this many transcript lines for its result; after that it
+# is given up on (so the output queued behind it can drain) and a late
+# result is rendered where it lands
+PAIRING_WINDOW_LINES = 1000
+
+
+class OutputItem:
+    """A queued piece of output, tagged with the entry it came from."""
+
+    __slots__ = ('kind', 'tool_use_id', 'lines', 'line', 'offset')
+
+    def __init__(self, kind, tool_use_id, lines, line, offset):
+        self.kind = kind
+        self.tool_use_id = tool_use_id
+        self.lines = lines
+        self.line = line
+        self.offset = offset
+
+
+class ToolResultPairing:
+    """Place each tool result directly under the tool_use it answers.
+
+    Output queues behind a tool_use still waiting for its result (an open
+    slot), so memory is bounded by the tool calls in flight rather than the
+    session length. Results with no open slot are rendered where they arrive.
+    """
+
+    def __init__(self, expired=None, answered=()):
+        self.queue = collections.deque()
+        self.slots = {}  # tool_use_id -> open slot item, oldest first
+        # Tool uses given up on -> their line; unanswered unless a result turns up
+        self.expired = dict(expired or {})
+        # Results already placed by an earlier run, met again on replay
+        self.answered = set(answered)
+        # (result line, tool_use_id, slot line) of results placed since the oldest open slot
+        self.fills = collections.deque()
+
+    def add(self, line, offset, pieces):
+        """Queue one entry's pieces; return the items now ready to write, in order."""
+        while self.slots:
+            tool_use_id, slot = next(iter(self.slots.items()))
+            if line - slot.line <= PAIRING_WINDOW_LINES:
+                break
+            del self.slots[tool_use_id]
+            self.expired[tool_use_id] = slot.line
+
+        for kind, tool_use_id, lines in pieces:
+            if kind == 'tool_result':
+                if tool_use_id in self.answered:
+                    self.answered.discard(tool_use_id)
+                    self.fills.append((line, tool_use_id, -1))
+                    continue
+                slot = self.slots.pop(tool_use_id, None)
+                if slot is not None:
+                    slot.lines = lines
+                    self.fills.append((line, tool_use_id, slot.line))
+                    continue
+                self.expired.pop(tool_use_id, None)
+            item = OutputItem(kind, tool_use_id, lines, line, offset)
+            self.queue.append(item)
+            if kind == 'tool_use':
+                self.slots[tool_use_id] = item
+
+        ready = []
+        while self.queue and not self.is_open(self.queue[0]):
+            ready.append(self.queue.popleft())
+        oldest = next(iter(self.slots.values()), None)
+        while self.fills and (oldest is None or self.fills[0][0] < oldest.line):
+            self.fills.popleft()
+        return ready
+
+    def answered_before(self, line):
+        """Tool uses before `line` whose results came at or after it."""
+        return [tool_use_id for result_line, tool_use_id, slot_line in self.fills
+                if slot_line < line <= result_line]
+
+    def is_open(self, item):
+        return item.kind == 'tool_use' and self.slots.get(item.tool_use_id) is item
+
+    def finish(self):
+        """Return everything still queued; open slots stay empty."""
+        ready = list(self.queue)
+        self.queue.clear()
+        return ready
+
+    @property
+    def unanswered(self):
+        return len(self.slots) + len(self.expired)
+
+
+def unanswered_lines(count):
+    """Closing note on tool uses that never got a result."""
+    if not count:
+        return []
+    return ["", f"⚠ {count} tool use{'s' if count != 1 else ''} never got a result"]
+
+
+def render_entries(entries):
+    """Render a stream of entries, holding only the output behind tool calls in flight."""
+    pairing = ToolResultPairing()
+    for line, entry in enumerate(entries, 1):
+        for item in pairing.add(line, None, render_entry(entry)):
+            yield from item.lines
+    for item in pairing.finish():
+        yield from item.lines
+    yield from unanswered_lines(pairing.unanswered)
+
+
+def write_rendered(f, records, counters, counted_until=0, expired=None, answered=(),
+                   closing=True, track_orphans=False, stats=None, subagents=None):
+    """Render records, pairing tool results with their uses, and write them to a binary file.
+
+    Every line is written with a leading newline: the header is the first
+    line of an export, so the body always continues an existing line. Counters
+    are updated as entries stream by, skipping records that end at or before
+    counted_until (already counted by an earlier run). `expired` and
+    `answered` carry the pairing state of an earlier run (see
+    save_checkpoint); closing=False leaves out the note on unanswered tool
+    uses, and track_orphans=True records every result rendered without a slot.
+    A SubagentSplicer as subagents splices subagent transcripts into the
+    output.
+
+    Returns the resume state for a checkpoint. The entry holding the oldest
+    tool use still open at the end stays pending: a later run re-reads the
+    source from that entry, so its result is paired once it lands. With no
+    open tool use, nothing is pending and a later run resumes at the end.
+    The state also lists the open slots with their output positions, for
+    the parallel merge.
+    """
+    render = render_entry
+    update_counters = update_session_counters
+    if stats is not None:
+        f = stats.timed_writer(f)
+        render = stats.render_entry
+        update_counters = stats.timed('session_info', update_session_counters)
+    if subagents is not None:
+        render = subagents.wrap(render)
+
+    pairing = ToolResultPairing(expired, answered)
+    written = 0
+    # Where each entry's output starts, kept from the oldest open slot's entry on
+    entry_starts = collections.deque()
+    slot_positions = {}
+    orphans = []
+    line = 0
+    consumed = None
+
+    def emit(items):
+        nonlocal written
+        for item in items:
+            if not entry_starts or entry_starts[-1][0] != item.line:
+                entry_starts.append((item.line, written))
+            if pairing.is_open(item):
+                slot_positions[item.tool_use_id] = written
+            start = written
+            for text in item.lines:
+                data = ('\n' + text).encode('utf-8')
+                f.write(data)
+                written += len(data)
+            if track_orphans and item.kind == 'tool_result' and item.tool_use_id is not None:
+                orphans.append((item.tool_use_id, item.line, start, written))
+        oldest = next(iter(pairing.slots.values()), None)
+        while entry_starts and (oldest is None or entry_starts[0][0] < oldest.line):
+            entry_starts.popleft()
+
+    for line, start, end, entry in records:
+        if end > counted_until:
+            update_counters(counters, entry)
+        emit(pairing.add(line, start, render(entry)))
+        consumed = end
+
+    emit(pairing.finish())
+    if subagents is not None:
+        emit([OutputItem('lines', None, subagents.unlinked_lines(), line, None)])
+    starts = dict(entry_starts)
+    open_slots = list(pairing.slots.values())
+    pending = open_slots[0] if open_slots else None
+    committed = starts[pending.line] if pending else written
+    body_bytes = written
+    if closing:
+        emit([OutputItem('lines', None, unanswered_lines(pairing.unanswered), line, None)])
+
+    return {
+        'pending_line': pending.line if pending else line + 1,
+        'pending_offset': pending.offset if pending else consumed,
+        'consumed': consumed,
+        'committed_bytes': committed,
+        'written_bytes': written,
+        'body_bytes': body_bytes,
+        'unanswered': pairing.unanswered,
+        'expired': pairing.expired,
+        'answered': pairing.answered_before(pending.line) if pending else [],
+        'fills': list(pairing.fills),
+        # (tool_use_id, line, source offset, output position, entry's output start)
+        'open_slots': [(slot.tool_use_id, slot.line, slot.offset,
+                        slot_positions[slot.tool_use_id], starts[slot.line])
+                       for slot in open_slots],
+        # (tool_use_id, line, output start, output end) of results rendered without a slot
+        'orphans': orphans
+    }
+
+
+class OutputSink(abc.ABC):
+    """One output format fed by a shared decode pass (see _export_formats).
+
+    A sink renders entries into the same (kind, tool_use_id, lines) pieces
+    as render_entry, so its own ToolResultPairing places results under their
+    tool uses, and writes them to a body file as they become ready. The
+    header needs the whole session's metadata, so it is put in front of the
+    body once every entry has been seen.
+    """
+
+    suffix = None
+
+    def __init__(self, body):
+        self.body = body
+        self.pairing = ToolResultPairing()
+
+    @abc.abstractmethod
+    def render(self, line, entry):
+        """Render one entry into (kind, tool_use_id, lines) pieces."""
+
+    @abc.abstractmethod
+    def header(self, info):
+        """The text put in front of the body, given the session info."""
+
+    def closing_lines(self, unanswered):
+        return unanswered_lines(unanswered)
+
+    def footer(self):
+        return ''
+
+    def add(self, line, offset, entry):
+        self._write(self.pairing.add(line, offset, self.render(line, entry)))
+
+    def finish(self):
+        self._write(self.pairing.finish())
+        for text in self.closing_lines(self.pairing.unanswered):
+            self.body.write(('\n' + text).encode('utf-8'))
+
+    def _write(self, items):
+        for item in items:
+            for text in item.lines:
+                self.body.write(('\n' + text).encode('utf-8'))
+
+
+class TextSink(OutputSink):
+    """The /export-style text, byte for byte what the text exporter writes."""
+
+    suffix = '.txt'
+
+    def render(self, line, entry):
+        return render_entry(entry)
+
+    def header(self, info):
+        return format_header(info)
+
+
+def _md_fence(text):
+    """A code fence longer than any backtick run inside the text."""
+    longest = max((len(run) for run in re.findall(r'`{3,}', text)), default=2)
+    return '`' * (longest + 1)
+
+
+def _md_code_block(text):
+    fence = _md_fence(text)
+    return [fence, text, fence, ""]
+
+
+def _user_text(entry):
+    """The text of a user message the export shows, or None."""
+    if format_user_message(entry) is None:
+        return None
+    content = entry.get('message', {}).get('content', '')
+    if isinstance(content, list):
+        return '\n'.join(block.get('text', '') for block in content
+                         if isinstance(block, dict) and block.get('type') == 'text')
+    return str(content)
+
+
+def _tool_call_text(block):
+    """A tool_use block's text rendering, without the empty result marker."""
+    lines = format_assistant_block(block)
+    while lines and not lines[-1].strip(' ⎿'):
+        lines.pop()
+    return '\n'.join(lines)
+
+
+class MarkdownSink(OutputSink):
+    """Markdown for the chronicle: quoted prompts, prose, fenced tool calls and results."""
+
+    suffix = '.md'
+
+    def render(self, line, entry):
+        entry_type = entry.get('type', '')
+        if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+            yield 'lines', None, ["---", "", "*Conversation compacted*", "", "---", ""]
+        elif entry_type == 'user':
+            text = _user_text(entry)
+            if text is not None:
+                yield 'lines', None, [f"> {l}" if l else ">" for l in text.split('\n')] + [""]
+            for block in _tool_result_blocks(entry):
+                formatted = format_tool_result_block(block)
+                yield ('tool_result', block.get('tool_use_id'),
+                       _md_code_block(formatted) if formatted else [])
+        elif entry_type == 'assistant':
+            for block in _assistant_blocks(entry):
+                if not isinstance(block, dict):
+                    continue
+                if block.get('type') == 'text':
+                    text = block.get('text', '').strip()
+                    if text:
+                        yield 'lines', None, [text, ""]
+                elif block.get('type') == 'tool_use':
+                    yield 'lines', None, _md_code_block(_tool_call_text(block))
+                    if block.get('id'):
+                        yield 'tool_use', block['id'], []
+
+    def header(self, info):
+        return '\n'.join([
+            f"# {info['summary'] or 'Claude Code session'}",
+            "",
+            f"- **Claude Code:** v{info['version']}",
+            f"- **Model:** {parse_model_display_name(info.get('model', ''))}",
+            f"- **Working directory:** `{info['cwd']}`",
+            ""
+        ])
+
+    def closing_lines(self, unanswered):
+        return [f"*{text}*" if text else text for text in unanswered_lines(unanswered)]
+
+    def footer(self):
+        return '\n'
+
+
+HTML_STYLE = (
+    "body{font-family:system-ui,sans-serif;max-width:60rem;margin:2rem auto;padding:0 1rem}"
+    "pre{white-space:pre-wrap;margin:0}"
+    ".user{background:#eef3fb;border-left:3px solid #4a7bd0;padding:.5rem;margin:1rem 0}"
+    ".assistant{white-space:pre-wrap;margin:1rem 0}"
+    ".tool{background:#f4f4f4;padding:.5rem;margin:1rem 0 0;font-family:monospace}"
+    ".result{background:#fafafa;border-left:3px solid #ccc;padding:.5rem;margin:0 0 1rem}"
+    ".compact,.note{color:#777;font-style:italic}"
+)
+
+
+class HtmlSink(OutputSink):
+    """A standalone HTML page for review, one styled block per prompt, reply, call and result."""
+
+    suffix = '.html'
+
+    def render(self, line, entry):
+        entry_type = entry.get('type', '')
+        if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+            yield 'lines', None, ['<hr><p class="compact">Conversation compacted</p><hr>']
+        elif entry_type == 'user':
+            text = _user_text(entry)
+            if text is not None:
+                yield 'lines', None, [f'<div class="user"><pre>{html.escape(text)}</pre></div>']
+            for block in _tool_result_blocks(entry):
+                formatted = format_tool_result_block(block)
+                yield ('tool_result', block.get('tool_use_id'),
+                       [f'<div class="result"><pre>{html.escape(formatted)}</pre></div>']
+                       if formatted else [])
+        elif entry_type == 'assistant':
+            for block in _assistant_blocks(entry):
+                if not isinstance(block, dict):
+                    continue
+                if block.get('type') == 'text':
+                    text = block.get('text', '').strip()
+                    if text:
+                        yield 'lines', None, [f'<div class="assistant">{html.escape(text)}</div>']
+                elif block.get('type') == 'tool_use':
+                    call = html.escape(_tool_call_text(block))
+                    yield 'lines', None, [f'<div class="tool"><pre>{call}</pre></div>']
+                    if block.get('id'):
+                        yield 'tool_use', block['id'], []
+
+    def header(self, info):
+        title = html.escape(info['summary'] or 'Claude Code session')
+        model = html.escape(parse_model_display_name(info.get('model', '')))
+        return '\n'.join([
+            '<!DOCTYPE html>',
+            '<html lang="en">',
+            '<head>',
+            '<meta charset="utf-8">',
+            f'<title>{title}</title>',
+            f'<style>{HTML_STYLE}</style>',
+            '</head>',
+            '<body>',
+            f'<h1>{title}</h1>',
+            f'<p>Claude Code v{html.escape(info["version"])} · {model} · '
+            f'<code>{html.escape(info["cwd"])}</code></p>'
+        ])
+
+    def closing_lines(self, unanswered):
+        return [f'<p class="note">{html.escape(text)}</p>'
+                for text in unanswered_lines(unanswered) if text]
+
+    def footer(self):
+        return '\n</body>\n</html>\n'
+
+
+def _result_text(content):
+    """A tool result's full content as plain text."""
+    if isinstance(content, list):
+        return '\n'.join(item.get('text', '') for item in content
+                         if isinstance(item, dict) and item.get('type') == 'text')
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+def entry_events(line, entry):
+    """The normalized events (see JsonEventSink) for one transcript entry."""
+    base = {'line': line, 'timestamp': entry.get('timestamp'), 'uuid': entry.get('uuid')}
+    entry_type = entry.get('type', '')
+    events = []
+    if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+        events.append({'event': 'compaction', **base})
+    elif entry_type == 'user':
+        text = _user_text(entry)
+        if text is not None:
+            events.append({'event': 'user', **base, 'text': text})
+        for block in _tool_result_blocks(entry):
+            events.append({'event': 'tool_result', **base,
+                           'tool_use_id': block.get('tool_use_id'),
+                           'is_error': bool(block.get('is_error')),
+                           'text': _result_text(block.get('content', ''))})
+    elif entry_type == 'assistant':
+        model = entry.get('message', {}).get('model')
+        for block in _assistant_blocks(entry):
+            if not isinstance(block, dict):
+                continue
+            if block.get('type') == 'text' and block.get('text', '').strip():
+                events.append({'event': 'assistant', **base, 'model': model,
+                               'text': block['text'].strip()})
+            elif block.get('type') == 'tool_use':
+                events.append({'event': 'tool_use', **base, 'model': model,
+                               'tool_use_id': block.get('id'), 'name': block.get('name'),
+                               'input': block.get('input', {})})
+    return events
+
+
+def iter_events(jsonl_path):
+    """Yield a session's normalized events as dicts, decoding it as they are consumed.
+
+    These are the json format's events, in transcript order. The 'session'
+    event needs the whole transcript's metadata, so it comes last here
+    rather than first. Raises ExportError if the transcript cannot be read.
+    """
+    counters = new_session_counters()
+    with _open_source(jsonl_path) as src:
+        try:
+            for line, _start, _end, entry in iter_records(src):
+                update_session_counters(counters, entry)
+                yield from entry_events(line, entry)
+        except EOFError:
+            raise ExportError(f"Compressed session file is truncated: {jsonl_path}") from None
+        except gzip.BadGzipFile as e:
+            raise ExportError(f"Corrupt compressed session file: {jsonl_path} ({e})") from None
+    yield {'event': 'session', **session_info_from_counters(counters)}
+
+
+class JsonEventSink(OutputSink):
+    """A normalized JSON Lines event stream for the knowledge-graph extract stage.
+
+    The first line is a 'session' event with the header fields; then one
+    event per user prompt, assistant text, tool call, tool result and
+    compaction, in transcript order. Events carry the transcript line,
+    timestamp and entry UUID; tool calls and results share tool_use_id and
+    keep their full input and content. Nothing is paired or reordered.
+    """
+
+    suffix = '.events.jsonl'
+
+    def render(self, line, entry):
+        events = entry_events(line, entry)
+        if events:
+            yield 'lines', None, [json.dumps(event, ensure_ascii=False) for event in events]
+
+    def header(self, info):
+        return json.dumps({'event': 'session', **info}, ensure_ascii=False)
+
+    def closing_lines(self, unanswered):
+        return []
+
+    def footer(self):
+        return '\n'
+
+
+OUTPUT_SINKS = {
+    'text': TextSink,
+    'markdown': MarkdownSink,
+    'html': HtmlSink,
+    'json': JsonEventSink
+}
+
+
+def format_outputs(output_path, formats):
+    """Map each format to its output path.
+
+    Text goes to output_path itself; the other formats swap its extension
+    for their own (session.txt -> session.md, session.html,
+    session.events.jsonl), keeping a trailing .gz or .zst.
+    """
+    path = Path(output_path)
+    compression = path.suffix if output_compression(path) else ''
+    base = path.with_suffix('') if compression else path
+    stem = base.name[:-len(base.suffix)] if base.suffix else base.name
+    return {name: path if name == 'text'
+            else base.with_name(stem + OUTPUT_SINKS[name].suffix + compression)
+            for name in formats}
+
+
+def _export_formats(src, outputs):
+    """Decode the source once and feed every entry to one sink per output format.
+
+    Each sink writes its body incrementally to a temp file beside its output;
+    once the counters are complete, every output is assembled from its
+    header, body and footer. Returns the unanswered-tool-use count and the
+    counters.
+    """
+    counters = new_session_counters()
+    body_paths = {name: path.parent / f".tmp_{os.getpid()}_{path.name}"
+                  for name, path in outputs.items()}
+    try:
+        with contextlib.ExitStack() as stack:
+            sinks = {name: OUTPUT_SINKS[name](stack.enter_context(open(body_path, 'wb')))
+                     for name, body_path in body_paths.items()}
+            for line, start, end, entry in iter_records(src):
+                update_session_counters(counters, entry)
+                for sink in sinks.values():
+                    sink.add(line, start, entry)
+            for sink in sinks.values():
+                sink.finish()
+
+        info = session_info_from_counters(counters)
+        for name, sink in sinks.items():
+            with open_output(outputs[name]) as f, open(body_paths[name], 'rb') as body:
+                f.write(sink.header(info).encode('utf-8'))
+                shutil.copyfileobj(body, f)
+                f.write(sink.footer().encode('utf-8'))
+    finally:
+        for body_path in body_paths.values():
+            body_path.unlink(missing_ok=True)
+
+    return max(sink.pairing.unanswered for sink in sinks.values()), counters
+
+
+# Chunked exports estimate tokens from the rendered UTF-8 bytes: about 4 per
+# token for English and code, which errs high for other scripts
+CHUNK_BYTES_PER_TOKEN = 4
+# Room kept in each chunk's token budget for its header
+CHUNK_HEADER_TOKENS = 100
+CHUNK_INDEX_VERSION = 1
+
+
+def estimate_tokens(data):
+    """Estimated model tokens in rendered UTF-8 bytes."""
+    return -(-len(data) // CHUNK_BYTES_PER_TOKEN)
+
+
+def chunk_edge(entry):
+    """'compaction' or 'turn' if a chunk may start at this entry, else None."""
+    entry_type = entry.get('type')
+    if entry_type == 'system' and entry.get('subtype') == 'compact_boundary':
+        return 'compaction'
+    # A compaction summary belongs with the boundary before it
+    if entry_type == 'user' and not entry.get('isCompactSummary') \
+            and format_user_message(entry) is not None:
+        return 'turn'
+    return None
+
+
+class ChunkedTextSink(TextSink):
+    """The text export, split into chunks of about a token budget each.
+
+    Output is grouped into pieces, one per entry (a tool result travels with
+    the tool use it answers), and pieces fill a chunk until the next would
+    overrun the budget. The chunk is then cut before its last turn or
+    compaction edge, and the rest starts the next chunk; with no such edge it
+    is cut between entries, and an entry over the budget alone is a chunk of
+    its own. Only the chunk being filled is held in memory: finished chunk
+    bodies are written one after another, their byte ranges kept in chunks.
+    """
+
+    def __init__(self, body, token_budget, subagents=None):
+        super().__init__(body)
+        self.budget = max(token_budget - CHUNK_HEADER_TOKENS, 1)
+        self.render_entry = render_entry if subagents is None else subagents.wrap(render_entry)
+        self.subagents = subagents
+        self.edges = {}
+        # [line, edge, data, tokens] per piece of the chunk being filled
+        self.pieces = []
+        self.piece = None
+        self.tokens = 0
+        self.written = 0
+        self.chunks = []
+
+    def render(self, line, entry):
+        edge = chunk_edge(entry)
+        if edge:
+            self.edges[line] = edge
+        return self.render_entry(entry)
+
+    def finish(self):
+        self._write(self.pairing.finish())
+        line = self.piece[0] if self.piece else None
+        closing = self.subagents.unlinked_lines() if self.subagents is not None else []
+        closing += self.closing_lines(self.pairing.unanswered)
+        self._write([OutputItem('lines', None, closing, line, None)])
+        self._end_piece()
+        if self.pieces or not self.chunks:
+            self._write_chunk(len(self.pieces))
+
+    def _write(self, items):
+        for item in items:
+            if self.piece is None or item.line != self.piece[0]:
+                self._end_piece()
+                self.piece = [item.line, self.edges.pop(item.line, None), bytearray(), 0]
+            for text in item.lines:
+                self.piece[2] += ('\n' + text).encode('utf-8')
+
+    def _end_piece(self):
+        piece, self.piece = self.piece, None
+        if not piece or not piece[2]:
+            return
+        piece[3] = estimate_tokens(piece[2])
+        while self.pieces and self.tokens + piece[3] > self.budget:
+            cut = next((i for i in range(len(self.pieces) - 1, 0, -1) if self.pieces[i][1]),
+                       len(self.pieces))
+            self._write_chunk(cut)
+        self.pieces.append(piece)
+        self.tokens += piece[3]
+
+    def _write_chunk(self, count):
+        pieces, self.pieces = self.pieces[:count], self.pieces[count:]
+        start = self.written
+        for piece in pieces:
+            self.body.write(piece[2])
+            self.written += len(piece[2])
+        tokens = sum(piece[3] for piece in pieces)
+        self.tokens -= tokens
+        self.chunks.append({
+            'starts_at': 'start' if not self.chunks else pieces[0][1] or 'entry',
+            'source_lines': [pieces[0][0], pieces[-1][0]] if pieces else None,
+            'body': (start, self.written)
+        })
+
+
+def chunk_index_path(output_path):
+    return output_path.parent / f"{output_path.name}.chunks.json"
+
+
+def format_chunk_header(info, number, total, source_lines):
+    """The session header, repeated at the top of each chunk with the chunk's place."""
+    place = f" ⋯ Part {number} of {total}"
+    if source_lines:
+        place += f" · transcript lines {source_lines[0]}–{source_lines[1]}"
+    return format_header(info) + place + "\n"
+
+
+def _export_chunked(src, jsonl_path, output_path, token_budget, subagents=None):
+    """Render the text export as self-contained chunks, and index them.
+
+    Chunk bodies are rendered to a temp file; once the counters are
+    complete, each is written out behind its own header, and the index
+    (<output>.chunks.json) records every chunk's byte offset, first output
+    line, line count, estimated tokens and the transcript lines it covers.
+    Returns the unanswered-tool-use count, the counters and the index's
+    chunk list.
+    """
+    counters = new_session_counters()
+    body_path = output_path.parent / f".tmp_{os.getpid()}_{output_path.name}"
+    index_path = chunk_index_path(output_path)
+    temp_index_path = index_path.parent / f".tmp_{os.getpid()}_{index_path.name}"
+    try:
+        with open(body_path, 'wb') as body:
+            sink = ChunkedTextSink(body, token_budget, subagents)
+            for line, start, end, entry in iter_records(src):
+                update_session_counters(counters, entry)
+                sink.add(line, start, entry)
+            sink.finish()
+
+        info = session_info_from_counters(counters)
+        chunks = []
+        offset, line = 0, 1
+        with open_output(output_path) as f, open(body_path, 'rb') as body:
+            for number, chunk in enumerate(sink.chunks, 1):
+                header = format_chunk_header(info, number, len(sink.chunks),
+                                             chunk['source_lines'])
+                body_start, body_end = chunk['body']
+                body.seek(body_start)
+                data = header.encode('utf-8') + body.read(body_end - body_start)
+                f.write(data)
+                newlines = data.count(b'\n')
+                chunks.append({
+                    'offset': offset,
+                    'bytes': len(data),
+                    'line': line,
+                    # Every chunk but the last ends in a newline
+                    'lines': newlines + (not data.endswith(b'\n')),
+                    'tokens': estimate_tokens(data),
+                    'source_lines': chunk['source_lines'],
+                    'starts_at': chunk['starts_at']
+                })
+                offset += len(data)
+                line += newlines
+
+        temp_index_path.write_text(json.dumps({
+            'version': CHUNK_INDEX_VERSION,
+            'source': str(Path(jsonl_path).resolve()),
+            'output': output_path.name,
+            'token_budget': token_budget,
+            'bytes_per_token': CHUNK_BYTES_PER_TOKEN,
+            'info': info,
+            'chunks': chunks
+        }, indent=1))
+        os.replace(temp_index_path, index_path)
+    finally:
+        body_path.unlink(missing_ok=True)
+        temp_index_path.unlink(missing_ok=True)
+
+    return sink.pairing.unanswered, counters, chunks
+
+
+def _checkpoint_path(output_path):
+    return output_path.parent / f"{output_path.name}.checkpoint.json"
+
+
+def source_fingerprint(src, length):
+    """Hash the first bytes of the source, to tell an appended file from a replaced one.
+
+    The catalog and search index use it too, to decide whether a scan can resume.
+    """
+    src.seek(0)
+    digest = hashlib.sha256(src.read(min(length, CHECKPOINT_FINGERPRINT_BYTES))).hexdigest()
+    src.seek(0)
+    return digest
+
+
+def load_checkpoint(jsonl_path, src, output_path):
+    """Return the checkpoint for this export if it still describes the files on disk.
+
+    A checkpoint is only trusted when it names the same source, the output is
+    exactly the size it recorded (nothing else touched it, and no earlier run
+    died half-way through an append), and the source still starts with the
+    bytes it had last time and has not shrunk.
+    """
+    try:
+        checkpoint = json.loads(_checkpoint_path(output_path).read_text())
+        if (checkpoint.get('version') != CHECKPOINT_VERSION
+                or checkpoint['source'] != str(Path(jsonl_path).resolve())
+                or checkpoint['pending_offset'] is None
+                or output_path.stat().st_size != checkpoint['output_size']
+                or os.fstat(src.fileno()).st_size < checkpoint['source_size']
+                or source_fingerprint(src, checkpoint['source_size']) != checkpoint['fingerprint']):
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return checkpoint
+
+
+def save_checkpoint(jsonl_path, src, output_path, header, state, counters):
+    """Atomically write the checkpoint sidecar beside the output."""
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'source': str(Path(jsonl_path).resolve()),
+        'source_size': state['consumed'] or 0,
+        'fingerprint': source_fingerprint(src, state['consumed'] or 0),
+        # Resume re-reads from the entry holding the oldest unanswered tool use
+        # (or from the end of the source when there is none)
+        'pending_offset': state['pending_offset'],
+        'pending_line': state['pending_line'],
+        # Tool uses given up on before the pending entry; replay re-derives the rest
+        'expired': {tool_use_id: line for tool_use_id, line in state['expired'].items()
+                    if line < state['pending_line']},
+        # Results past the pending entry that answered tool uses before it; replay skips them
+        'answered': state['answered'],
+        'header': header,
+        'committed_size': state['committed_size'],
+        'output_size': output_path.stat().st_size,
+        # Counters cover the whole source consumed so far; resume skips re-read entries
+        'counters': counters
+    }
+    path = _checkpoint_path(output_path)
+    temp_path = path.parent / f".tmp_{os.getpid()}_{path.name}"
+    try:
+        temp_path.write_text(json.dumps(checkpoint))
+        os.replace(temp_path, path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+class ExportStats:
+    """Per-phase timings and per-entry-type/tool render costs for one export.
+
+    Phases are timed by wrapping the pipeline's callables and file objects,
+    so an export without stats runs exactly the code it always did.
+    """
+
+    PHASES = ('read', 'decode', 'session_info', 'render', 'write', 'header')
+
+    def __init__(self):
+        self.wall = dict.fromkeys(self.PHASES, 0.0)
+        self.cpu = dict.fromkeys(self.PHASES, 0.0)
+        self.entry_types = {}
+        self.tools = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_wall = 0.0
+        self.total_cpu = 0.0
+        self.tracemalloc_top = None
+        self.tracemalloc_peak = None
+
+    def _add(self, phase, wall_start, cpu_start):
+        self.wall[phase] += time.perf_counter() - wall_start
+        self.cpu[phase] += time.process_time() - cpu_start
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._add(name, wall_start, cpu_start)
+
+    def timed(self, phase, func):
+        """Wrap a callable so its time counts toward a phase."""
+        def wrapper(*args, **kwargs):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(phase, wall_start, cpu_start)
+        return wrapper
+
+    def timed_lines(self, f):
+        """Iterate a binary file's lines, timing the reads and counting bytes in."""
+        lines = iter(f)
+        while True:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            line = next(lines, None)
+            self._add('read', wall_start, cpu_start)
+            if line is None:
+                return
+            self.bytes_in += len(line)
+            yield line
+
+    def timed_writer(self, f):
+        """Wrap a binary file so writes count toward the write phase."""
+        stats = self
+
+        class Writer:
+            def write(self, data):
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                try:
+                    return f.write(data)
+                finally:
+                    stats._add('write', wall_start, cpu_start)
+
+        return Writer()
+
+    def render_entry(self, entry):
+        """render_entry, timed and attributed to the entry type and its tools."""
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        pieces = list(render_entry(entry))
+        elapsed = time.perf_counter() - wall_start
+        self.wall['render'] += elapsed
+        self.cpu['render'] += time.process_time() - cpu_start
+
+        entry_type = entry.get('type', 'unknown')
+        if entry_type == 'system' and entry.get('subtype'):
+            entry_type = f"system/{entry['subtype']}"
+        counts = self.entry_types.setdefault(entry_type, [0, 0.0])
+        counts[0] += 1
+        counts[1] += elapsed
+
+        # An entry with several tool_use blocks splits its render time evenly
+        content = entry.get('message', {}).get('content') if entry.get('type') == 'assistant' else None
+        if isinstance(content, list):
+            names = [block.get('name', 'Unknown') for block in content
+                     if isinstance(block, dict) and block.get('type') == 'tool_use']
+            for name in names:
+                counts = self.tools.setdefault(name, [0, 0.0])
+                counts[0] += 1
+                counts[1] += elapsed / len(names)
+        return pieces
+
+    def report(self):
+        """Human-readable report."""
+        lines = ["", "Export stats"]
+        lines.append(f"  {'phase':14} {'wall s':>9} {'cpu s':>9}")
+        for phase in self.PHASES:
+            lines.append(f"  {phase:14} {self.wall[phase]:9.3f} {self.cpu[phase]:9.3f}")
+        lines.append(f"  {'total':14} {self.total_wall:9.3f} {self.total_cpu:9.3f}")
+        lines.append(f"  bytes in: {self.bytes_in:,}  bytes out: {self.bytes_out:,}")
+        peak = peak_rss_kb()
+        if peak is not None:
+            lines.append(f"  peak RSS: {peak / 1024:.1f} MB")
+        if self.tracemalloc_peak is not None:
+            lines.append(f"  peak traced allocations: {self.tracemalloc_peak / 1024 / 1024:.1f} MB")
+
+        for title, table in (("entry type", self.entry_types), ("tool", self.tools)):
+            lines.append("")
+            lines.append(f"  {title:28} {'count':>8} {'render s':>10}")
+            for name, (count, seconds) in sorted(table.items(), key=lambda item: -item[1][1]):
+                lines.append(f"  {name:28} {count:8} {seconds:10.4f}")
+
+        if self.tracemalloc_top:
+            lines.append("")
+            lines.append("  top allocation sites (tracemalloc)")
+            lines.extend(f"  {stat}" for stat in self.tracemalloc_top)
+        return '\n'.join(lines)
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _stats_phase(stats, name):
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
+
+
+def _export_full(src, output_path, stats=None, subagents=None, scanner=None, limit=None):
+    """Render the whole source: body to a temp file, then header in front of it.
+
+    With a SecretScanner as scanner, the rendered text is scanned as it is
+    written, and SecretsFound is raised instead of writing the output if
+    anything turns up. Reading stops at byte offset limit, if given.
+    """
+    counters = new_session_counters()
+    body_path = output_path.parent / f".tmp_{os.getpid()}_{output_path.name}"
+    try:
+        with open(body_path, 'wb') as body:
+            writer = body if scanner is None else ScanningWriter(body, scanner)
+            state = write_rendered(writer, iter_records(src, stats=stats, limit=limit), counters,
+                                   stats=stats, subagents=subagents)
+
+        header = format_header(session_info_from_counters(counters))
+        if scanner is not None:
+            findings = scan_rendered(scanner, header)
+            if findings:
+                raise SecretsFound(output_path, findings)
+
+        # Write the header, then copy the rendered body in behind it
+        with _stats_phase(stats, 'header'), \
+                open_output(output_path) as f, open(body_path, 'rb') as body:
+            header_bytes = header.encode('utf-8')
+            f.write(header_bytes)
+            shutil.copyfileobj(body, f)
+    finally:
+        body_path.unlink(missing_ok=True)
+
+    state['committed_size'] = len(header_bytes) + state['committed_bytes']
+    return header, state, counters
+
+
+def _export_resume(src, output_path, checkpoint, stats=None, limit=None):
+    """Render only what landed after the checkpoint (up to limit) and append it to the output."""
+    counters = checkpoint['counters']
+    src.seek(checkpoint['pending_offset'])
+    records = iter_records(src, checkpoint['pending_offset'], checkpoint['pending_line'], stats,
+                           limit)
+
+    body_path = output_path.parent / f".tmp_{os.getpid()}_{output_path.name}"
+    try:
+        with open(body_path, 'wb') as body:
+            state = write_rendered(body, records, counters, checkpoint['source_size'],
+                                   checkpoint['expired'], checkpoint['answered'], stats=stats)
+
+        # Header and assembly of the output file
+        with _stats_phase(stats, 'header'):
+            header = format_header(session_info_from_counters(counters))
+            old_header_size = len(checkpoint['header'].encode('utf-8'))
+            committed = checkpoint['committed_size']
+
+            if header == checkpoint['header']:
+                # Common case: drop the pending entry's old rendering and append in place
+                with open(output_path, 'r+b') as f, open(body_path, 'rb') as body:
+                    f.truncate(committed)
+                    f.seek(committed)
+                    shutil.copyfileobj(body, f)
+            else:
+                # The header grew or changed (new version, model, cwd): rebuild the file
+                # from the new header and the already-rendered body, without re-parsing
+                temp_path = output_path.parent / f".tmp_{os.getpid()}_full_{output_path.name}"
+                try:
+                    with open(temp_path, 'wb') as f, open(output_path, 'rb') as old, \
+                            open(body_path, 'rb') as body:
+                        f.write(header.encode('utf-8'))
+                        old.seek(old_header_size)
+                        remaining = committed - old_header_size
+                        while remaining > 0:
+                            chunk = old.read(min(remaining, 1024 * 1024))
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            remaining -= len(chunk)
+                        shutil.copyfileobj(body, f)
+                    os.replace(temp_path, output_path)
+                except Exception:
+                    temp_path.unlink(missing_ok=True)
+                    raise
+                committed += len(header.encode('utf-8')) - old_header_size
+    finally:
+        body_path.unlink(missing_ok=True)
+
+    state['committed_size'] = committed + state['committed_bytes']
+    return header, state, counters
+
+
+def split_chunks(f, size, count):
+    """Split a file into up to `count` newline-aligned (start, end) byte ranges."""
+    bounds = [0]
+    for i in range(1, count):
+        f.seek(size * i // count)
+        f.readline()  # finish the line the guess landed in
+        bound = f.tell()
+        if bounds[-1] < bound < size:
+            bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _chunk_records(src, start, end, errors):
+    """Decode the lines in [start, end), numbered from 1; stop at the first invalid one."""
+    src.seek(start)
+    offset = start
+    line = 0
+    while offset < end:
+        data = src.readline()
+        if not data:
+            break
+        line += 1
+        try:
+            entry = decode_entry(data)
+        except json.JSONDecodeError as e:
+            errors.append((line, str(e)))
+            return
+        yield line, offset, offset + len(data), entry
+        offset += len(data)
+
+
+def _render_chunk(jsonl_path, start, end, part_path):
+    """Parallel worker: render the entries in [start, end) to a part file.
+
+    Tool results are paired within the chunk; tool uses still open at its
+    end and results that found no slot are reported with their output
+    positions, for the merge to pair across chunks. Line numbers are local
+    to the chunk. Counters are returned as a partial aggregate for
+    merge_session_counters.
+    """
+    counters = {'model_counts': {}}
+    errors = []
+    with open(jsonl_path, 'rb') as src, open(part_path, 'wb') as out:
+        records = _chunk_records(src, start, end, errors)
+        state = write_rendered(out, records, counters, closing=False, track_orphans=True)
+    if errors:
+        return {'error': errors[0]}
+    state.update(error=None, counters=counters)
+    return state
+
+
+def _export_parallel(src, jsonl_path, output_path, jobs, size=None):
+    """Render newline-aligned chunks of one transcript across a process pool.
+
+    Tool uses left open at the end of one chunk are paired with results
+    that the workers of later chunks rendered without a slot: those result
+    bytes are moved under the tool use while the parts are concatenated
+    behind the header. The output, counters and checkpoint state match
+    _export_full's. Only the first `size` bytes are read (default: all).
+    """
+    if size is None:
+        size = os.fstat(src.fileno()).st_size
+    count = min(jobs * PARALLEL_CHUNKS_PER_JOB, max(1, size // PARALLEL_CHUNK_BYTES))
+    chunks = split_chunks(src, size, count)
+    # Each worker also needs its line count, so the merge can number lines globally
+    line_counts = []
+    for chunk_start, chunk_end in chunks:
+        src.seek(chunk_start)
+        line_counts.append(_count_source_lines(src, chunk_end - chunk_start))
+    part_paths = [output_path.parent / f".tmp_{os.getpid()}_{i}_{output_path.name}"
+                  for i in range(len(chunks))]
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_render_chunk, [str(jsonl_path)] * len(chunks),
+                                    [c[0] for c in chunks], [c[1] for c in chunks],
+                                    [str(p) for p in part_paths]))
+
+        # Report the first invalid line by its line number in the whole file
+        bases = [sum(line_counts[:i]) for i in range(len(chunks))]
+        for base, result in zip(bases, results):
+            if result['error'] is not None:
+                line, message = result['error']
+                raise ExportError(f"Invalid JSON on line {base + line}: {message}")
+        total_lines = sum(line_counts)
+
+        counters = new_session_counters()
+        for result in results:
+            merge_session_counters(counters, result['counters'])
+
+        # Pair across chunks, in source order, exactly as the serial pairing would
+        open_slots = {}  # tool_use_id -> (line, source offset, chunk, position, entry start)
+        expired = {}
+        fills = []  # (result line, tool_use_id, slot line) of results placed across chunks
+        inserts = [[] for _ in chunks]  # per chunk: (position, source chunk, start, end)
+        skips = [[] for _ in chunks]
+        for i, (base, result) in enumerate(zip(bases, results)):
+            for tool_use_id, line, start, end in result['orphans']:
+                slot = open_slots.pop(tool_use_id, None)
+                if slot is not None and base + line - slot[0] <= PAIRING_WINDOW_LINES:
+                    inserts[slot[2]].append((slot[3], i, start, end))
+                    skips[i].append((start, end))
+                    fills.append((base + line, tool_use_id, slot[0]))
+                else:
+                    expired.pop(tool_use_id, None)
+            for tool_use_id, line in result['expired'].items():
+                expired[tool_use_id] = base + line
+            for tool_use_id, line, offset, position, entry_start in result['open_slots']:
+                open_slots[tool_use_id] = (base + line, offset, i, position, entry_start)
+        for tool_use_id, slot in list(open_slots.items()):
+            if total_lines - slot[0] > PAIRING_WINDOW_LINES:
+                expired[tool_use_id] = slot[0]
+                del open_slots[tool_use_id]
+        pending = min(open_slots.values(), default=None)
+        unanswered = len(open_slots) + len(expired)
+        answered = []
+        if pending is not None:
+            # Results at or past the pending entry that answered earlier tool uses
+            base = bases[pending[2]]
+            fills.extend((base + result_line, tool_use_id, base + slot_line)
+                         for result_line, tool_use_id, slot_line in results[pending[2]]['fills'])
+            answered = [tool_use_id for result_line, tool_use_id, slot_line in fills
+                        if slot_line < pending[0] <= result_line]
+
+        header = format_header(session_info_from_counters(counters))
+        header_bytes = header.encode('utf-8')
+        committed = None
+        body_bytes = 0  # counted rather than taken from tell(): the output may be compressed
+        with open_output(output_path) as f:
+            f.write(header_bytes)
+            for i, part_path in enumerate(part_paths):
+                edits = sorted([(pos, 0, source, start, end) for pos, source, start, end in inserts[i]]
+                               + [(start, 1, None, start, end) for start, end in skips[i]])
+                if pending is not None and pending[2] == i:
+                    # Resolved after any insert at the same position
+                    edits = sorted(edits + [(pending[4], 0.5, None, None, None)])
+                with open(part_path, 'rb') as part:
+                    position = 0
+                    for at, kind, source, start, end in edits:
+                        body_bytes += _copy_range(part, f, position, at)
+                        position = at
+                        if kind == 0:
+                            with open(part_paths[source], 'rb') as other:
+                                body_bytes += _copy_range(other, f, start, end)
+                        elif kind == 1:
+                            position = end
+                        else:
+                            committed = body_bytes
+                    body_bytes += _copy_range(part, f, position, os.fstat(part.fileno()).st_size)
+            written = body_bytes
+            for text in unanswered_lines(unanswered):
+                data = ('\n' + text).encode('utf-8')
+                f.write(data)
+                written += len(data)
+    finally:
+        for part_path in part_paths:
+            part_path.unlink(missing_ok=True)
+
+    consumed = next((r['consumed'] for r in reversed(results) if r['consumed'] is not None), None)
+    state = {
+        'pending_line': pending[0] if pending else total_lines + 1,
+        'pending_offset': pending[1] if pending else consumed,
+        'consumed': consumed,
+        'committed_bytes': committed if pending else body_bytes,
+        'written_bytes': written,
+        'body_bytes': body_bytes,
+        'unanswered': unanswered,
+        'expired': expired,
+        'answered': answered
+    }
+    state['committed_size'] = len(header_bytes) + state['committed_bytes']
+    return header, state, counters
+
+
+def _count_source_lines(f, length):
+    """Count the lines in the next `length` bytes of a binary file."""
+    lines = 0
+    last = b'\n'
+    while length > 0:
+        block = f.read(min(length, 1024 * 1024))
+        if not block:
+            break
+        lines += block.count(b'\n')
+        last = block[-1:]
+        length -= len(block)
+    return lines + (last != b'\n')
+
+
+def _copy_range(src, dst, start, end):
+    """Copy bytes [start, end) of src to dst; return how many were copied."""
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = src.read(min(remaining, 1024 * 1024))
+        if not block:
+            break
+        dst.write(block)
+        remaining -= len(block)
+    return end - start - remaining
+
+
+def transcript_name(path):
+    """A transcript's name without its .jsonl[.gz|.zst] suffix, or None if it is not one."""
+    name = Path(path).name
+    suffix = next((s for s in TRANSCRIPT_SUFFIXES if name.endswith(s)), None)
+    return name[:-len(suffix)] if suffix else None
+
+
+def find_subagent_files(session_path):
+    """Find a session's subagent transcripts, keyed by agent ID.
+
+    They live under a directory named for the session's UUID beside its
+    transcript (<uuid>/subagents/agent-<id>.jsonl).
+    """
+    session_path = Path(session_path)
+    agent_dir = session_path.parent / (transcript_name(session_path) or session_path.stem)
+    agents = {}
+    for path in sorted(agent_dir.rglob('*')) if agent_dir.is_dir() else []:
+        name = transcript_name(path)
+        if name is not None and path.is_file():
+            agents[name[len('agent-'):] if name.startswith('agent-') else name] = path
+    return agents
+
+
+# A Task result names the subagent that produced it on a line of its own
+AGENT_ID_RE = re.compile(r'^agentId: ([\w-]+)', re.MULTILINE)
+
+
+def subagent_id(entry, block):
+    """The agent ID a Task tool_result block came from, or None."""
+    content = block.get('content')
+    texts = [content] if isinstance(content, str) else [
+        item.get('text', '') for item in content or []
+        if isinstance(item, dict) and item.get('type') == 'text']
+    for text in texts:
+        match = AGENT_ID_RE.search(text) if isinstance(text, str) else None
+        if match:
+            return match.group(1)
+    # Fall back to the structured result, which describes the entry's only result
+    result = entry.get('toolUseResult')
+    if isinstance(result, dict) and isinstance(result.get('agentId'), str) \
+            and len(_tool_result_blocks(entry)) == 1:
+        return result['agentId']
+    return None
+
+
+def _render_subagent(path):
+    """Worker: render a subagent transcript's body lines.
+
+    A subagent may still be running, so lines that fail to decode (a
+    half-written last line) are skipped rather than fatal.
+    """
+    def entries(f):
+        for data in f:
+            try:
+                entry = decode_entry(data)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                yield entry
+
+    with open_transcript(path) as f:
+        return [text for lines in render_entries(entries(f)) for text in lines.split('\n')]
+
+
+class SubagentSplicer:
+    """Splice each subagent transcript inline under the Task call that spawned it.
+
+    Every subagent transcript is submitted to a process pool up front, so
+    they are read and rendered concurrently while the parent session
+    streams; a Task result only waits for its own agent. The rendering is
+    indented under the result, inside a ┌ │ └ frame. Subagents no Task
+    result names are appended at the end of the export.
+    """
+
+    def __init__(self, session_path, workers=None):
+        self.paths = find_subagent_files(session_path)
+        self.pool = None
+        self.futures = {}
+        self.spliced = set()
+        if len(self.paths) > 1 and workers != 1:
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(workers or os.cpu_count() or 1, len(self.paths)))
+            self.futures = {agent_id: self.pool.submit(_render_subagent, str(path))
+                            for agent_id, path in self.paths.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def block(self, agent_id):
+        """The framed, indented rendering of one subagent transcript."""
+        self.spliced.add(agent_id)
+        path = self.paths[agent_id]
+        try:
+            future = self.futures.get(agent_id)
+            body = future.result() if future is not None else _render_subagent(str(path))
+        except (OSError, EOFError) as e:
+            body = [f"✗ Could not read {path.name}: {e}"]
+        return ([f"  ┌─ Subagent {agent_id} ({path.name})"]
+                + [f"  │ {text}" if text else "  │" for text in body]
+                + ["  └─"])
+
+    def wrap(self, render):
+        """Wrap an entry renderer so Task results carry their subagent's transcript."""
+        def render_with_subagents(entry):
+            pieces = render(entry)
+            if entry.get('type') != 'user' or not self.paths:
+                yield from pieces
+                return
+            agent_ids = iter([subagent_id(entry, block) for block in _tool_result_blocks(entry)])
+            for kind, tool_use_id, lines in pieces:
+                if kind == 'tool_result':
+                    agent_id = next(agent_ids, None)
+                    if agent_id in self.paths and agent_id not in self.spliced:
+                        lines = self.block(agent_id) + lines
+                yield kind, tool_use_id, lines
+        return render_with_subagents
+
+    def unlinked_lines(self):
+        """Subagents no Task result pointed at, rendered one after another."""
+        lines = []
+        for agent_id in self.paths:
+            if agent_id not in self.spliced:
+                lines.extend([f"⏺ Subagent {agent_id} (no Task call names it)"]
+                             + self.block(agent_id) + [""])
+        return lines
+
+
+class SecretsFound(ExportError):
+    """A secret scan hit the rendered export, so it was not written.
+
+    findings are (location, labels, text) as scan_secrets.format_report
+    takes them, located by the output line each would have had; report is
+    that report, as lines.
+    """
+
+    def __init__(self, output_path, findings):
+        super().__init__(f"Secret scan found {len(findings)} finding(s); "
+                         f"not written: {output_path}")
+        self.findings = [(f"{output_path}:{line}", labels, text)
+                         for line, labels, text in findings]
+        self.report = []
+
+
+class ScanningWriter:
+    """Wrap a binary file so everything written also feeds a secret scanner."""
+
+    def __init__(self, f, scanner):
+        self.f = f
+        self.scanner = scanner
+
+    def write(self, data):
+        self.scanner.feed(data)
+        return self.f.write(data)
+
+
+def load_secret_scanner(path):
+    """Import knowledge-commons' scan_secrets.py, given it or the scan-secrets.sh beside it."""
+    path = Path(path).expanduser()
+    if path.suffix == '.sh':
+        path = path.with_name('scan_secrets.py')
+    spec = importlib.util.spec_from_file_location("scan_secrets", path)
+    if spec is None:
+        raise ImportError(f"not a Python module: {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scan_rendered(scanner, header):
+    """Finish a body scan and scan the header; return findings numbered as output lines.
+
+    The body is written after the header, which ends in a newline, so body
+    line n is output line n + the header's newline count.
+    """
+    scanner.finish()
+    header_scanner = type(scanner)()
+    header_scanner.feed(header)
+    header_scanner.finish()
+    offset = header.count('\n')
+    return header_scanner.findings + [
+        [line + offset, labels, text] for line, labels, text in scanner.findings]
+
+
+def _open_source(jsonl_path):
+    """Open a transcript for export, raising ExportError if it cannot be read."""
+    try:
+        return open_transcript(jsonl_path)
+    except FileNotFoundError:
+        raise ExportError(f"Session file not found: {jsonl_path}") from None
+    except PermissionError:
+        raise ExportError(f"Permission denied reading: {jsonl_path}") from None
+    except OSError as e:
+        raise ExportError(str(e)) from None
+
+
+def export_session(jsonl_path, output_path, incremental=False, stats=None, jobs=None,
+                   formats=None, subagents=False, workers=None, scan_secrets=None,
+                   chunk_tokens=None):
+    """Export JSONL session to UI-style readable text format; return an ExportResult.
+
+    Streams the transcript: entries are decoded, rendered and written one at a
+    time, so memory stays flat regardless of session size. The header needs
+    metadata from the whole session, so the body is rendered to a temp file
+    beside the output first and the header is written in front of it once the
+    counters are complete (deferred header).
+
+    With incremental=True, a checkpoint sidecar (<output>.checkpoint.json)
+    records how far the source was consumed. A re-export of a still-growing
+    transcript seeks to that offset, renders only the new entries and appends
+    them; if the checkpoint no longer matches the files, it falls back to a
+    full export.
+
+    Pass an ExportStats as stats to have per-phase timings, byte counts and
+    per-entry-type/tool render costs recorded into it.
+
+    With jobs > 1, a full export of a transcript of at least
+    PARALLEL_MIN_BYTES is split at line boundaries and rendered across that
+    many worker processes; the output is identical to the serial path.
+
+    A gzip or zstd transcript (recognised by its magic bytes) is decompressed
+    as a stream, and an output path ending in .gz or .zst is compressed as it
+    is written. Neither can be seeked, so compressed exports are always full
+    and serial.
+
+    formats lists output formats from OUTPUT_SINKS (default: text only).
+    Several formats are rendered from one decode pass, each to the path
+    format_outputs gives it; such exports are also always full and serial.
+
+    With subagents=True, the session's subagent transcripts are rendered
+    across up to `workers` processes and spliced into the text export under
+    the Task calls that spawned them (see SubagentSplicer). They change
+    independently of the session, so such exports are always full.
+
+    scan_secrets names knowledge-commons' scan_secrets.py (or the
+    scan-secrets.sh beside it). The rendered text is then scanned for
+    credential shapes as it is written, and the output is only written if
+    the scan is clean; otherwise SecretsFound is raised. A scanner that
+    cannot be loaded raises ExportError with exit_code 2. Scanned exports
+    are text only (other formats raise ExportError), full and serial.
+
+    With chunk_tokens, the text export is split into self-contained chunks
+    of about that many estimated tokens, cut on turn and compaction edges,
+    each behind its own copy of the header; <output>.chunks.json indexes
+    them by byte offset and output line (see ChunkedTextSink). Chunked
+    exports are always full and serial.
+
+    Requested modes that cannot apply are noted in the result's notes; a
+    combination that would silently drop part of the request (subagents or
+    stats with other formats, stats with chunks) raises ExportError, as do
+    other failures.
+    """
+    output_path = Path(output_path)
+    notes = []
+    scanner = None
+    other_formats = bool(formats) and list(formats) != ['text']
+    if chunk_tokens and (scan_secrets or other_formats):
+        raise ExportError("Chunked exports are text only, without a secret scan")
+    if other_formats and subagents:
+        raise ExportError("Exports with subagents are text only")
+    if stats is not None and (other_formats or chunk_tokens):
+        raise ExportError("Export stats apply to unchunked text exports only")
+    if scan_secrets and other_formats:
+        # Only the text export is scanned; any other format would be written unchecked
+        raise ExportError("Secret-scanned exports are text only")
+    if scan_secrets:
+        try:
+            scan_module = load_secret_scanner(scan_secrets)
+        except (OSError, ImportError, SyntaxError) as e:
+            raise ExportError(f"Cannot load secret scanner {scan_secrets}: {e}", 2) from None
+        try:
+            scanner = scan_module.SecretScanner()
+        except scan_module.ScanError as e:
+            raise ExportError(f"Secret scanner failed: {e}", 2) from None
+        if incremental:
+            notes.append("secret-scanned exports cannot be resumed; exporting in full")
+        incremental = False
+        jobs = None
+
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    except PermissionError:
+        raise ExportError(f"Permission denied writing to: {output_path}") from None
+    except OSError as e:
+        raise ExportError(f"Failed to write file: {e}") from None
+
+    src = _open_source(jsonl_path)
+    compressed = transcript_compression(jsonl_path) is not None
+    if output_compression(output_path) == 'zstd' and zstd is None:
+        src.close()
+        raise ExportError(f"zstd output needs Python 3.14+ or the zstandard package: "
+                          f"{output_path}")
+
+    if compressed or output_compression(output_path):
+        # Checkpoints resume by seeking the source and appending to the output
+        if incremental:
+            notes.append("compressed files cannot be resumed; exporting in full")
+        incremental = False
+        jobs = None
+
+    if subagents:
+        if incremental:
+            notes.append("exports with subagents cannot be resumed; exporting in full")
+        incremental = False
+        jobs = None
+
+    if chunk_tokens:
+        if incremental:
+            notes.append("chunked exports cannot be resumed; exporting in full")
+        splicer = SubagentSplicer(jsonl_path, workers) if subagents else contextlib.nullcontext()
+        with src, splicer:
+            return _export_session_chunked(src, jsonl_path, output_path, chunk_tokens,
+                                           splicer if subagents else None, notes)
+
+    if other_formats:
+        with src:
+            return _export_session_formats(src, jsonl_path, format_outputs(output_path, formats),
+                                           incremental, notes)
+
+    if stats is not None:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+    splicer = SubagentSplicer(jsonl_path, workers) if subagents else contextlib.nullcontext()
+    with src, splicer:
+        checkpoint = load_checkpoint(jsonl_path, src, output_path) if incremental else None
+        # A checkpoint records complete lines only; a half-written last line waits for the next run
+        limit = complete_size(src) if incremental else None
+        if limit is not None and limit < os.fstat(src.fileno()).st_size:
+            notes.append("the last line is still being written; stopped before it")
+        try:
+            if checkpoint and limit == checkpoint['source_size']:
+                return ExportResult(jsonl_path, {'text': output_path},
+                                    session_info_from_counters(checkpoint['counters']),
+                                    notes=notes, up_to_date=True)
+            if checkpoint:
+                header, state, counters = _export_resume(src, output_path, checkpoint, stats,
+                                                         limit)
+            elif (jobs or 1) > 1 and stats is None and \
+                    os.fstat(src.fileno()).st_size >= PARALLEL_MIN_BYTES:
+                header, state, counters = _export_parallel(src, jsonl_path, output_path, jobs,
+                                                           limit)
+            else:
+                header, state, counters = _export_full(src, output_path, stats,
+                                                       splicer if subagents else None, scanner,
+                                                       limit)
+            if incremental:
+                save_checkpoint(jsonl_path, src, output_path, header, state, counters)
+        except SecretsFound as e:
+            e.report = scan_module.format_report(e.findings)
+            raise
+        except PermissionError:
+            raise ExportError(f"Permission denied writing to: {output_path}") from None
+        except EOFError:
+            raise ExportError(f"Compressed session file is truncated: {jsonl_path}") from None
+        except gzip.BadGzipFile as e:
+            raise ExportError(f"Corrupt compressed session file: {jsonl_path} ({e})") from None
+        except OSError as e:
+            raise ExportError(f"Failed to write file: {e}") from None
+
+    if stats is not None:
+        stats.total_wall = time.perf_counter() - wall_start
+        stats.total_cpu = time.process_time() - cpu_start
+        stats.bytes_out = output_path.stat().st_size
+
+    return ExportResult(jsonl_path, {'text': output_path}, session_info_from_counters(counters),
+                        state['unanswered'], notes, secret_scan=scanner is not None)
+
+
+def _export_session_formats(src, jsonl_path, outputs, incremental, notes):
+    """export_session for several output formats at once."""
+    if incremental:
+        notes.append("multi-format exports cannot be resumed; exporting in full")
+    try:
+        for path in outputs.values():
+            path.parent.mkdir(parents=True, exist_ok=True)
+        unanswered, counters = _export_formats(src, outputs)
+    except PermissionError as e:
+        raise ExportError(f"Permission denied writing to: {e.filename}") from None
+    except EOFError:
+        raise ExportError(f"Compressed session file is truncated: {jsonl_path}") from None
+    except gzip.BadGzipFile as e:
+        raise ExportError(f"Corrupt compressed session file: {jsonl_path} ({e})") from None
+    except OSError as e:
+        raise ExportError(f"Failed to write file: {e}") from None
+
+    return ExportResult(jsonl_path, outputs, session_info_from_counters(counters), unanswered,
+                        notes)
+
+
+def _export_session_chunked(src, jsonl_path, output_path, chunk_tokens, subagents, notes):
+    """export_session for a chunked text export."""
+    try:
+        unanswered, counters, chunks = _export_chunked(src, jsonl_path, output_path,
+                                                       chunk_tokens, subagents)
+    except PermissionError:
+        raise ExportError(f"Permission denied writing to: {output_path}") from None
+    except EOFError:
+        raise ExportError(f"Compressed session file is truncated: {jsonl_path}") from None
+    except gzip.BadGzipFile as e:
+        raise ExportError(f"Corrupt compressed session file: {jsonl_path} ({e})") from None
+    except OSError as e:
+        raise ExportError(f"Failed to write file: {e}") from None
+
+    return ExportResult(jsonl_path, {'text': output_path, 'index': chunk_index_path(output_path)},
+                        session_info_from_counters(counters), unanswered, notes, chunks=chunks)
+
+
+# Session transcripts are named for their UUID; a directory named for one holds
+# that session's subagent transcripts, which are not sessions in their own right.
+SESSION_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def is_subagent_transcript(path):
+    """True if a transcript sits under a session's nested subagent directory."""
+    return any(SESSION_UUID_RE.match(part) or part == 'subagents'
+               for part in Path(path).parent.parts)
+
+
+def find_session_files(source):
+    """Resolve a directory or glob to top-level session transcripts, keyed by UUID.
+
+    Mirrors the .commons.yml session source: a matched directory contributes
+    its top-level *.jsonl files (and archived *.jsonl.gz / *.jsonl.zst ones),
+    and nested subagent transcripts are skipped.
+    A transcript that appears under two project directories (it moved when a
+    worktree was created or removed) is one session; the most recently
+    modified copy wins.
+    """
+    candidates = []
+    for match in glob.glob(os.path.expanduser(source), recursive=True):
+        if os.path.isdir(match):
+            for suffix in TRANSCRIPT_SUFFIXES:
+                candidates.extend(glob.glob(os.path.join(match, '*' + suffix)))
+        else:
+            candidates.append(match)
+
+    sessions = {}
+    for match in sorted(candidates):
+        path = Path(match)
+        uuid = transcript_name(path)
+        if uuid is None or not path.is_file() or is_subagent_transcript(path):
+            continue
+        current = sessions.get(uuid)
+        if current is None or path.stat().st_mtime > current.stat().st_mtime:
+            sessions[uuid] = path
+    return sessions
+
+
+def _export_one(jsonl_path, output_path, incremental=False, formats=None, subagents=False):
+    """Batch worker: run export_session; return its ExportResult, or the failure as text."""
+    try:
+        # Sessions are already spread over the batch pool; read subagents in-process
+        return export_session(jsonl_path, output_path, incremental, formats=formats,
+                              subagents=subagents, workers=1)
+    except ExportError as e:
+        return str(e)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def export_batch(source, out_dir, workers=None, incremental=False, compress=None,
+                 formats=None, subagents=False):
+    """Export every session matching a directory or glob across a process pool.
+
+    Outputs are written to <out_dir>/<uuid>.txt, or <uuid>.txt.gz / .txt.zst
+    with compress='gz' / 'zst'; other formats are named as format_outputs
+    names them. Returns (sessions, results): the matching transcripts by
+    UUID, and by UUID each one's ExportResult or, if it failed, ExportError.
+    Raises ExportError if nothing matches.
+    """
+    sessions = find_session_files(source)
+    if not sessions:
+        raise ExportError(f"No session transcripts match: {source}")
+
+    out_dir = Path(out_dir)
+    extension = f".txt.{compress}" if compress else ".txt"
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_export_one, str(path), str(out_dir / f"{uuid}{extension}"),
+                        incremental, formats, subagents): uuid
+            for uuid, path in sessions.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            uuid = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # a worker that died outright
+                result = f"{type(e).__name__}: {e}"
+            results[uuid] = ExportError(result) if isinstance(result, str) else result
+    return sessions, results
+
+
+# Follow mode: how often the transcript is polled for appends, which bounds
+# the time from a line landing to its rendering being flushed
+FOLLOW_POLL_SECONDS = 0.25
+# Written when the followed transcript is rewritten and rendered again from its start
+REWRITTEN_LINES = ["", "═" * 80, " Transcript rewritten · following it again from line 1 ",
+                   "═" * 80, ""]
+
+
+class TranscriptFollower:
+    """Read complete lines from a transcript that is still being written.
+
+    A trailing line without its newline is held back until the rest of it
+    lands. When the path stops naming the open file (the transcript moved to
+    another worktree project directory, or was rotated), the follower finds
+    the session again by UUID: a copy that still starts with the bytes
+    already read is resumed at the same offset, anything else is read from
+    its start. A file truncated in place is also re-read from its start.
+    check() reports which happened, so the caller can start a new section.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.uuid = transcript_name(self.path)
+        self.src = open(self.path, 'rb')
+        self.partial = b''
+        self.consumed = 0
+
+    def close(self):
+        self.src.close()
+
+    def lines(self):
+        """Yield the complete lines appended since the last call."""
+        while True:
+            data = self.src.readline()
+            if not data:
+                return
+            self.partial += data
+            if not self.partial.endswith(b'\n'):
+                return
+            line, self.partial = self.partial, b''
+            self.consumed += len(line)
+            yield line
+
+    def check(self):
+        """Switch files if the transcript was moved, rotated or truncated.
+
+        Returns (note, restarted): a note for the user or None, and whether
+        reading starts over from the beginning of a rewritten file.
+        """
+        stat = os.fstat(self.src.fileno())
+        if stat.st_size < self.consumed + len(self.partial):
+            self._reopen(self.path, 0)
+            return f"{self.path} was truncated; reading it from the start", True
+        try:
+            current = os.stat(self.path)
+            if (current.st_dev, current.st_ino) == (stat.st_dev, stat.st_ino):
+                return None, False
+            path = self.path
+        except FileNotFoundError:
+            # Moved: look for the session in the sibling project directories
+            path = find_session_files(str(self.path.parent.parent / '*')).get(self.uuid)
+            if path is None:
+                return None, False
+            current = os.stat(path)
+            if (current.st_dev, current.st_ino) == (stat.st_dev, stat.st_ino):
+                self.path = path
+                return f"following {path}", False
+
+        fingerprint = source_fingerprint(self.src, self.consumed)
+        with open(path, 'rb') as candidate:
+            continues = (current.st_size >= self.consumed
+                         and source_fingerprint(candidate, self.consumed) == fingerprint)
+        self._reopen(path, self.consumed if continues else 0)
+        if continues:
+            return f"following {path}", False
+        return f"{path} was replaced; reading it from the start", True
+
+    def _reopen(self, path, offset):
+        self.src.close()
+        self.path = Path(path)
+        self.src = open(self.path, 'rb')
+        self.src.seek(offset)
+        self.partial = b''
+        self.consumed = offset
+
+
+def follow_session(jsonl_path, output_path, poll_interval=FOLLOW_POLL_SECONDS):
+    """Export a live session, then keep rendering entries as they are appended.
+
+    Everything already in the transcript is rendered first, with the header
+    describing it. After that the transcript is polled every poll_interval
+    seconds; new complete lines are decoded, rendered and flushed to the
+    output (stdout when output_path is '-'). Tool results are still placed
+    under their tool uses, so output after a tool call waits for its result.
+    A transcript rewritten rather than appended to is not appended to the
+    output twice over: what was queued is written out, a separator marks the
+    rewrite, and the new file is rendered from line 1 with fresh pairing.
+    Runs until KeyboardInterrupt, then writes what is still queued and the
+    note on unanswered tool uses; installing signal handlers that raise it
+    is left to the caller. An output ending in .gz or .zst is compressed.
+    Status messages go to stderr; failures to start raise ExportError.
+    """
+    try:
+        if transcript_compression(jsonl_path) is not None:
+            raise ExportError(f"Cannot follow a compressed transcript: {jsonl_path}")
+        follower = TranscriptFollower(jsonl_path)
+    except FileNotFoundError:
+        raise ExportError(f"Session file not found: {jsonl_path}") from None
+    except PermissionError:
+        raise ExportError(f"Permission denied reading: {jsonl_path}") from None
+
+    counters = new_session_counters()
+    pairing = ToolResultPairing()
+    line_number = 0
+    lines_before = 0  # lines of files rewritten since following started
+
+    def render_new(out):
+        """Render the lines that landed since the last poll; return how many there were."""
+        nonlocal line_number
+        count = 0
+        for data in follower.lines():
+            line_number += 1
+            count += 1
+            try:
+                entry = decode_entry(data)
+            except ValueError as e:
+                print(f"⚠ Skipping invalid JSON on line {line_number}: {e}", file=sys.stderr)
+                continue
+            if not isinstance(entry, dict):
+                continue
+            update_session_counters(counters, entry)
+            write_items(out, pairing.add(line_number, None, render_entry(entry)))
+        return count
+
+    def write_items(out, items):
+        for item in items:
+            for text in item.lines:
+                out.write(('\n' + text).encode('utf-8'))
+
+    def write_closing(out):
+        write_items(out, pairing.finish())
+        for text in unanswered_lines(pairing.unanswered):
+            out.write(('\n' + text).encode('utf-8'))
+
+    if output_path == '-':
+        out = sys.stdout.buffer
+    else:
+        output_path = Path(output_path)
+        try:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            out = open_output(output_path)
+        except OSError as e:
+            follower.close()
+            raise ExportError(f"Failed to write file: {e}") from None
+
+    try:
+        # Catch up: render what is there already, so the header can describe it
+        with tempfile.TemporaryFile() as body:
+            render_new(body)
+            out.write(format_header(session_info_from_counters(counters)).encode('utf-8'))
+            body.seek(0)
+            shutil.copyfileobj(body, out)
+        out.flush()
+        print(f"✓ Following {follower.path} (Ctrl-C to stop)", file=sys.stderr)
+
+        while True:
+            time.sleep(poll_interval)
+            if not render_new(out):
+                note, restarted = follower.check()
+                if restarted:
+                    # Its entries were rendered already: close that section, start afresh
+                    write_closing(out)
+                    for text in REWRITTEN_LINES:
+                        out.write(('\n' + text).encode('utf-8'))
+                    counters = new_session_counters()
+                    pairing = ToolResultPairing()
+                    lines_before += line_number
+                    line_number = 0
+                if note:
+                    print(f"  {note}", file=sys.stderr)
+                    render_new(out)
+            out.flush()
+    except KeyboardInterrupt:
+        write_closing(out)
+        out.flush()
+        print(f"✓ Stopped following after {lines_before + line_number} lines", file=sys.stderr)
+    finally:
+        follower.close()
+        if out is not sys.stdout.buffer:
+            out.close()
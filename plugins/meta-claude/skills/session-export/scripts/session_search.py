@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Full-text search across Claude Code session transcripts.
+
+Builds an SQLite FTS5 inverted index from the same blocks session_export.py
+renders: user prompts (format_user_message), assistant text, and tool calls
+as their name plus the parameters format_tool_params produces. Each indexed
+block keeps its session UUID and entry position (JSONL line and byte
+offset), so a hit can be traced back to the raw transcript.
+
+Indexing is incremental: unchanged transcripts are skipped without being
+read, a transcript that only grew is tokenized from where the last run
+stopped, and the blocks of a transcript that no longer exists are dropped.
+
+Requires Python 3.8+ and an sqlite3 build with FTS5 (the default almost
+everywhere).
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import session_catalog
+import session_export as exporter
+
+
+class SearchError(Exception):
+    """The search index cannot be used here (sqlite3 without FTS5)."""
+
+
+# Blocks are inserted this many at a time, so memory stays flat however long a transcript is
+INSERT_BATCH_ROWS = 5000
+
+
+def get_index_path():
+    """The search index lives beside the session catalog."""
+    return session_catalog.get_catalog_path().parent / "search.db"
+
+
+def connect(path=None):
+    """Open (creating if needed) the search index; raise SearchError without FTS5."""
+    path = Path(path) if path else get_index_path()
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if not path.exists():
+        # Create with restricted permissions from the start: this is transcript text
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                uuid TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                offset INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                fingerprint TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS blocks USING fts5(
+                text,
+                uuid UNINDEXED,
+                line UNINDEXED,
+                offset UNINDEXED,
+                kind UNINDEXED,
+                tool UNINDEXED
+            );
+        """)
+    except sqlite3.OperationalError as e:
+        conn.close()
+        raise SearchError(f"sqlite3 here has no FTS5 support ({e})") from None
+    return conn
+
+
+def connect_or_exit(path=None):
+    """connect() for the command line: report a SearchError and exit 1."""
+    try:
+        return connect(path)
+    except SearchError as e:
+        print(f"✗ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def entry_blocks(entry):
+    """Yield (kind, tool, text) for each searchable block, as the exporter renders it."""
+    entry_type = entry.get('type')
+
+    if entry_type == 'user':
+        text = exporter.format_user_message(entry)
+        if text:
+            yield 'user', None, text
+
+    elif entry_type == 'assistant':
+        content = entry.get('message', {}).get('content', [])
+        if isinstance(content, str):
+            content = [{'type': 'text', 'text': content}]
+        for block in content:
+            if not isinstance(block, dict):
+                continue
+            if block.get('type') == 'text':
+                text = block.get('text', '').strip()
+                if text:
+                    yield 'assistant', None, f"⏺ {text}"
+            elif block.get('type') == 'tool_use':
+                name = block.get('name', 'Unknown')
+                tool_input = block.get('input', {})
+                if not isinstance(tool_input, dict):
+                    tool_input = {}
+                text = f"⏺ {name}({exporter.format_tool_params(tool_input, name)})"
+                # Read renders only the filename; keep the full path searchable
+                file_path = tool_input.get('file_path')
+                if isinstance(file_path, str) and file_path not in text:
+                    text += f"\n  {file_path}"
+                yield 'tool', name, text
+
+
+def index_transcript(conn, uuid, path, previous=None):
+    """Tokenize a transcript's new entries into the index; return its file state.
+
+    `previous` is the file's last state; when the transcript was only
+    appended to, indexing resumes at its offset. Only newline-terminated
+    lines are consumed, and lines that fail to decode are skipped. A
+    compressed transcript is always tokenized from the start.
+    """
+    stat = path.stat()
+    if exporter.transcript_compression(path) is not None:
+        previous = None
+    with exporter.open_transcript(path) as f:
+        if previous is not None and (
+                stat.st_size < previous['offset']
+                or exporter.source_fingerprint(f, previous['offset']) != previous['fingerprint']):
+            previous = None
+        if previous is None:
+            # New, rewritten or truncated: drop anything indexed for it before
+            conn.execute("DELETE FROM blocks WHERE uuid = ?", (uuid,))
+            offset, line_number = 0, 0
+        else:
+            offset, line_number = previous['offset'], previous['line']
+
+        f.seek(offset)
+        rows = []
+        added = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            start = offset
+            offset += len(line)
+            line_number += 1
+            try:
+                entry = exporter.decode_entry(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            for kind, tool, text in entry_blocks(entry):
+                rows.append((text, uuid, line_number, start, kind, tool))
+            if len(rows) >= INSERT_BATCH_ROWS:
+                added += _insert_blocks(conn, rows)
+        added += _insert_blocks(conn, rows)
+
+        fingerprint = exporter.source_fingerprint(f, offset)
+
+    conn.execute("""
+        INSERT OR REPLACE INTO files (uuid, path, size, mtime, offset, line, fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (uuid, str(path), stat.st_size, stat.st_mtime, offset, line_number, fingerprint))
+    return added
+
+
+def _insert_blocks(conn, rows):
+    """Insert a batch of block rows and empty the list; return how many there were."""
+    conn.executemany(
+        "INSERT INTO blocks (text, uuid, line, offset, kind, tool) VALUES (?, ?, ?, ?, ?, ?)",
+        rows)
+    count = len(rows)
+    rows.clear()
+    return count
+
+
+def update_index(conn, sources, verbose=False):
+    """Bring the index up to date; returns (indexed_files, new_blocks, unchanged, removed).
+
+    As in the catalog, a session the sources did not turn up is dropped once
+    its recorded transcript is gone; one outside the sources that still
+    exists is kept.
+    """
+    indexed = blocks = unchanged = removed = 0
+    sessions = session_catalog.collect_sessions(sources)
+    for uuid, path in sorted(sessions.items()):
+        stat = path.stat()
+        row = conn.execute("SELECT * FROM files WHERE uuid = ?", (uuid,)).fetchone()
+        if row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+            if row['path'] != str(path):
+                # Moved between project directories; its blocks are still valid
+                conn.execute("UPDATE files SET path = ? WHERE uuid = ?", (str(path), uuid))
+            unchanged += 1
+            continue
+        try:
+            added = index_transcript(conn, uuid, path, dict(row) if row is not None else None)
+        except (OSError, EOFError) as e:
+            print(f"✗ {uuid} ({path}): {e}", file=sys.stderr)
+            continue
+        conn.commit()
+        indexed += 1
+        blocks += added
+        if verbose:
+            print(f"  indexed {uuid}: {added} blocks")
+
+    for row in conn.execute("SELECT uuid, path FROM files").fetchall():
+        if row['uuid'] not in sessions and not os.path.exists(row['path']):
+            conn.execute("DELETE FROM blocks WHERE uuid = ?", (row['uuid'],))
+            conn.execute("DELETE FROM files WHERE uuid = ?", (row['uuid'],))
+            removed += 1
+            if verbose:
+                print(f"  removed {row['uuid']}")
+    conn.commit()
+    return indexed, blocks, unchanged, removed
+
+
+def search(conn, query, kind=None, tool=None, session=None, limit=20, raw=False):
+    """Return hits for a query, best match first.
+
+    By default the query is matched as a phrase (token sequence), which is
+    what error strings and file paths need; raw=True passes FTS5 query
+    syntax through unchanged.
+    """
+    match = query if raw else '"' + query.replace('"', '""') + '"'
+    clauses = ["blocks MATCH ?"]
+    params = [match]
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if tool:
+        clauses.append("tool = ?")
+        params.append(tool)
+    if session:
+        clauses.append("uuid = ?")
+        params.append(session)
+    params.append(limit)
+    return conn.execute(f"""
+        SELECT uuid, line, offset, kind, tool,
+               snippet(blocks, 0, '[', ']', '…', 16) AS snippet
+        FROM blocks WHERE {' AND '.join(clauses)}
+        ORDER BY rank LIMIT ?
+    """, params).fetchall()
+
+
+def cmd_update(args):
+    conn = connect_or_exit(args.db)
+    indexed, blocks, unchanged, removed = update_index(
+        conn, args.sources or [session_catalog.DEFAULT_SOURCE], args.verbose)
+    print(f"✓ Index updated: {indexed} transcripts tokenized ({blocks} new blocks), "
+          f"{unchanged} unchanged, {removed} removed")
+
+
+def cmd_query(args):
+    conn = connect_or_exit(args.db)
+    try:
+        hits = search(conn, args.query, args.kind, args.tool, args.session, args.limit, args.raw)
+    except sqlite3.OperationalError as e:
+        print(f"✗ Error: Invalid query: {e}", file=sys.stderr)
+        sys.exit(1)
+    for hit in hits:
+        if args.json:
+            print(json.dumps(dict(hit)))
+        else:
+            label = f"{hit['kind']}:{hit['tool']}" if hit['tool'] else hit['kind']
+            snippet = ' '.join(hit['snippet'].split())
+            print(f"{hit['uuid']}:{hit['line']}  {label}  {snippet}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search Claude Code session transcripts")
+    parser.add_argument("--db", help="Index database (default: beside the session catalog)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_p = subparsers.add_parser("update", help="Index new and appended transcript entries")
+    update_p.add_argument("sources", nargs="*",
+                          help=f"Directories or globs (default: {session_catalog.DEFAULT_SOURCE})")
+    update_p.add_argument("-v", "--verbose", action="store_true", help="Name each indexed session")
+
+    query_p = subparsers.add_parser("query", help="Find sessions and entries matching text")
+    query_p.add_argument("query", help="Text to find (matched as a phrase)")
+    query_p.add_argument("--raw", action="store_true", help="Use FTS5 query syntax as-is")
+    query_p.add_argument("--kind", choices=["user", "assistant", "tool"], help="Block kind")
+    query_p.add_argument("--tool", help="Tool name (with --kind tool or alone)")
+    query_p.add_argument("--session", help="Restrict to one session UUID")
+    query_p.add_argument("--limit", type=int, default=20, help="Maximum hits (default: 20)")
+    query_p.add_argument("--json", action="store_true", help="Emit JSON Lines")
+
+    args = parser.parse_args()
+    {"update": cmd_update, "query": cmd_query}[args.command](args)
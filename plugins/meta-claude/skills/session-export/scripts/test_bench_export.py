@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Tests for the synthetic transcript generator in bench_export.py."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+from test_session_export import SCRIPTS_DIR, TempDirTestCase
+
+import bench_export as bench  # noqa: E402
+
+
+def parallel_steps(path):
+    """Lengths of each run of consecutive tool_use entries."""
+    runs, run = [], 0
+    with open(path) as f:
+        for line in f:
+            content = json.loads(line).get('message', {}).get('content')
+            if isinstance(content, list) and content and content[0].get('type') == 'tool_use':
+                run += 1
+            elif run:
+                runs.append(run)
+                run = 0
+    return runs
+
+
+class GeneratorTest(TempDirTestCase):
+
+    def test_a_seed_always_generates_the_same_transcript(self):
+        first, second, other = (self.dir / f'{name}.jsonl' for name in 'abc')
+        entries = bench.generate_transcript(first, 64 * 1024)
+        self.assertEqual(bench.generate_transcript(second, 64 * 1024), entries)
+        self.assertEqual(first.read_bytes(), second.read_bytes())
+        self.assertGreaterEqual(first.stat().st_size, 64 * 1024)
+        bench.generate_transcript(other, 64 * 1024, seed=1)
+        self.assertNotEqual(first.read_bytes(), other.read_bytes())
+
+    def test_max_parallel_bounds_each_step(self):
+        path = self.dir / 'bench.jsonl'
+        bench.generate_transcript(path, 256 * 1024, parallel=1.0, max_parallel=7)
+        runs = parallel_steps(path)
+        self.assertEqual(min(runs), 2)
+        # Beyond the default of 4, and never beyond the knob
+        self.assertGreater(max(runs), 4)
+        self.assertLessEqual(max(runs), 7)
+
+    def test_cli_rejects_max_parallel_below_two(self):
+        result = subprocess.run([sys.executable, str(SCRIPTS_DIR / 'bench_export.py'),
+                                 '--max-parallel', '1'], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn('--max-parallel', result.stderr)
+
+    def test_export_case_reads_every_line(self):
+        path = self.dir / 'bench.jsonl'
+        entries = bench.generate_transcript(path, 64 * 1024)
+        result = bench.run_case('export_session', path)
+        self.assertEqual((result['case'], result['items']), ('export_session', entries))
+        self.assertGreater(result['items_per_s'], 0)
+
+
+class CompareTest(unittest.TestCase):
+
+    def test_only_changes_beyond_the_threshold_are_regressions(self):
+        def result(case, size, items_per_s, peak_rss_kb):
+            return {'case': case, 'size': size, 'items_per_s': items_per_s,
+                    'peak_rss_kb': peak_rss_kb}
+
+        baseline = {'results': [result('export_session', '1MB', 1000, 100),
+                                result('format_tool_result', '1MB', 1000, 100)]}
+        regressions = bench.compare([result('export_session', '1MB', 850, 125),
+                                     result('format_tool_result', '1MB', 950, 105),
+                                     result('export_session', '100MB', 1, 10 ** 6)],
+                                    baseline, 0.1)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(r.startswith('export_session @ 1MB') for r in regressions))
+
+
+if __name__ == '__main__':
+    unittest.main()
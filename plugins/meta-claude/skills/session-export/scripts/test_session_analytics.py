@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Tests for the columnar analytics store (session_analytics.py)."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+from test_session_export import (SCRIPTS_DIR, TempDirTestCase, assistant, tool_result, user,
+                                 write_transcript)
+
+import session_analytics as analytics  # noqa: E402
+
+SESSION_A = '11111111-1111-4111-8111-111111111111'
+SESSION_B = '22222222-2222-4222-8222-222222222222'
+
+
+def usage(input_tokens, output_tokens, cache_read=0):
+    return {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+            'cache_creation_input_tokens': 0, 'cache_read_input_tokens': cache_read}
+
+
+class AnalyticsTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sessions = self.dir / 'projects'
+        # Two entries of one API message repeat its usage; it must count once
+        write_transcript(self.sessions / f'{SESSION_A}.jsonl', [
+            user('go', timestamp='2026-10-01T10:00:00Z'),
+            assistant('a', message_id='m1', usage=usage(100, 10, 50),
+                      timestamp='2026-10-01T10:00:01Z'),
+            assistant('b', 'toolu_1', message_id='m1', usage=usage(100, 10, 50),
+                      timestamp='2026-10-01T10:00:01Z'),
+            tool_result('toolu_1', 'ok', timestamp='2026-10-01T10:00:03Z'),
+            assistant('c', 'toolu_2', tool='Read', message_id='m2', usage=usage(5, 5),
+                      timestamp='2026-10-01T10:00:04Z'),
+            tool_result('toolu_2', 'no such file', is_error=True,
+                        timestamp='2026-10-01T10:00:04.500Z'),
+        ])
+        write_transcript(self.sessions / f'{SESSION_B}.jsonl', [
+            assistant('x', 'toolu_9', message_id='m9', usage=usage(1000, 100),
+                      timestamp='2026-10-02T09:00:00Z'),
+        ])
+        self.store = analytics.Store(self.dir / 'store')
+        self.store.update([str(self.sessions)])
+
+    def test_tokens_count_each_message_once(self):
+        rows = analytics.query_tokens(self.store, by=('session',))
+        totals = {row['session']: (row['messages'], row['input'], row['cache_read'])
+                  for row in rows}
+        self.assertEqual(totals, {SESSION_A: (2, 105, 50), SESSION_B: (1, 1000, 0)})
+
+    def test_model_filter(self):
+        self.assertEqual(analytics.query_tokens(self.store, by=('model',), model='nothing'), [])
+        rows = analytics.query_tokens(self.store, by=('model',), model='opus')
+        self.assertEqual([row['input'] for row in rows], [1105])
+
+    def test_session_filter(self):
+        rows = analytics.query_tokens(self.store, by=('model',), session=SESSION_B)
+        self.assertEqual([row['input'] for row in rows], [1000])
+
+    def test_session_filter_keeps_the_model_filter(self):
+        self.assertEqual(analytics.query_tokens(self.store, by=('model',), session=SESSION_A,
+                                                model='no-such-model'), [])
+        rows = analytics.query_tokens(self.store, by=('model',), session=SESSION_A,
+                                      model='opus')
+        self.assertEqual([row['input'] for row in rows], [105])
+
+    def test_tools_latency_errors_and_unanswered(self):
+        rows = {row['tool']: row for row in analytics.query_tools(self.store)}
+        self.assertEqual((rows['Bash']['calls'], rows['Bash']['unanswered']), (2, 1))
+        self.assertEqual(rows['Bash']['max_ms'], 2000)
+        self.assertEqual((rows['Read']['errors'], rows['Read']['max_ms']), (1, 500))
+        tool_rows = analytics.query_tools(self.store, tool='Read', session=SESSION_A)
+        self.assertEqual([row['tool'] for row in tool_rows], ['Read'])
+
+    def test_rebuild_carries_unchanged_sessions(self):
+        extracted, carried, removed = self.store.update([str(self.sessions)])
+        self.assertEqual((extracted, carried, removed), (0, 2, 0))
+        (self.sessions / f'{SESSION_B}.jsonl').unlink()
+        self.assertEqual(self.store.update([str(self.sessions)])[2], 1)
+        self.assertEqual(self.store.session_names(), [SESSION_A])
+
+    def test_cli_session_filter(self):
+        result = subprocess.run(
+            [sys.executable, str(SCRIPTS_DIR / 'session_analytics.py'),
+             '--store', str(self.dir / 'store'), 'tokens', '--session', SESSION_A, '--json'],
+            capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        rows = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual([row['input'] for row in rows], [105])
+
+
+if __name__ == '__main__':
+    unittest.main()
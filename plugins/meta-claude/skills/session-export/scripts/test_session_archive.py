@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Tests for the deduplicating session archive (session_archive.py)."""
+
+import io
+import threading
+import unittest
+
+from test_session_export import TempDirTestCase, assistant, conversation, write_transcript
+
+import session_archive as archive  # noqa: E402
+import session_export as exporter  # noqa: E402
+
+
+def big_conversation(turns, reply='same long reply\n' * 200):
+    """A conversation ending in a reply large enough to become a chunk."""
+    return conversation(turns) + [assistant(reply, message_id='msg_long')]
+
+
+class ArchiveTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.src = write_transcript(self.dir / 's.jsonl', big_conversation(2))
+        self.raw = self.dir / 'raw'
+
+    def test_restore_matches_the_export_and_rearchiving_is_skipped(self):
+        stats = archive.archive_session(self.src, self.raw / 's.txt')
+        self.assertGreater(stats['new_chunks'], 0)
+        exporter.export_session(self.src, self.dir / 'full.txt')
+        out = io.BytesIO()
+        archive.restore(self.raw / 's.txt.refs', out, verify=True)
+        self.assertEqual(out.getvalue(), (self.dir / 'full.txt').read_bytes())
+        self.assertTrue(archive.archive_session(self.src, self.raw / 's.txt')['up_to_date'])
+
+    def test_chunk_store_path_with_spaces_round_trips(self):
+        chunks = self.dir / 'a b' / 'my chunks'
+        stats = archive.archive_session(self.src, self.dir / 'a b' / 'out' / 's.txt', chunks)
+        self.assertGreater(stats['new_chunks'], 0)
+        exporter.export_session(self.src, self.dir / 'full.txt')
+        out = io.BytesIO()
+        archive.restore(self.dir / 'a b' / 'out' / 's.txt.refs', out, verify=True)
+        self.assertEqual(out.getvalue(), (self.dir / 'full.txt').read_bytes())
+        self.assertTrue(archive.archive_session(self.src, self.dir / 'a b' / 'out' / 's.txt',
+                                                chunks)['up_to_date'])
+
+    def test_shared_blocks_are_stored_once(self):
+        first = archive.archive_session(self.src, self.raw / 's.txt')
+        write_transcript(self.dir / 't.jsonl', big_conversation(3))
+        second = archive.archive_session(self.dir / 't.jsonl', self.raw / 't.txt')
+        self.assertEqual(second['chunks'], first['chunks'])
+        self.assertEqual(second['new_chunks'], 0)
+
+    def test_gc_removes_unreferenced_chunks_but_not_temp_files(self):
+        archive.archive_session(self.src, self.raw / 's.txt')
+        store = archive.ChunkStore(self.raw / archive.CHUNKS_DIR)
+        orphan = store.chunk_path(store.put(b'x' * 2048))
+        in_flight = orphan.with_name(f'{archive.TEMP_PREFIX}123_{orphan.name}')
+        in_flight.write_bytes(b'partial')
+        self.assertEqual(archive.collect_garbage(self.raw), (1, 2048))
+        self.assertFalse(orphan.exists())
+        self.assertTrue(in_flight.exists())
+        out = io.BytesIO()
+        archive.restore(self.raw / 's.txt.refs', out, verify=True)
+
+    def test_gc_waits_for_an_archive_in_progress(self):
+        archive.archive_session(self.src, self.raw / 's.txt')
+        store = archive.ChunkStore(self.raw / archive.CHUNKS_DIR)
+        done = threading.Event()
+        gc = threading.Thread(target=lambda: (archive.collect_garbage(self.raw), done.set()))
+        with store.lock():
+            # Stored by an archive whose refs file is not written yet
+            pending = store.chunk_path(store.put(b'y' * 2048))
+            gc.start()
+            self.assertFalse(done.wait(0.3))
+            self.assertTrue(pending.exists())
+        gc.join(10)
+        self.assertTrue(done.is_set())
+
+    def test_gc_of_a_shared_store_needs_every_archive_directory(self):
+        shared = self.dir / 'shared'
+        other = self.dir / 'other'
+        archive.archive_session(self.src, self.raw / 's.txt', chunks_dir=shared)
+        write_transcript(self.dir / 't.jsonl', big_conversation(1, 'only here\n' * 200))
+        archive.archive_session(self.dir / 't.jsonl', other / 't.txt', chunks_dir=shared)
+
+        with self.assertRaises(archive.ArchiveError) as caught:
+            archive.collect_garbage(self.raw, shared)
+        self.assertIn(str(other), str(caught.exception))
+        self.assertEqual(archive.collect_garbage([self.raw, other], shared), (0, 0))
+        out = io.BytesIO()
+        archive.restore(other / 't.txt.refs', out, verify=True)
+
+    def test_custom_store_without_a_directory_list_is_refused(self):
+        shared = self.dir / 'shared'
+        archive.archive_session(self.src, self.raw / 's.txt', chunks_dir=shared)
+        (shared / archive.ARCHIVES_FILE).unlink()
+        with self.assertRaises(archive.ArchiveError):
+            archive.collect_garbage(self.raw, shared)
+
+
+if __name__ == '__main__':
+    unittest.main()
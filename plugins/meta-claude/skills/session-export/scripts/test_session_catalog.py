@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests for the session catalog (session_catalog.py)."""
+
+import json
+import unittest
+
+from test_session_export import (TempDirTestCase, assistant, conversation, user,
+                                 write_transcript)
+
+import session_catalog as catalog  # noqa: E402
+
+SESSION_A = '11111111-1111-4111-8111-111111111111'
+SESSION_B = '22222222-2222-4222-8222-222222222222'
+
+
+class CatalogTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.dir / 'projects' / '-work-project'
+        self.other = self.dir / 'projects' / '-work-other'
+        write_transcript(self.project / f'{SESSION_A}.jsonl', [
+            user('go', cwd='/work/project', timestamp='2026-10-01T10:00:00Z'),
+            assistant('done', timestamp='2026-10-01T10:00:01Z')])
+        write_transcript(self.other / f'{SESSION_B}.jsonl', [
+            user('go', cwd='/work/other', timestamp='2026-10-02T10:00:00Z')])
+        self.conn = catalog.connect(self.dir / 'catalog.db')
+        self.assertEqual(catalog.update_catalog(self.conn, [str(self.dir / 'projects' / '*')]),
+                         (2, 0, 0, 0))
+
+    def uuids(self, **filters):
+        return [row['uuid'] for row in catalog.query_sessions(self.conn, **filters)]
+
+    def test_filters_match_substrings(self):
+        self.assertEqual(self.uuids(), [SESSION_B, SESSION_A])
+        self.assertEqual(self.uuids(cwd='project'), [SESSION_A])
+        self.assertEqual(self.uuids(model='opus'), [SESSION_A])
+        self.assertEqual(self.uuids(since='2026-10-02'), [SESSION_B])
+
+    def test_appended_transcript_is_scanned_from_where_it_stopped(self):
+        path = self.project / f'{SESSION_A}.jsonl'
+        row = self.conn.execute("SELECT scan_state FROM sessions WHERE uuid = ?",
+                                (SESSION_A,)).fetchone()
+        offset = json.loads(row['scan_state'])['offset']
+        with open(path, 'ab') as f:
+            f.write(json.dumps(user('later', timestamp='2026-10-03T00:00:00Z')).encode() + b'\n')
+        state = catalog.scan_transcript(path, json.loads(row['scan_state']))
+        self.assertEqual(sum(state['entry_counts'].values()), 3)
+        self.assertGreater(state['offset'], offset)
+
+        # A rewritten head starts over instead of resuming
+        write_transcript(path, conversation(1))
+        state = catalog.scan_transcript(path, state)
+        self.assertEqual(sum(state['entry_counts'].values()), 4)
+
+    def test_moved_transcript_keeps_its_row(self):
+        moved = self.dir / 'projects' / '-work-other-wt' / f'{SESSION_B}.jsonl'
+        moved.parent.mkdir()
+        (self.other / f'{SESSION_B}.jsonl').rename(moved)
+        self.assertEqual(catalog.update_catalog(self.conn, [str(self.dir / 'projects' / '*')]),
+                         (0, 1, 1, 0))
+        [row] = catalog.query_sessions(self.conn, cwd='other')
+        self.assertEqual((row['uuid'], row['path']), (SESSION_B, str(moved.resolve())))
+
+    def test_deleted_transcripts_are_dropped(self):
+        (self.other / f'{SESSION_B}.jsonl').unlink()
+        # Updating only the other project still drops the session whose file is gone,
+        # and keeps the one outside the sources that still exists
+        self.assertEqual(catalog.update_catalog(self.conn, [str(self.other)]), (0, 0, 0, 1))
+        self.assertEqual(self.uuids(), [SESSION_A])
+
+    def test_unusable_indexes_are_dropped_on_connect(self):
+        self.conn.execute("CREATE INDEX sessions_model ON sessions(model)")
+        self.conn.commit()
+        self.conn.close()
+        self.conn = catalog.connect(self.dir / 'catalog.db')
+        names = [row['name'] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'sessions_%'")]
+        self.assertEqual(names, ['sessions_last_timestamp'])
+
+
+if __name__ == '__main__':
+    unittest.main()
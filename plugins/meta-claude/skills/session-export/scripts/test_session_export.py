@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+"""
+Tests for the session exporter and the scripts built on it.
+
+Run from this directory:
+
+    python3 -m unittest discover -p 'test_*.py'
+
+Transcripts are built in a temp directory by write_transcript(); the secret
+scanning tests use knowledge-commons' scan_secrets.py from this repository.
+"""
+
+import gzip
+import importlib.util
+import io
+import json
+import os
+import pstats
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import session_export as exporter  # noqa: E402
+
+SCANNER = SCRIPTS_DIR.parents[3] / 'knowledge-commons' / 'scripts' / 'scan_secrets.py'
+MODEL = 'claude-opus-4-5-20251101'
+# Split so the literal in this file is not itself a token shape
+SECRET = 'gh' + 'p_' + 'a' * 30
+
+
+def load_cli():
+    """Import export-session.py, whose name is not a module name."""
+    spec = importlib.util.spec_from_file_location('export_session_cli',
+                                                  SCRIPTS_DIR / 'export-session.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def user(text, **fields):
+    return {'type': 'user', 'message': {'role': 'user', 'content': text},
+            'cwd': '/work/project', 'version': '2.0.0', **fields}
+
+
+def assistant(text, tool_use_id=None, tool='Bash', message_id='msg_1', usage=None, **fields):
+    content = [{'type': 'text', 'text': text}]
+    if tool_use_id:
+        content.append({'type': 'tool_use', 'id': tool_use_id, 'name': tool,
+                        'input': {'command': 'ls'}})
+    message = {'role': 'assistant', 'model': MODEL, 'id': message_id, 'content': content}
+    if usage:
+        message['usage'] = usage
+    return {'type': 'assistant', 'message': message, **fields}
+
+
+def tool_result(tool_use_id, output, is_error=False, **fields):
+    return {'type': 'user', 'message': {'role': 'user', 'content': [
+        {'type': 'tool_result', 'tool_use_id': tool_use_id, 'content': output,
+         'is_error': is_error}]}, **fields}
+
+
+def compact_boundary():
+    return {'type': 'system', 'subtype': 'compact_boundary', 'content': 'Conversation compacted'}
+
+
+def conversation(turns):
+    """A transcript of `turns` prompt / tool call / result / reply rounds."""
+    entries = []
+    for turn in range(turns):
+        tool_use_id = f'toolu_{turn}'
+        entries += [user(f'prompt {turn}'),
+                    assistant(f'running {turn}', tool_use_id, message_id=f'msg_{turn}a'),
+                    tool_result(tool_use_id, f'output {turn}\n' * 3),
+                    assistant(f'done {turn}', message_id=f'msg_{turn}b')]
+    return entries
+
+
+def write_transcript(path, entries, tail=b''):
+    """Write entries as JSONL, then `tail` (e.g. a half-written line)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        for entry in entries:
+            f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        f.write(tail)
+    return path
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.dir = Path(temp.name)
+
+
+class ExportTest(TempDirTestCase):
+
+    def test_export_renders_prompts_tools_and_header(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(2))
+        result = exporter.export_session(src, self.dir / 'out.txt')
+        text = (self.dir / 'out.txt').read_text()
+        self.assertIn('Opus 4.5', text)
+        self.assertIn('> prompt 1', text)
+        self.assertLess(text.index('running 0'), text.index('output 0'))
+        self.assertLess(text.index('output 0'), text.index('done 0'))
+        self.assertEqual(result.unanswered, 0)
+
+    def test_invalid_json_raises_export_error(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1), b'{"type": broken}\n')
+        with self.assertRaises(exporter.ExportError):
+            exporter.export_session(src, self.dir / 'out.txt')
+
+
+class WorkerTest(TempDirTestCase):
+
+    def test_each_request_gets_a_response(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        requests = [{'id': 1, 'session': str(src), 'output': str(self.dir / 'out.txt')},
+                    {'id': 2, 'session': str(self.dir / 'missing.jsonl'),
+                     'output': str(self.dir / 'missing.txt')}]
+        out = io.StringIO()
+        load_cli().Worker().serve(io.StringIO(''.join(json.dumps(r) + '\n' for r in requests)),
+                                  out)
+        responses = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(r['id'], r['ok']) for r in responses], [(1, True), (2, False)])
+        self.assertEqual(responses[0]['result']['outputs'], {'text': str(self.dir / 'out.txt')})
+        self.assertIn('not found', responses[1]['error'])
+
+    def test_index_failure_is_a_response_not_an_exit(self):
+        import session_search
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        requests = [{'id': 1, 'op': 'search', 'query': 'prompt'},
+                    {'id': 2, 'session': str(src), 'output': str(self.dir / 'out.txt')}]
+        out = io.StringIO()
+        with mock.patch.object(session_search, 'connect',
+                               side_effect=session_search.SearchError('no FTS5')):
+            load_cli().Worker().serve(
+                io.StringIO(''.join(json.dumps(r) + '\n' for r in requests)), out)
+        responses = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(r['id'], r['ok']) for r in responses], [(1, False), (2, True)])
+        self.assertIn('no FTS5', responses[0]['error'])
+
+    def test_plain_export_does_not_load_sqlite(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        result = subprocess.run([sys.executable, '-X', 'importtime',
+                                 str(SCRIPTS_DIR / 'export-session.py'), str(src),
+                                 str(self.dir / 'out.txt')], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn('sqlite3', result.stderr)
+
+
+class StreamingTest(TempDirTestCase):
+
+    def test_deferred_header_matches_the_whole_session(self):
+        # What the header shows is only known at the end: the last version and
+        # cwd, and the model that ends up most common
+        entries = conversation(2) + [compact_boundary()]
+        for n in range(5):
+            later = assistant(f'later {n}', message_id=f'msg_l{n}', cwd='/work/moved',
+                              version='2.1.0')
+            later['message']['model'] = 'claude-sonnet-4-5-20250929'
+            entries.append(later)
+        src = write_transcript(self.dir / 's.jsonl', entries)
+        exporter.export_session(src, self.dir / 'out.txt')
+
+        header = exporter.format_header(exporter.extract_session_info(entries))
+        body = '\n'.join(exporter.render_entries(entries))
+        self.assertEqual((self.dir / 'out.txt').read_text(), header + '\n' + body)
+        self.assertIn('Sonnet 4.5', header)
+        self.assertIn('v2.1.0', header)
+        self.assertIn('/work/moved', header)
+        self.assertEqual(sorted(self.dir.iterdir()), [self.dir / 'out.txt', src])
+
+    def peak_memory(self, turns):
+        """Traced peak while exporting `turns` rounds with 2 KB tool results."""
+        entries = conversation(turns)
+        for entry in entries[2::4]:  # the tool results
+            entry['message']['content'][0]['content'] = 'x' * 2000
+        src = write_transcript(self.dir / f'{turns}.jsonl', entries)
+        tracemalloc.start()
+        try:
+            exporter.export_session(src, self.dir / 'out.txt')
+            return tracemalloc.get_traced_memory()[1], src.stat().st_size
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_does_not_grow_with_the_transcript(self):
+        small, small_size = self.peak_memory(1000)
+        large, large_size = self.peak_memory(4000)
+        # Four times the transcript, and a small fraction of its extra size in extra
+        # memory (the output buffers fill up on the first megabyte or so)
+        self.assertLess(large - small, (large_size - small_size) // 20)
+
+
+class BatchTest(TempDirTestCase):
+
+    def test_batch_exports_each_session_once_and_reports_failures(self):
+        good = '11111111-1111-4111-8111-111111111111'
+        bad = '22222222-2222-4222-8222-222222222222'
+        projects = self.dir / 'projects'
+        old_copy = write_transcript(projects / '-work-project' / f'{good}.jsonl', conversation(1))
+        # The same session after a worktree move, newer: this copy wins
+        write_transcript(projects / '-work-project-wt' / f'{good}.jsonl', conversation(2))
+        os.utime(old_copy, (1, 1))
+        write_transcript(projects / '-work-project' / good / 'subagents' / 'agent-a1.jsonl',
+                         conversation(1))
+        write_transcript(projects / '-work-project' / f'{bad}.jsonl', [], b'{broken\n')
+
+        sessions, results = exporter.export_batch(str(projects / '*'), self.dir / 'out',
+                                                  workers=2)
+        self.assertEqual(set(sessions), {good, bad})
+        self.assertEqual(sessions[good].parent.name, '-work-project-wt')
+        self.assertIsInstance(results[bad], exporter.ExportError)
+        self.assertIn('> prompt 1', (self.dir / 'out' / f'{good}.txt').read_text())
+
+
+class SubagentTest(TempDirTestCase):
+
+    def test_subagents_are_spliced_under_their_task_calls(self):
+        src = write_transcript(self.dir / 's.jsonl', [
+            user('delegate'),
+            assistant('spawning', 'toolu_task', tool='Task'),
+            tool_result('toolu_task', 'finished\nagentId: a1'),
+            assistant('after the task', message_id='msg_2')])
+        agents = self.dir / 's' / 'subagents'
+        write_transcript(agents / 'agent-a1.jsonl', [user('subagent prompt')])
+        write_transcript(agents / 'agent-a2.jsonl', [user('orphan prompt')])
+        exporter.export_session(src, self.dir / 'out.txt', subagents=True, workers=1)
+        text = (self.dir / 'out.txt').read_text()
+        order = [text.index(s) for s in ('spawning', '┌', 'subagent prompt', '└',
+                                         'after the task', 'orphan prompt')]
+        self.assertEqual(order, sorted(order))
+
+
+class PairingTest(TempDirTestCase):
+
+    def test_results_answered_out_of_order_follow_their_tool_uses(self):
+        src = write_transcript(self.dir / 's.jsonl', [
+            user('go'),
+            assistant('first', 'toolu_a', message_id='m'),
+            assistant('second', 'toolu_b', message_id='m'),
+            tool_result('toolu_b', 'result b'),
+            assistant('aside', message_id='n'),
+            tool_result('toolu_a', 'result a')])
+        exporter.export_session(src, self.dir / 'out.txt')
+        text = (self.dir / 'out.txt').read_text()
+        order = [text.index(s) for s in ('first', 'result a', 'second', 'result b', 'aside')]
+        self.assertEqual(order, sorted(order))
+
+    def test_unanswered_tool_uses_are_counted(self):
+        src = write_transcript(self.dir / 's.jsonl', [
+            user('go'), assistant('never answered', 'toolu_x'), user('next')])
+        result = exporter.export_session(src, self.dir / 'out.txt')
+        self.assertEqual(result.unanswered, 1)
+        self.assertIn('never got a result', (self.dir / 'out.txt').read_text())
+
+
+class FormatsTest(TempDirTestCase):
+
+    def test_one_pass_writes_every_format(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(2))
+        result = exporter.export_session(src, self.dir / 'out.txt',
+                                         formats=['text', 'markdown', 'html', 'json'])
+        self.assertEqual(set(result.outputs), {'text', 'markdown', 'html', 'json'})
+        exporter.export_session(src, self.dir / 'plain.txt')
+        self.assertEqual((self.dir / 'out.txt').read_bytes(),
+                         (self.dir / 'plain.txt').read_bytes())
+        self.assertIn('prompt 1', (self.dir / 'out.md').read_text())
+        self.assertIn('prompt 1', (self.dir / 'out.html').read_text())
+        events = [json.loads(line) for line in
+                  (self.dir / 'out.events.jsonl').read_text().splitlines()]
+        self.assertTrue(events)
+
+    def test_modes_other_formats_would_drop_are_refused(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        for options in ({'formats': ['text', 'markdown'], 'subagents': True},
+                        {'formats': ['html'], 'stats': exporter.ExportStats()},
+                        {'chunk_tokens': 1000, 'stats': exporter.ExportStats()}):
+            with self.subTest(options=options), self.assertRaises(exporter.ExportError):
+                exporter.export_session(src, self.dir / 'out.txt', **options)
+        self.assertEqual(list(self.dir.glob('out*')), [])
+
+    def test_worker_refuses_subagents_with_other_formats(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        request = {'id': 1, 'session': str(src), 'output': str(self.dir / 'out.txt'),
+                   'formats': ['markdown'], 'subagents': True}
+        out = io.StringIO()
+        load_cli().Worker().serve(io.StringIO(json.dumps(request) + '\n'), out)
+        self.assertFalse(json.loads(out.getvalue())['ok'])
+
+    def test_a_sink_must_render_and_head(self):
+        class Incomplete(exporter.OutputSink):
+            def render(self, line, entry):
+                return []
+
+        with self.assertRaises(TypeError):
+            Incomplete(io.BytesIO())
+
+
+class ChunkedTest(TempDirTestCase):
+
+    def test_chunks_tile_the_export_and_start_at_turns(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(30))
+        exporter.export_session(src, self.dir / 'plain.txt')
+        exporter.export_session(src, self.dir / 'out.txt', chunk_tokens=300)
+        data = (self.dir / 'out.txt').read_bytes()
+        index = json.loads((self.dir / 'out.txt.chunks.json').read_text())
+        chunks = index['chunks']
+        self.assertGreater(len(chunks), 3)
+
+        bodies = []
+        offset, line = 0, 1
+        for number, chunk in enumerate(chunks, 1):
+            self.assertEqual((chunk['offset'], chunk['line']), (offset, line))
+            piece = data[offset:offset + chunk['bytes']]
+            header = exporter.format_chunk_header(index['info'], number, len(chunks),
+                                                  chunk['source_lines']).encode('utf-8')
+            self.assertTrue(piece.startswith(header))
+            bodies.append(piece[len(header):])
+            if number > 1:
+                self.assertEqual(chunk['starts_at'], 'turn')
+                self.assertTrue(bodies[-1].startswith(b'\n> prompt'))
+            offset += chunk['bytes']
+            line += piece.count(b'\n')
+        self.assertEqual(offset, len(data))
+
+        # Without their headers, the chunks are the plain export's body
+        plain = (self.dir / 'plain.txt').read_bytes()
+        header = exporter.format_header(index['info']).encode('utf-8')
+        self.assertEqual(header + b''.join(bodies), plain)
+
+
+class CompressionTest(TempDirTestCase):
+
+    def test_gzip_transcript_and_output_match_a_plain_export(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(2))
+        exporter.export_session(src, self.dir / 'plain.txt')
+        packed = self.dir / 's.jsonl.gz'
+        packed.write_bytes(gzip.compress(src.read_bytes()))
+        result = exporter.export_session(packed, self.dir / 'out.txt.gz', incremental=True)
+        self.assertTrue(result.notes)  # incremental falls back to a full export
+        with gzip.open(self.dir / 'out.txt.gz', 'rb') as f:
+            self.assertEqual(f.read(), (self.dir / 'plain.txt').read_bytes())
+        self.assertFalse((self.dir / 'out.txt.gz.checkpoint.json').exists())
+
+
+class IncrementalTest(TempDirTestCase):
+
+    def full_export(self, src):
+        exporter.export_session(src, self.dir / 'full.txt')
+        return (self.dir / 'full.txt').read_bytes()
+
+    def test_resume_matches_a_full_export(self):
+        entries = conversation(3)
+        src = write_transcript(self.dir / 's.jsonl', entries[:5])
+        out = self.dir / 'out.txt'
+        exporter.export_session(src, out, incremental=True)
+        write_transcript(src, entries)
+        with mock.patch.object(exporter, '_export_full', side_effect=AssertionError('full')):
+            exporter.export_session(src, out, incremental=True)
+        self.assertEqual(out.read_bytes(), self.full_export(src))
+        self.assertTrue(exporter.export_session(src, out, incremental=True).up_to_date)
+
+    def test_half_written_last_line_waits_for_the_next_run(self):
+        entries = conversation(2)
+        line = json.dumps(entries[4]).encode('utf-8') + b'\n'
+        src = write_transcript(self.dir / 's.jsonl', entries[:4], line[:20])
+        out = self.dir / 'out.txt'
+        result = exporter.export_session(src, out, incremental=True)
+        self.assertTrue(result.notes)
+        checkpoint = json.loads((self.dir / 'out.txt.checkpoint.json').read_text())
+        self.assertEqual(checkpoint['source_size'], src.stat().st_size - 20)
+
+        with open(src, 'ab') as f:
+            f.write(line[20:])
+            for entry in entries[5:]:
+                f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        result = exporter.export_session(src, out, incremental=True)
+        self.assertFalse(result.up_to_date)
+        self.assertEqual(out.read_bytes(), self.full_export(src))
+
+
+class ParallelTest(TempDirTestCase):
+
+    def test_jobs_output_matches_a_serial_export(self):
+        entries = conversation(40)
+        # Calls left open across chunk boundaries, answered many lines later
+        entries[10:10] = [assistant('late', 'toolu_late', message_id='msg_late')]
+        entries += [tool_result('toolu_late', 'answered late'), user('bye')]
+        src = write_transcript(self.dir / 's.jsonl', entries)
+        exporter.export_session(src, self.dir / 'serial.txt')
+        size = src.stat().st_size
+        with mock.patch.multiple(exporter, PARALLEL_MIN_BYTES=1, PARALLEL_CHUNK_BYTES=size // 6), \
+                mock.patch.object(exporter, '_export_parallel',
+                                  wraps=exporter._export_parallel) as parallel:
+            result = exporter.export_session(src, self.dir / 'parallel.txt', jobs=3)
+        parallel.assert_called_once()
+        self.assertEqual((self.dir / 'parallel.txt').read_bytes(),
+                         (self.dir / 'serial.txt').read_bytes())
+        self.assertEqual(result.unanswered, 0)
+
+    def test_invalid_line_is_reported_by_its_line_in_the_whole_file(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(20), b'{broken\n')
+        size = src.stat().st_size
+        with mock.patch.multiple(exporter, PARALLEL_MIN_BYTES=1, PARALLEL_CHUNK_BYTES=size // 4):
+            with self.assertRaisesRegex(exporter.ExportError, 'line 81'):
+                exporter.export_session(src, self.dir / 'out.txt', jobs=2)
+
+
+class FollowTest(TempDirTestCase):
+
+    def test_follow_leaves_signal_handlers_alone_and_compresses(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        before = signal.getsignal(signal.SIGTERM)
+        # The first poll ends the follow, as Ctrl-C would
+        with mock.patch.object(exporter.time, 'sleep', side_effect=KeyboardInterrupt):
+            exporter.follow_session(src, self.dir / 'out.txt.gz')
+        self.assertIs(signal.getsignal(signal.SIGTERM), before)
+        with gzip.open(self.dir / 'out.txt.gz', 'rt') as f:
+            self.assertIn('> prompt 0', f.read())
+
+    def test_appended_lines_are_rendered_once_complete(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 1:  # a tool call, and the next line half-written
+                with open(src, 'ab') as f:
+                    f.write(json.dumps(assistant('waiting', 'toolu_w')).encode() + b'\n')
+                    f.write(b'{"type": "user", "message": {"role": "user", ')
+            elif len(polls) == 2:
+                with open(src, 'ab') as f:
+                    f.write(b'"content": "finished later"}}\n')
+            else:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(exporter.time, 'sleep', side_effect=sleep):
+            with mock.patch.object(sys, 'stderr', io.StringIO()) as err:
+                exporter.follow_session(src, self.dir / 'out.txt')
+        text = (self.dir / 'out.txt').read_text()
+        self.assertLess(text.index('> prompt 0'), text.index('waiting'))
+        self.assertLess(text.index('waiting'), text.index('> finished later'))
+        self.assertIn('never got a result', text)
+        self.assertNotIn('Skipping', err.getvalue())
+
+    def test_moved_transcript_is_followed_at_the_same_offset(self):
+        uuid = '11111111-1111-4111-8111-111111111111'
+        src = write_transcript(self.dir / 'projects' / '-work-project' / f'{uuid}.jsonl',
+                               conversation(1))
+        follower = exporter.TranscriptFollower(src)
+        self.addCleanup(follower.close)
+        self.assertEqual(len(list(follower.lines())), 4)
+        moved = self.dir / 'projects' / '-work-project-wt' / f'{uuid}.jsonl'
+        moved.parent.mkdir()
+        src.rename(moved)
+        with open(moved, 'ab') as f:
+            f.write(json.dumps(user('after the move')).encode() + b'\n')
+        self.assertEqual(follower.check(), (f'following {moved}', False))
+        self.assertEqual([json.loads(line)['message']['content'] for line in follower.lines()],
+                         ['after the move'])
+
+    def test_rewritten_transcript_starts_a_new_section(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(2))
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 1:  # rewritten in place, shorter than what was read
+                write_transcript(src, [user('fresh start'), assistant('waiting', 'toolu_new')])
+            elif len(polls) == 3:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(exporter.time, 'sleep', side_effect=sleep):
+            exporter.follow_session(src, self.dir / 'out.txt')
+        text = (self.dir / 'out.txt').read_text()
+        self.assertEqual(text.count('> prompt 1'), 1)
+        self.assertLess(text.index('> prompt 1'), text.index('Transcript rewritten'))
+        self.assertLess(text.index('Transcript rewritten'), text.index('> fresh start'))
+        self.assertEqual(text.count('never got a result'), 1)
+
+    def test_cli_stops_on_sigterm(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPTS_DIR / 'export-session.py'), '--follow', '--poll', '0.05',
+             str(src), str(self.dir / 'out.txt')],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        self.assertIn('Following', process.stderr.readline())
+        with open(src, 'ab') as f:
+            f.write(json.dumps(user('appended later')).encode('utf-8') + b'\n')
+        deadline = time.monotonic() + 10
+        while b'appended later' not in (self.dir / 'out.txt').read_bytes():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        process.terminate()
+        self.assertIn('Stopped following', process.communicate(timeout=10)[1])
+        self.assertEqual(process.returncode, 0)
+
+
+@unittest.skipUnless(SCANNER.exists(), "knowledge-commons scan_secrets.py not found")
+class SecretScanTest(TempDirTestCase):
+
+    def test_secret_blocks_the_export(self):
+        src = write_transcript(self.dir / 's.jsonl', [user(f'my token is {SECRET}')])
+        with self.assertRaises(exporter.SecretsFound) as caught:
+            exporter.export_session(src, self.dir / 'out.txt', scan_secrets=SCANNER)
+        self.assertTrue(caught.exception.findings)
+        self.assertFalse((self.dir / 'out.txt').exists())
+
+    def test_clean_export_is_written(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        result = exporter.export_session(src, self.dir / 'out.txt', scan_secrets=SCANNER)
+        self.assertTrue(result.secret_scan)
+        self.assertTrue((self.dir / 'out.txt').exists())
+
+    def test_scanner_that_cannot_load_fails_with_exit_code_2(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(1))
+        with self.assertRaises(exporter.ExportError) as caught:
+            exporter.export_session(src, self.dir / 'out.txt',
+                                    scan_secrets=self.dir / 'scan_secrets.py')
+        self.assertEqual(caught.exception.exit_code, 2)
+        self.assertFalse((self.dir / 'out.txt').exists())
+
+    def test_other_formats_are_refused_rather_than_written_unscanned(self):
+        src = write_transcript(self.dir / 's.jsonl', [user(f'my token is {SECRET}')])
+        with self.assertRaises(exporter.ExportError):
+            exporter.export_session(src, self.dir / 'out.txt', formats=['text', 'markdown'],
+                                    scan_secrets=SCANNER)
+        self.assertEqual(list(self.dir.glob('out*')), [])
+
+    def test_worker_refuses_other_formats_with_a_scan(self):
+        src = write_transcript(self.dir / 's.jsonl', [user(f'my token is {SECRET}')])
+        request = {'id': 1, 'session': str(src), 'output': str(self.dir / 'out.txt'),
+                   'formats': ['text', 'markdown'], 'scan_secrets': str(SCANNER)}
+        out = io.StringIO()
+        load_cli().Worker().serve(io.StringIO(json.dumps(request) + '\n'), out)
+        response = json.loads(out.getvalue())
+        self.assertFalse(response['ok'])
+        self.assertEqual(list(self.dir.glob('out*')), [])
+
+
+class DecodeTest(TempDirTestCase):
+
+    LINES = [b'{"type": "user", "text": "caf\\u00e9 \\ud83d\\ude00", "n": null}',
+             # orjson rejects these and json accepts them
+             b'{"text": "lone \\ud800 surrogate"}',
+             b'{"x": NaN, "y": -Infinity, "z": 1e400}',
+             b'{"a": 1, "a": 2, "f": 0.1, "e": 12.5e-3, "list": [true, false, -7]}',
+             # orjson rounds integers beyond 64 bits to floats
+             b'{"big": 100000000000000000000, "low": -9223372036854775809}']
+
+    def test_orjson_and_the_fallback_decode_as_json_does(self):
+        for line in self.LINES:
+            expected = repr(json.loads(line))  # repr: nan is not equal to itself
+            with self.subTest(line=line):
+                self.assertEqual(repr(exporter.decode_entry(line)), expected)
+                with mock.patch.object(exporter, 'orjson', None):
+                    self.assertEqual(repr(exporter.decode_entry(line)), expected)
+        for backend in (exporter.orjson, None):
+            with mock.patch.object(exporter, 'orjson', backend), self.assertRaises(ValueError):
+                exporter.decode_entry(b'{"type": broken}')
+
+    def test_export_is_the_same_without_orjson(self):
+        entries = conversation(2) + [json.loads(line) for line in self.LINES]
+        src = write_transcript(self.dir / 's.jsonl', entries)
+        exporter.export_session(src, self.dir / 'out.txt')
+        with mock.patch.object(exporter, 'orjson', None):
+            exporter.export_session(src, self.dir / 'json.txt')
+        self.assertEqual((self.dir / 'out.txt').read_bytes(), (self.dir / 'json.txt').read_bytes())
+
+    def test_collapsed_results_count_lines_as_splitting_them_would(self):
+        rng = random.Random(4)
+        for case in range(300):
+            alphabet = 'ab →\t\n' if case % 3 else 'ab \t\n'
+            content = ''.join(rng.choice(alphabet) for _ in range(rng.randint(2001, 2600)))
+            # The list-based count this replaced
+            lines = content.split('\n')
+            numbered = [line for line in lines if line.strip() and '→' in line[:10]]
+            expected = f"  Read {len(numbered)} lines" if numbered else f"  ({len(lines)} lines)"
+            self.assertEqual(exporter.format_tool_result(content), expected)
+
+
+class StatsTest(TempDirTestCase):
+
+    def test_stats_measure_the_export_without_changing_it(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(3) + [compact_boundary()])
+        exporter.export_session(src, self.dir / 'plain.txt')
+        stats = exporter.ExportStats()
+        exporter.export_session(src, self.dir / 'out.txt', stats=stats)
+        out = self.dir / 'out.txt'
+        self.assertEqual(out.read_bytes(), (self.dir / 'plain.txt').read_bytes())
+        self.assertEqual((stats.bytes_in, stats.bytes_out), (src.stat().st_size, out.stat().st_size))
+        self.assertEqual({name: count for name, (count, _) in stats.entry_types.items()},
+                         {'user': 6, 'assistant': 6, 'system/compact_boundary': 1})
+        self.assertEqual(stats.tools['Bash'][0], 3)
+        # The phases are disjoint parts of the export
+        self.assertTrue(all(stats.wall.values()))
+        self.assertLessEqual(sum(stats.wall.values()), stats.total_wall)
+
+    def test_cli_reports_stats_and_writes_a_profile(self):
+        src = write_transcript(self.dir / 's.jsonl', conversation(2))
+        profile = self.dir / 'export.prof'
+        result = subprocess.run(
+            [sys.executable, str(SCRIPTS_DIR / 'export-session.py'), '--stats', '--tracemalloc',
+             '--profile', str(profile), str(src), str(self.dir / 'out.txt')],
+            capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = result.stdout[result.stdout.index('Export stats'):]
+        for phase in exporter.ExportStats.PHASES:
+            self.assertIn(f'  {phase} ', report)
+        self.assertIn('peak traced allocations', report)
+        self.assertIn('Bash', report)
+        self.assertTrue(pstats.Stats(str(profile)).total_calls)
+
+
+class FormatterTest(unittest.TestCase):
+
+    @staticmethod
+    def random_text(rng, length, alphabet='ab \n'):
+        return ''.join(rng.choice(alphabet) for _ in range(length))
+
+    def test_line_helpers_match_splitting(self):
+        rng = random.Random(12)
+        for _ in range(300):
+            text = self.random_text(rng, rng.randint(0, 40))
+            lines = text.split('\n')
+            self.assertEqual(exporter.count_lines(text), len(lines))
+            for n in range(7):
+                self.assertEqual(exporter.head_lines(text, n), lines[:n])
+
+    def test_edit_diff_matches_the_list_based_diff(self):
+        def expected(old_string, new_string, max_lines):
+            # The list-based diff this replaced
+            max_lines = max(max_lines, 2)
+            old_lines = old_string.split('\n') if old_string else []
+            new_lines = new_string.split('\n') if new_string else []
+            shown = max_lines // 2
+            diff = [f"-{line}" for line in old_lines[:shown]]
+            if len(old_lines) > shown:
+                diff.append(f"  ... ({len(old_lines) - shown} more removed)")
+            diff += [f"+{line}" for line in new_lines[:shown]]
+            if len(new_lines) > shown:
+                diff.append(f"  ... ({len(new_lines) - shown} more added)")
+            return diff, len(new_lines), len(old_lines)
+
+        rng = random.Random(12)
+        for _ in range(300):
+            old, new = (self.random_text(rng, rng.randint(0, 60)) for _ in 'on')
+            max_lines = rng.randint(0, 8)
+            self.assertEqual(exporter.generate_edit_diff(old, new, max_lines),
+                             expected(old, new, max_lines))
+
+    def test_medium_results_match_the_list_based_truncation(self):
+        rng = random.Random(12)
+        for _ in range(300):
+            # Mostly many short lines, and some with ten lines or fewer
+            alphabet = 'ab \n' if rng.random() < 0.5 else 'a' * 200 + '\n'
+            content = self.random_text(rng, rng.randint(501, 2000), alphabet)
+            lines = content.split('\n')
+            if len(lines) > 10:
+                expected = '\n'.join(['  ' + line for line in lines[:5]]
+                                     + [f"    ... ({len(lines) - 5} more lines)"])
+            else:
+                expected = '  ' + content[:500] + "..."
+            self.assertEqual(exporter.format_tool_result(content), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Tests for the full-text search index (session_search.py)."""
+
+import json
+import unittest
+from unittest import mock
+
+from test_session_export import TempDirTestCase, assistant, user, write_transcript
+
+import session_search as search  # noqa: E402
+
+SESSION_A = '11111111-1111-4111-8111-111111111111'
+SESSION_B = '22222222-2222-4222-8222-222222222222'
+
+
+class SearchTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sessions = self.dir / 'projects'
+        self.path_a = write_transcript(self.sessions / f'{SESSION_A}.jsonl', [
+            user('why does ModuleNotFoundError happen'),
+            assistant('the venv is not active', 'toolu_1')])
+        write_transcript(self.sessions / f'{SESSION_B}.jsonl', [
+            user('unrelated question'), assistant('an answer mentioning the venv')])
+        self.conn = search.connect(self.dir / 'search.db')
+        self.assertEqual(search.update_index(self.conn, [str(self.sessions)])[:2], (2, 5))
+
+    def hits(self, query, **filters):
+        return [(hit['uuid'], hit['line'], hit['kind'])
+                for hit in search.search(self.conn, query, **filters)]
+
+    def test_phrase_hits_point_at_their_transcript_line(self):
+        self.assertEqual(self.hits('ModuleNotFoundError happen'), [(SESSION_A, 1, 'user')])
+        self.assertEqual(self.hits('happen ModuleNotFoundError'), [])
+        self.assertEqual(self.hits('happen AND ModuleNotFoundError', raw=True),
+                         [(SESSION_A, 1, 'user')])
+        self.assertEqual(len(self.hits('venv')), 2)
+        self.assertEqual(self.hits('venv', session=SESSION_B), [(SESSION_B, 2, 'assistant')])
+        self.assertEqual(self.hits('Bash', kind='tool', tool='Bash'), [(SESSION_A, 2, 'tool')])
+
+    def test_appended_entries_are_indexed_without_duplicates(self):
+        with open(self.path_a, 'ab') as f:
+            f.write(json.dumps(user('a later ModuleNotFoundError')).encode() + b'\n')
+            f.write(b'{"type": "user", "message"')  # still being written
+        self.assertEqual(search.update_index(self.conn, [str(self.sessions)]), (1, 1, 1, 0))
+        self.assertEqual(sorted(line for _, line, _ in self.hits('ModuleNotFoundError')), [1, 3])
+
+        # A rewritten transcript is indexed afresh
+        write_transcript(self.path_a, [user('something else entirely')])
+        search.update_index(self.conn, [str(self.sessions)])
+        self.assertEqual(self.hits('ModuleNotFoundError'), [])
+
+    def test_deleted_transcripts_are_dropped(self):
+        self.path_a.unlink()
+        self.assertEqual(search.update_index(self.conn, [str(self.sessions)])[3], 1)
+        self.assertEqual(self.hits('ModuleNotFoundError'), [])
+        self.assertEqual(len(self.hits('venv')), 1)
+
+    def test_blocks_are_inserted_in_batches(self):
+        entries = [user(f'prompt number {n}') for n in range(7)]
+        write_transcript(self.sessions / f'{SESSION_A}.jsonl', entries)
+        with mock.patch.object(search, 'INSERT_BATCH_ROWS', 2), \
+                mock.patch.object(search, '_insert_blocks', wraps=search._insert_blocks) as insert:
+            self.assertEqual(search.update_index(self.conn, [str(self.sessions)])[:2], (1, 7))
+        self.assertEqual(insert.call_count, 4)
+        self.assertEqual(len(self.hits('prompt number')), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()